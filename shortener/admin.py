@@ -1,3 +1,38 @@
 from django.contrib import admin
 
-# Register your models here.
+from .cache import invalidate_link
+from .leaderboard import leaderboards
+from .models import Link
+from .purge import soft_delete_links
+
+
+@admin.register(Link)
+class LinkAdmin(admin.ModelAdmin):
+    list_display = ['slug', 'url', 'user', 'redirect_mode', 'expires_at', 'created_at']
+    list_select_related = ['user']
+    search_fields = ['=slug']
+    raw_id_fields = ['user']
+    readonly_fields = ['slug']
+    show_full_result_count = False
+
+    def changelist_view(self, request, extra_context=None):
+        """Show the global leaderboards above the list."""
+        extra_context = {**(extra_context or {}), 'leaderboards': leaderboards()}
+        return super().changelist_view(request, extra_context)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Redirects are served from the slug cache, which must not outlive an edit
+        invalidate_link(obj.slug)
+
+    # Deleting through the cascade would delete every click in the request
+    def get_deleted_objects(self, objs, request):
+        """List only the links, instead of collecting their clicks for the confirmation page."""
+        objs = list(objs)
+        return [str(obj) for obj in objs], {Link._meta.verbose_name_plural: len(objs)}, set(), []
+
+    def delete_model(self, request, obj):
+        soft_delete_links(Link.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        soft_delete_links(queryset)
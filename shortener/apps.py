@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
 
 
 class ShortenerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shortener'
+
+    def ready(self):
+        from . import metrics
+
+        if settings.METRICS_ENABLED:
+            connection_created.connect(metrics.install_query_recorder)
+            metrics.start_flusher()
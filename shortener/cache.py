@@ -0,0 +1,286 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+import redis
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, router
+
+from .models import Link
+from .redis_client import get_async_redis, get_redis
+from .routers import replica_reads
+from .slugfilter import add_slugs, is_valid_slug, parse_contains, queue_contains
+
+logger = logging.getLogger(__name__)
+
+
+class CachedLink(NamedTuple):
+    """The part of a link needed to redirect and record a click."""
+
+    id: int
+    url: str
+    redirect_mode: str = Link.RedirectMode.TEMPORARY
+    cache_max_age: int = 0
+
+
+# Columns loaded into a CachedLink
+FIELDS = ('id', 'url', 'redirect_mode', 'cache_max_age')
+
+
+class LocalLRU:
+    """Bounded in-process LRU cache whose entries expire after `timeout` seconds."""
+
+    def __init__(self, maxsize: int, timeout: float):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+local_cache = LocalLRU(settings.LINK_CACHE_LOCAL_SIZE, settings.LINK_CACHE_LOCAL_TIMEOUT)
+# Slugs recently not found, so repeated misses skip the shared tier and the database
+miss_cache = LocalLRU(settings.SLUG_MISS_CACHE_SIZE, settings.SLUG_MISS_CACHE_TIMEOUT)
+
+# Counters are per process and only approximate under threads, which is enough to
+# see how much lookup traffic the cache keeps away from the database.
+_stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'rejected': 0}
+
+
+def cache_key(slug: str) -> str:
+    return f'slug:{slug}'
+
+
+def get_cache_stats() -> dict[str, int]:
+    """Return hit/miss counters of the slug cache in this process."""
+    return dict(_stats)
+
+
+def reset_cache_stats() -> None:
+    for name in _stats:
+        _stats[name] = 0
+
+
+def encode(link: CachedLink) -> bytes:
+    # URLs cannot contain whitespace, so a newline separates the fields; the URL goes last
+    return f'{link.id}\n{link.redirect_mode}\n{link.cache_max_age}\n{link.url}'.encode()
+
+
+def decode(value: bytes) -> CachedLink:
+    link_id, redirect_mode, cache_max_age, url = value.decode().split('\n', 3)
+    return CachedLink(int(link_id), url, redirect_mode, int(cache_max_age))
+
+
+def _load_link(slug: str, alias: str) -> CachedLink | None:
+    try:
+        return CachedLink(*Link.objects.using(alias).values_list(*FIELDS).get(slug=slug))
+    except Link.DoesNotExist:
+        return None
+
+
+async def _aload_link(slug: str, alias: str) -> CachedLink | None:
+    try:
+        return CachedLink(*await Link.objects.using(alias).values_list(*FIELDS).aget(slug=slug))
+    except Link.DoesNotExist:
+        return None
+
+
+def _read_alias() -> str:
+    with replica_reads():
+        return router.db_for_read(Link)
+
+
+def load_link(slug: str) -> tuple[CachedLink | None, str]:
+    """Fetch the redirect target of a slug from the replica, if any, else the primary.
+
+    A slug missing from the replica is looked up again on the primary, which has links
+    created within the replication lag. Return the link and the alias it was read from.
+    """
+    alias = _read_alias()
+    link = _load_link(slug, alias)
+    if link is None and alias != DEFAULT_DB_ALIAS:
+        alias = DEFAULT_DB_ALIAS
+        link = _load_link(slug, alias)
+    return link, alias
+
+
+async def aload_link(slug: str) -> tuple[CachedLink | None, str]:
+    alias = _read_alias()
+    link = await _aload_link(slug, alias)
+    if link is None and alias != DEFAULT_DB_ALIAS:
+        alias = DEFAULT_DB_ALIAS
+        link = await _aload_link(slug, alias)
+    return link, alias
+
+
+def shared_timeout(alias: str) -> int:
+    """Lifetime in the shared tier of a link read from `alias`.
+
+    A lagging replica can still return a link deleted on the primary after its deletion
+    invalidated the caches, so links read from it expire soon instead of after a day.
+    """
+    return settings.LINK_CACHE_TIMEOUT if alias == DEFAULT_DB_ALIAS else settings.LINK_CACHE_REPLICA_TIMEOUT
+
+
+# Returned by the helpers below when the lookup must go on to the next tier
+_NOT_CACHED = object()
+
+
+def _lookup_local(slug: str):
+    """Resolve a slug in this process: to None if malformed or a recent miss, to its cached link, or to _NOT_CACHED."""
+    if not is_valid_slug(slug):
+        _stats['rejected'] += 1
+        return None
+    if not settings.LINK_CACHE_ENABLED:
+        return _NOT_CACHED
+    cached = local_cache.get(cache_key(slug))
+    if cached is not None:
+        _stats['local_hits'] += 1
+        return cached
+    if miss_cache.get(slug):
+        _stats['rejected'] += 1
+        return None
+    return _NOT_CACHED
+
+
+def _queue_shared(pipe, slug: str) -> None:
+    """Queue the shared tier lookups of a slug, read back by `_read_shared`."""
+    pipe.get(cache_key(slug))
+    if settings.SLUG_FILTER_ENABLED:
+        queue_contains(pipe, slug)
+
+
+def _read_shared(slug: str, results: list):
+    """Resolve a slug from the shared tier: to its link, to None if ruled out by the slug filter, or to _NOT_CACHED."""
+    shared, *membership = results
+    if shared is not None:
+        _stats['shared_hits'] += 1
+        cached = decode(shared)
+        local_cache.set(cache_key(slug), cached)
+        return cached
+    if membership and not parse_contains(*membership):
+        _stats['rejected'] += 1
+        miss_cache.set(slug, True)
+        return None
+    return _NOT_CACHED
+
+
+def _remember(slug: str, cached: CachedLink | None) -> bytes | None:
+    """Cache a link loaded from the database, or its absence, and return the value for the shared tier."""
+    if cached is None:
+        miss_cache.set(slug, True)
+        return None
+    local_cache.set(cache_key(slug), cached)
+    return encode(cached)
+
+
+def lookup_link(slug: str) -> CachedLink | None:
+    """Resolve a slug through the in-process LRU, the shared cache, then the database.
+
+    Malformed slugs, recent misses and slugs ruled out by the slug filter resolve to
+    None without a database query.
+    """
+    cached = _lookup_local(slug)
+    if cached is not _NOT_CACHED:
+        return cached
+    if not settings.LINK_CACHE_ENABLED:
+        return load_link(slug)[0]
+
+    client = get_redis()
+    if client is not None:
+        try:
+            with client.pipeline(transaction=False) as pipe:
+                _queue_shared(pipe, slug)
+                cached = _read_shared(slug, pipe.execute())
+        except redis.RedisError:  # A broken shared tier should only cost a database query
+            logger.warning('Shared slug cache unavailable.', exc_info=True)
+        if cached is not _NOT_CACHED:
+            return cached
+
+    _stats['misses'] += 1
+    cached, alias = load_link(slug)
+    value = _remember(slug, cached)
+    if value is not None and client is not None:
+        try:
+            client.set(cache_key(slug), value, ex=shared_timeout(alias))
+        except redis.RedisError:
+            logger.warning('Shared slug cache unavailable.', exc_info=True)
+    return cached
+
+
+async def alookup_link(slug: str) -> CachedLink | None:
+    """Async version of `lookup_link` for the ASGI redirect view."""
+    cached = _lookup_local(slug)
+    if cached is not _NOT_CACHED:
+        return cached
+    if not settings.LINK_CACHE_ENABLED:
+        return (await aload_link(slug))[0]
+
+    client = get_async_redis()
+    if client is not None:
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                _queue_shared(pipe, slug)
+                cached = _read_shared(slug, await pipe.execute())
+        except redis.RedisError:
+            logger.warning('Shared slug cache unavailable.', exc_info=True)
+        if cached is not _NOT_CACHED:
+            return cached
+
+    _stats['misses'] += 1
+    cached, alias = await aload_link(slug)
+    value = _remember(slug, cached)
+    if value is not None and client is not None:
+        try:
+            await client.set(cache_key(slug), value, ex=shared_timeout(alias))
+        except redis.RedisError:
+            logger.warning('Shared slug cache unavailable.', exc_info=True)
+    return cached
+
+
+def invalidate_link(slug: str) -> None:
+    """Drop a slug from both cache tiers, e.g. after its link is deleted."""
+    key = cache_key(slug)
+    local_cache.delete(key)
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.delete(key)
+    except redis.RedisError:
+        logger.warning('Failed to invalidate slug %s in shared cache.', slug, exc_info=True)
+
+
+def register_new_slugs(slugs: list[str]) -> None:
+    """Make new slugs resolvable: forget cached misses here and add them to the slug filter."""
+    for slug in slugs:
+        miss_cache.delete(slug)
+    add_slugs(slugs)
@@ -0,0 +1,266 @@
+"""Hand clicks off from redirects without waiting on Redis.
+
+Redirects put clicks on a bounded in-process queue. A background thread appends them to
+the click stream in batches; when Redis fails, it appends them to a local spool file
+instead, and replays spooled clicks once Redis is back. A full queue either drops new
+clicks or hands them to the thread to spool, as set by CLICK_QUEUE_FULL_POLICY; redirects
+never touch the spool files themselves.
+"""
+
+import atexit
+import fcntl
+import json
+import logging
+import os
+import queue
+import shutil
+import socket
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import redis
+from django.conf import settings
+
+from .metrics import CLICK_HANDOFF
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+SPOOL_SUFFIX = '.spool'
+CLAIMED_SUFFIX = '.replaying'
+# A claimed file this old belongs to a replay that died, and is claimed again
+STALE_CLAIM = 10 * 60
+
+
+class Spool:
+    """Append-only JSON-lines files of stream entries, one per process, replayed by any process."""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.path = self.directory / f'clicks-{socket.gethostname()}-{os.getpid()}{SPOOL_SUFFIX}'
+        self._lock = threading.Lock()
+
+    def append(self, entries: list[dict]) -> None:
+        data = ''.join(json.dumps(entry) + '\n' for entry in entries).encode()
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            while True:
+                with open(self.path, 'ab') as file:
+                    fcntl.flock(file, fcntl.LOCK_EX)
+                    # A replay may have claimed the file between open and lock; write to a new one
+                    if os.fstat(file.fileno()).st_nlink:
+                        file.write(data)
+                        return
+
+    def _pending(self) -> list[Path]:
+        stale = time.time() - STALE_CLAIM
+        claimed = [path for path in self.directory.glob(f'*{CLAIMED_SUFFIX}') if path.stat().st_mtime < stale]
+        return claimed + sorted(self.directory.glob(f'*{SPOOL_SUFFIX}'))
+
+    def replay(self, client: redis.Redis, batch_size: int) -> int:
+        """Append the clicks of all spool files to the stream and delete the files.
+
+        Files are read line by line. If Redis fails, only the lines not yet appended are
+        spooled again; the batch in flight may still be stored twice.
+        """
+        replayed = 0
+        for path in self._pending():
+            name = path.name.removesuffix(SPOOL_SUFFIX).removesuffix(CLAIMED_SUFFIX)
+            claimed = path.with_name(f'{name}-{os.getpid()}-{time.time_ns()}{CLAIMED_SUFFIX}')
+            try:
+                path.rename(claimed)  # Only one process wins; writers start a new file
+            except FileNotFoundError:
+                continue
+            os.utime(claimed)  # Fresh, so that it is not taken for a stale claim
+            with open(claimed, 'rb') as file:
+                # Waits for a write in progress, and is held until the file is gone so that a
+                # writer that opened it before the rename moves on to a new file
+                fcntl.flock(file, fcntl.LOCK_EX)
+                sent = 0
+                try:
+                    for entries, end in _read_batches(file, batch_size):
+                        _xadd(client, entries)
+                        replayed += len(entries)
+                        sent = end
+                except redis.RedisError:
+                    file.seek(sent)
+                    self._respool(file, name)
+                    claimed.unlink()
+                    raise
+                claimed.unlink()
+        return replayed
+
+    def _respool(self, file, name: str) -> None:
+        """Copy the rest of `file` to a new spool file, complete before it can be claimed."""
+        partial = self.directory / f'{name}-{time.time_ns()}.partial'
+        with open(partial, 'wb') as tail:
+            shutil.copyfileobj(file, tail)
+        partial.rename(partial.with_suffix(SPOOL_SUFFIX))
+
+    def has_files(self) -> bool:
+        return self.directory.is_dir() and any(self.directory.glob(f'*{SPOOL_SUFFIX}'))
+
+
+def _read_batches(file, batch_size: int):
+    """Yield lists of up to `batch_size` entries of a spool file, with the offset after each list."""
+    entries, offset = [], 0
+    for line in file:
+        offset += len(line)
+        if not line.strip():
+            continue
+        try:
+            entries.append(json.loads(line))
+        except ValueError:  # Cut short by a crash mid-write
+            logger.warning('Skipped malformed spooled click %r.', line)
+        if len(entries) == batch_size:
+            yield entries, offset
+            entries = []
+    if entries:
+        yield entries, offset
+
+
+def stream_fields(link_id: int, ip: str, clicked_at: datetime) -> dict:
+    return {'l': link_id, 'i': ip, 't': f'{clicked_at.timestamp():.6f}'}
+
+
+def _xadd(client: redis.Redis, entries: list[dict]) -> None:
+    with client.pipeline(transaction=False) as pipe:
+        for entry in entries:
+            # Uncapped: trimming would drop clicks no consumer has read. Flushed entries are deleted,
+            # so the stream only grows while `flush_clicks` is down, visible as its length and lag metrics.
+            pipe.xadd(settings.CLICK_STREAM, entry)
+        pipe.execute()
+
+
+def _drain(entries: queue.Queue) -> list[dict]:
+    drained = []
+    while True:
+        try:
+            drained.append(entries.get_nowait())
+        except queue.Empty:
+            return drained
+
+
+class ClickQueue:
+    """Bounded queue of stream entries drained by a publisher thread."""
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=settings.CLICK_QUEUE_SIZE)
+        # Entries the full queue turned away, spooled by the publisher thread
+        self.overflow = queue.Queue(maxsize=settings.CLICK_QUEUE_SIZE)
+        self.spool = Spool(settings.CLICK_SPOOL_DIR)
+        self.retry_at = 0.0  # Publishing is skipped until then after a Redis failure
+        self.in_flight: list[dict] = []  # Taken off the queue by the thread, not yet published or spooled
+        self._stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='click-publisher', daemon=True)
+        self.thread.start()
+
+    def put(self, entry: dict) -> None:
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            if settings.CLICK_QUEUE_FULL_POLICY == 'spool':
+                try:
+                    self.overflow.put_nowait(entry)
+                    return
+                except queue.Full:
+                    pass
+            CLICK_HANDOFF.inc('dropped')
+
+    def _take(self, timeout: float) -> list[dict]:
+        try:
+            entries = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(entries) < settings.CLICK_PUBLISH_BATCH_SIZE:
+            try:
+                entries.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return [entry for entry in entries if entry is not None]  # None only wakes the thread to stop
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self.in_flight = self._take(timeout=settings.CLICK_RETRY_INTERVAL)
+            try:
+                if overflow := _drain(self.overflow):
+                    self._spool(overflow)
+                self.publish(self.in_flight)
+            except Exception:  # The thread must survive anything a batch raises
+                logger.exception('Click publisher failed.')
+            self.in_flight = []
+
+    def publish(self, entries: list[dict]) -> None:
+        """Append entries to the stream, then replay the spool; spool them if Redis fails."""
+        if time.monotonic() < self.retry_at:
+            if entries:
+                self._spool(entries)
+            return
+        client = get_redis()
+        try:
+            if entries:
+                _xadd(client, entries)
+                CLICK_HANDOFF.inc('published', amount=len(entries))
+                entries = []  # A failed replay below must not spool them again
+            if self.spool.has_files():
+                replayed = self.spool.replay(client, settings.CLICK_PUBLISH_BATCH_SIZE)
+                if replayed:
+                    logger.info('Replayed %d spooled clicks.', replayed)
+                    CLICK_HANDOFF.inc('replayed', amount=replayed)
+        except redis.RedisError:
+            logger.warning('Click stream unavailable, spooling clicks.', exc_info=True)
+            self.retry_at = time.monotonic() + settings.CLICK_RETRY_INTERVAL
+            if entries:
+                self._spool(entries)
+
+    def _spool(self, entries: list[dict]) -> None:
+        try:
+            self.spool.append(entries)
+        except OSError:
+            logger.error('Failed to spool %d clicks, dropping them.', len(entries), exc_info=True)
+            CLICK_HANDOFF.inc('dropped', amount=len(entries))
+            return
+        CLICK_HANDOFF.inc('spooled', amount=len(entries))
+
+    def close(self) -> None:
+        """Stop the publisher thread and spool clicks still queued at exit; the next process replays them.
+
+        A batch the thread is still publishing after CLICK_RETRY_INTERVAL is spooled as well,
+        and may be stored twice should its append have reached Redis.
+        """
+        self._stopping.set()
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass  # The thread is not waiting for clicks
+        self.thread.join(timeout=settings.CLICK_RETRY_INTERVAL)
+        entries = [entry for entry in self.in_flight + _drain(self.queue) + _drain(self.overflow) if entry]
+        if entries:
+            self._spool(entries)
+
+
+_click_queue: ClickQueue | None = None
+_click_queue_pid = None
+_click_queue_lock = threading.Lock()
+
+
+def get_click_queue() -> ClickQueue:
+    """Return this process's queue, started on first use so that forked workers get their own."""
+    global _click_queue, _click_queue_pid
+    if _click_queue_pid != os.getpid():
+        with _click_queue_lock:
+            if _click_queue_pid != os.getpid():
+                _click_queue = ClickQueue()
+                _click_queue_pid = os.getpid()
+                atexit.register(_click_queue.close)
+    return _click_queue
+
+
+def submit_click(link_id: int, ip: str, clicked_at: datetime) -> bool:
+    """Queue a click without blocking; return False when Redis is not configured."""
+    if not settings.REDIS_URL:
+        return False
+    get_click_queue().put(stream_fields(link_id, ip, clicked_at))
+    return True
@@ -1,4 +1,7 @@
 from django import forms
+from django.utils import timezone
+
+from .models import Link
 
 
 class UrlForm(forms.Form):
@@ -25,6 +28,41 @@ class UrlForm(forms.Form):
         },
     )
 
+    redirect_mode = forms.ChoiceField(
+        choices=Link.RedirectMode.choices,
+        initial=Link.RedirectMode.TEMPORARY,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'}),
+        label='轉址方式',
+    )
+    cache_max_age = forms.IntegerField(
+        min_value=0,
+        max_value=60 * 60 * 24 * 365,
+        initial=3600,
+        required=False,
+        widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm'}),
+        label='快取秒數',
+    )
+
+    expires_at = forms.DateTimeField(
+        required=False,
+        widget=forms.DateTimeInput(attrs={'class': 'form-control form-control-sm', 'type': 'datetime-local'}),
+        label='到期時間',
+    )
+
+    def clean_redirect_mode(self):
+        return self.cleaned_data['redirect_mode'] or Link.RedirectMode.TEMPORARY
+
+    def clean_cache_max_age(self):
+        max_age = self.cleaned_data['cache_max_age']
+        return self.fields['cache_max_age'].initial if max_age is None else max_age
+
+    def clean_expires_at(self):
+        expires_at = self.cleaned_data['expires_at']
+        if expires_at and expires_at <= timezone.now():
+            raise forms.ValidationError('到期時間必須晚於現在。')
+        return expires_at
+
     def clean_url(self):
         """Prevent self-shortening."""
         url = self.cleaned_data['url']
@@ -0,0 +1,126 @@
+import logging
+import os
+import socket
+import time
+from collections.abc import Iterable
+from datetime import UTC, datetime
+from typing import NamedTuple
+
+import redis
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from . import leaderboard
+from .iprange import enrich_clicks
+from .models import Click, Link
+from .redis_client import get_redis
+from .rollups import add_to_rollups
+from .visitors import add_visitors
+
+logger = logging.getLogger(__name__)
+
+
+class ClickRecord(NamedTuple):
+    """A click waiting to be written to the database."""
+
+    link_id: int
+    ip: str
+    clicked_at: datetime
+
+
+def store_clicks(records: Iterable[ClickRecord]) -> int:
+    """Insert clicks and their rollups in bulk, skipping clicks of links deleted since."""
+    records = list(records)
+    for attempt in range(2):
+        link_ids = {record.link_id for record in records}
+        owners = dict(Link.objects.filter(id__in=link_ids).values_list('id', 'user_id'))
+        clicks = [
+            Click(link_id=record.link_id, ip=record.ip, clicked_at=record.clicked_at)
+            for record in records
+            if record.link_id in owners
+        ]
+        enrich_clicks(clicks)
+        try:
+            with transaction.atomic():
+                Click.objects.bulk_create(clicks, batch_size=settings.CLICK_BATCH_SIZE)
+                add_to_rollups(clicks)
+        except IntegrityError:  # A link was deleted between the check and the insert
+            if attempt:
+                raise
+            continue
+        break
+    add_visitors(clicks)
+    leaderboard.add_clicks(clicks, owners)
+
+    if len(clicks) < len(records):
+        logger.info('Dropped %d clicks of deleted links.', len(records) - len(clicks))
+    return len(clicks)
+
+
+def _parse_entry(fields: dict[bytes, bytes]) -> ClickRecord:
+    """Read an entry written by `clickqueue.stream_fields`."""
+    return ClickRecord(
+        link_id=int(fields[b'l']),
+        ip=fields[b'i'].decode(),
+        clicked_at=datetime.fromtimestamp(float(fields[b't']), tz=UTC),
+    )
+
+
+def _store_entries(client: redis.Redis, entries: list) -> int:
+    """Store a chunk of stream entries, then acknowledge and remove them."""
+    ids, records = [], []
+    for entry_id, fields in entries:
+        ids.append(entry_id)
+        if not fields:  # Entry was trimmed while pending
+            continue
+        try:
+            records.append(_parse_entry(fields))
+        except (KeyError, ValueError):
+            logger.warning('Skipped malformed click entry %s.', entry_id)
+    if not ids:
+        return 0
+
+    stored = store_clicks(records) if records else 0
+    # Acknowledge only after the insert commits, so a crash redelivers the chunk (at-least-once)
+    with client.pipeline() as pipe:
+        pipe.xack(settings.CLICK_STREAM, settings.CLICK_CONSUMER_GROUP, *ids)
+        pipe.xdel(settings.CLICK_STREAM, *ids)
+        pipe.execute()
+    return stored
+
+
+def _ensure_group(client: redis.Redis) -> None:
+    try:
+        client.xgroup_create(settings.CLICK_STREAM, settings.CLICK_CONSUMER_GROUP, id='0', mkstream=True)
+    except redis.ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def drain_click_stream() -> int:
+    """Write buffered clicks to the database in chunks and return how many were stored."""
+    client = get_redis()
+    if client is None:
+        return 0
+
+    _ensure_group(client)
+    stream, group = settings.CLICK_STREAM, settings.CLICK_CONSUMER_GROUP
+    consumer = f'{socket.gethostname()}-{os.getpid()}'
+    batch_size = settings.CLICK_BATCH_SIZE
+    deadline = time.monotonic() + settings.CLICK_FLUSH_TIME_BUDGET
+
+    # Take over chunks that a crashed consumer read but never acknowledged
+    claimed = client.xautoclaim(
+        stream, group, consumer, min_idle_time=settings.CLICK_CLAIM_IDLE * 1000, count=batch_size
+    )
+    stored = _store_entries(client, claimed[1])
+
+    while time.monotonic() < deadline:
+        response = client.xreadgroup(group, consumer, {stream: '>'}, count=batch_size)
+        if not response:
+            break
+        entries = response[0][1]
+        stored += _store_entries(client, entries)
+        if len(entries) < batch_size:
+            break
+    return stored
@@ -0,0 +1,173 @@
+"""Country and ASN of IP addresses from a local, memory-mapped range table.
+
+The table is built by `build_ip_ranges` from a CSV file. It holds the sorted start and end
+addresses of each range as native unsigned integers, so `bisect` searches the mapped file
+in C without copying it; the pages are shared by every process through the OS page cache.
+IPv6 ranges are keyed by their upper 64 bits, the routing prefix that range databases use.
+"""
+
+import bisect
+import ipaddress
+import logging
+import mmap
+import os
+import socket
+import struct
+import sys
+import threading
+from collections.abc import Iterable
+from typing import NamedTuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'IPR1'
+IPV4_MAPPED_PREFIX = bytes(10) + b'\xff\xff'
+# Magic, byte order ('l' or 'b'), padding, then the IPv4 and IPv6 range counts
+HEADER = struct.Struct('=4sc3xII')
+
+
+class Range(NamedTuple):
+    start: str
+    end: str
+    country: str
+    asn: int
+
+
+class Location(NamedTuple):
+    country: str
+    asn: int | None
+
+
+def _sections(v4_count: int, v6_count: int) -> list[tuple[str, str, int]]:
+    """(name, memoryview format, count) in file order; 8-byte items first keeps every section aligned."""
+    return [
+        ('v6_starts', 'Q', v6_count),
+        ('v6_ends', 'Q', v6_count),
+        ('v4_starts', 'I', v4_count),
+        ('v4_ends', 'I', v4_count),
+        ('v6_asns', 'I', v6_count),
+        ('v4_asns', 'I', v4_count),
+        ('v6_countries', 'B', 2 * v6_count),
+        ('v4_countries', 'B', 2 * v4_count),
+    ]
+
+
+def _key(address: ipaddress.IPv4Address | ipaddress.IPv6Address) -> tuple[int, int]:
+    """Return (version, integer searched in that version's table) of an address."""
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return (4, int(address)) if address.version == 4 else (6, int(address) >> 64)
+
+
+def _parse(ip: str) -> tuple[int, int]:
+    """Like `_key` for an address string, several times faster than the ipaddress module."""
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+    except OSError:
+        packed = socket.inet_pton(socket.AF_INET6, ip)
+    if packed[:12] == IPV4_MAPPED_PREFIX:
+        return 4, int.from_bytes(packed[12:], 'big')
+    return 6, int.from_bytes(packed[:8], 'big')
+
+
+def write_table(ranges: Iterable[Range], path: str) -> tuple[int, int]:
+    """Write sorted, non-overlapping ranges to `path` atomically; return the IPv4 and IPv6 counts."""
+    tables = {4: [], 6: []}
+    for item in ranges:
+        start, end = ipaddress.ip_address(item.start), ipaddress.ip_address(item.end)
+        (version, start_key), (end_version, end_key) = _key(start), _key(end)
+        if version != end_version or end_key < start_key:
+            raise ValueError(f'Invalid range {item.start} - {item.end}.')
+        tables[version].append((start_key, end_key, item.country, item.asn))
+    for version, rows in tables.items():
+        rows.sort()
+        for previous, row in zip(rows, rows[1:]):
+            if row[0] <= previous[1]:
+                raise ValueError(f'Overlapping IPv{version} ranges starting at {previous[0]} and {row[0]}.')
+
+    columns = {}
+    for version in (4, 6):
+        rows = tables[version]
+        columns[f'v{version}_starts'] = [row[0] for row in rows]
+        columns[f'v{version}_ends'] = [row[1] for row in rows]
+        columns[f'v{version}_asns'] = [row[3] or 0 for row in rows]
+        columns[f'v{version}_countries'] = b''.join((row[2] or '').upper().encode().ljust(2)[:2] for row in rows)
+
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as output:
+        output.write(HEADER.pack(MAGIC, sys.byteorder[0].encode(), len(tables[4]), len(tables[6])))
+        for name, fmt, count in _sections(len(tables[4]), len(tables[6])):
+            values = columns[name]
+            output.write(values if fmt == 'B' else struct.pack(f'={count}{fmt}', *values))
+    os.replace(temporary, path)  # Running processes keep their mapping of the old file
+    return len(tables[4]), len(tables[6])
+
+
+class RangeTable:
+    """A memory-mapped table written by `write_table`."""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, byteorder, v4_count, v6_count = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or byteorder != sys.byteorder[0].encode():
+            raise ValueError(f'{path} is not an IP range table built on this platform.')
+        view, offset = memoryview(self._mmap), HEADER.size
+        for name, fmt, count in _sections(v4_count, v6_count):
+            size = count * struct.calcsize(fmt)
+            setattr(self, name, view[offset : offset + size].cast(fmt))
+            offset += size
+
+    def lookup(self, ip: str) -> Location | None:
+        try:
+            version, key = _parse(ip)
+        except (OSError, ValueError):
+            return None
+        starts = self.v4_starts if version == 4 else self.v6_starts
+        index = bisect.bisect_right(starts, key) - 1
+        if index < 0 or key > (self.v4_ends if version == 4 else self.v6_ends)[index]:
+            return None
+        countries = self.v4_countries if version == 4 else self.v6_countries
+        asn = (self.v4_asns if version == 4 else self.v6_asns)[index]
+        return Location(bytes(countries[2 * index : 2 * index + 2]).decode().strip(), asn or None)
+
+
+_table: RangeTable | None = None
+_table_mtime = None
+_lock = threading.Lock()
+
+
+def get_table() -> RangeTable | None:
+    """Return the table at IP_RANGES_PATH, mapped again after the file is rebuilt."""
+    global _table, _table_mtime
+    path = settings.IP_RANGES_PATH
+    if not path:
+        return None
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _lock:
+        if mtime != _table_mtime:
+            try:
+                _table = RangeTable(path)
+            except ValueError:
+                logger.error('Cannot read the IP range table at %s.', path, exc_info=True)
+                _table = None
+            _table_mtime = mtime
+        return _table
+
+
+def enrich_clicks(clicks: list) -> None:
+    """Set `country` and `asn` of unsaved clicks from their IPs, looking up each IP once."""
+    table = get_table()
+    if table is None:
+        return
+    locations = {}
+    for click in clicks:
+        if click.ip not in locations:
+            locations[click.ip] = table.lookup(click.ip)
+        if location := locations[click.ip]:
+            click.country, click.asn = location
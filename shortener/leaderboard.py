@@ -0,0 +1,133 @@
+"""Most clicked links of today and trending links, globally and per user, in Redis sorted sets.
+
+Stored click batches are counted with one pipeline, so clicks add no database writes.
+Trending scores decay exponentially: a click at time t adds 2^((t - epoch) / half-life)
+to the sorted set of its epoch, which is equivalent to halving all older scores every
+half-life without rewriting them. An epoch lasts EPOCH_HALF_LIVES half-lives to keep
+the increments small; reads merge it with the previous epoch scaled down to match.
+
+Increments are not idempotent. A chunk of the click stream redelivered after a crash
+between storing and acknowledging it is counted again, so the boards over-count exactly
+as the stored clicks do; rankings are approximate, like the counts they come from.
+"""
+
+import logging
+from collections import Counter
+from collections.abc import Iterable
+from datetime import datetime
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Click, Link
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_PREFIX = 'top:'
+EPOCH_HALF_LIVES = 8
+DAY_TIMEOUT = 2 * 24 * 60 * 60
+
+# Merge the trending sets of the current and previous epochs and return the top ARGV[2]
+TRENDING_SCRIPT = """
+redis.call('ZUNIONSTORE', KEYS[3], 2, KEYS[1], KEYS[2], 'WEIGHTS', 1, ARGV[1])
+local top = redis.call('ZREVRANGE', KEYS[3], 0, tonumber(ARGV[2]) - 1, 'WITHSCORES')
+redis.call('DEL', KEYS[3])
+return top
+"""
+
+
+def _scope(user_id: int | None) -> str:
+    return 'all' if user_id is None else f'user:{user_id}'
+
+
+def day_key(user_id: int | None, day) -> str:
+    return f'{REDIS_PREFIX}{_scope(user_id)}:day:{day:%Y%m%d}'
+
+
+def trending_key(user_id: int | None, epoch: int) -> str:
+    return f'{REDIS_PREFIX}{_scope(user_id)}:trend:{epoch}'
+
+
+def _epoch_length() -> float:
+    return settings.LEADERBOARD_HALF_LIFE * EPOCH_HALF_LIVES
+
+
+def _epoch(moment: datetime) -> tuple[int, float]:
+    """Return the epoch of `moment` and the half-lives elapsed since it started."""
+    epoch, offset = divmod(moment.timestamp(), _epoch_length())
+    return int(epoch), offset / settings.LEADERBOARD_HALF_LIFE
+
+
+def add_clicks(clicks: Iterable[Click], owners: dict[int, int]) -> None:
+    """Count stored clicks; `owners` maps their link ids to user ids."""
+    client = get_redis()
+    if client is None:
+        return
+    today = timezone.localdate()
+    current_epoch, _ = _epoch(timezone.now())
+    increments = Counter()
+    for click in clicks:
+        user_id = owners[click.link_id]
+        if timezone.localdate(click.clicked_at) == today:
+            increments[day_key(None, today), click.link_id] += 1
+            increments[day_key(user_id, today), click.link_id] += 1
+        epoch, half_lives = _epoch(click.clicked_at)
+        if current_epoch - epoch <= 1:  # Older clicks would be scaled to nothing
+            weight = 2**half_lives
+            increments[trending_key(None, epoch), click.link_id] += weight
+            increments[trending_key(user_id, epoch), click.link_id] += weight
+    if not increments:
+        return
+    try:
+        with client.pipeline(transaction=False) as pipe:
+            for (key, link_id), amount in increments.items():
+                pipe.zincrby(key, amount, link_id)
+            for key in {key for key, _ in increments}:
+                pipe.expire(key, DAY_TIMEOUT if ':day:' in key else int(2 * _epoch_length()))
+            pipe.execute()
+    except redis.RedisError:
+        logger.warning('Failed to update leaderboards.', exc_info=True)
+
+
+def _ranked(rows: list, scale: float = 1) -> list[tuple[int, float]]:
+    return [(int(member), float(score) * scale) for member, score in rows]
+
+
+def top_links(user_id: int | None = None, size: int | None = None) -> dict[str, list[tuple[int, float]]] | None:
+    """Return today's most clicked and the trending link ids with scores, or None without Redis.
+
+    Trending scores are clicks weighted by 2^(-age / half-life), i.e. recent clicks per half-life.
+    """
+    client = get_redis()
+    if client is None:
+        return None
+    size = size or settings.LEADERBOARD_SIZE
+    epoch, half_lives = _epoch(timezone.now())
+    keys = [trending_key(user_id, epoch), trending_key(user_id, epoch - 1), f'{trending_key(user_id, epoch)}:merge']
+    try:
+        with client.pipeline(transaction=False) as pipe:
+            pipe.zrevrange(day_key(user_id, timezone.localdate()), 0, size - 1, withscores=True)
+            pipe.eval(TRENDING_SCRIPT, len(keys), *keys, 2**-EPOCH_HALF_LIVES, size)
+            today, trending = pipe.execute()
+    except redis.RedisError:
+        logger.warning('Failed to read leaderboards.', exc_info=True)
+        return None
+    trending = list(zip(trending[::2], trending[1::2]))
+    return {'today': _ranked(today), 'trending': _ranked(trending, 2**-half_lives)}
+
+
+def with_links(ranking: list[tuple[int, float]], links: dict[int, Link]) -> list[tuple[Link, float]]:
+    """Pair ranked link ids with their links, skipping deleted ones."""
+    return [(links[link_id], score) for link_id, score in ranking if link_id in links]
+
+
+def leaderboards(user_id: int | None = None) -> dict[str, list[tuple[Link, float]]] | None:
+    """Return `top_links` with Link objects, loaded with one query."""
+    ranked = top_links(user_id)
+    if ranked is None:
+        return None
+    ids = {link_id for ranking in ranked.values() for link_id, _ in ranking}
+    links = Link.objects.select_related('user').in_bulk(ids) if ids else {}
+    return {name: with_links(ranking, links) for name, ranking in ranked.items()}
@@ -0,0 +1,56 @@
+"""Helpers shared by the benchmark commands."""
+
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db import connection
+
+from shortener.models import Link
+from shortener.slugs import random_slug
+
+
+@contextmanager
+def isolated_database():
+    """Run a benchmark against a throwaway copy of the schema, like the test runner does."""
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+@contextmanager
+def timer(samples: list[float]):
+    """Append the elapsed time of the block in milliseconds to `samples`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        samples.append((time.perf_counter() - start) * 1000)
+
+
+def percentile(samples: list[float], p: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    """Summarize latencies in milliseconds."""
+    return {
+        'mean': statistics.fmean(samples),
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+    }
+
+
+def seed_links(count: int, username: str = 'bench') -> list[Link]:
+    """Create `count` links owned by a new user."""
+    user = User.objects.create(username=username)
+    links = [Link(user=user, url=f'https://example.com/{i}', slug=random_slug()) for i in range(count)]
+    Link.objects.bulk_create(links, batch_size=1000)
+    return links
@@ -0,0 +1,67 @@
+"""Record formats shared by the import_data and export_data commands."""
+
+import csv
+import json
+import sys
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.utils import timezone
+
+# Links are identified by slug and users by username, so the data is portable across databases
+FIELDS = {
+    'links': ['slug', 'url', 'user', 'redirect_mode', 'cache_max_age', 'expires_at', 'deleted_at', 'created_at'],
+    'clicks': ['link', 'ip', 'clicked_at'],
+}
+DATETIME_FIELDS = {'created_at', 'expires_at', 'deleted_at', 'clicked_at'}
+
+
+@contextmanager
+def open_stream(path: str, mode: str):
+    """Open `path`, or stdin/stdout for '-'."""
+    if path == '-':
+        yield sys.stdin if 'r' in mode else sys.stdout
+    else:
+        with open(path, mode, encoding='utf-8', newline='') as stream:
+            yield stream
+
+
+def write_records(stream, fmt: str, fields: list[str], rows: Iterable[tuple]) -> int:
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow(value.isoformat() if isinstance(value, datetime) else value for value in row)
+            count += 1
+    else:
+        for row in rows:
+            record = dict(zip(fields, row))
+            stream.write(json.dumps(record, default=datetime.isoformat, ensure_ascii=False))
+            stream.write('\n')
+            count += 1
+    return count
+
+
+def read_records(stream, fmt: str) -> Iterator[dict]:
+    records = csv.DictReader(stream) if fmt == 'csv' else (json.loads(line) for line in stream if line.strip())
+    for record in records:
+        for field in DATETIME_FIELDS & record.keys():
+            if record[field]:
+                value = datetime.fromisoformat(record[field])
+                record[field] = value if timezone.is_aware(value) else timezone.make_aware(value)
+            else:
+                record[field] = None  # Empty in CSV
+        yield record
+
+
+def chunked(records: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
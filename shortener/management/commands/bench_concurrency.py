@@ -0,0 +1,71 @@
+import asyncio
+import random
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, override_settings
+from django.urls import path
+
+from shortener import redirects
+
+from ._bench import isolated_database, seed_links, summarize, timer
+
+# Serves both implementations side by side; used as ROOT_URLCONF while benchmarking
+urlpatterns = [
+    path('sync/<str:query_slug>/', redirects.redirect_url_sync),
+    path('async/<str:query_slug>/', redirects.redirect_url),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare the sync and async redirect views under concurrent load through the ASGI handler.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--links', type=int, default=1000, help='Number of links to seed.')
+        parser.add_argument('--requests', type=int, default=2000, help='Redirects per run.')
+        parser.add_argument(
+            '--concurrency', type=int, nargs='+', default=[1, 10, 50], help='In-flight requests per run.'
+        )
+        parser.add_argument('--no-cache', action='store_true', help='Disable the slug cache.')
+
+    def handle(self, *args, **options):
+        with (
+            isolated_database(),
+            override_settings(
+                ROOT_URLCONF=__name__,
+                RATELIMIT_ENABLE=False,
+                SECURE_SSL_REDIRECT=False,
+                ALLOWED_HOSTS=['testserver'],
+                LINK_CACHE_ENABLED=not options['no_cache'],
+            ),
+            # The click hand-off is stubbed, so the numbers do not depend on a running Redis
+            mock.patch.object(redirects, 'submit_click', return_value=True),
+        ):
+            slugs = [link.slug for link in seed_links(options['links'])]
+            traffic = [random.choice(slugs) for _ in range(options['requests'])]
+            for concurrency in options['concurrency']:
+                for variant in ('sync', 'async'):
+                    asyncio.run(self.run(variant, traffic, concurrency))
+
+    async def run(self, variant: str, traffic: list[str], concurrency: int):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+        samples = []
+
+        async def hit(slug: str):
+            async with semaphore:
+                with timer(samples):
+                    response = await client.get(f'/{variant}/{slug}/')
+                assert response.status_code == 302, response.status_code
+
+        start = time.perf_counter()
+        await asyncio.gather(*(hit(slug) for slug in traffic))
+        elapsed = time.perf_counter() - start
+
+        summary = summarize(samples)
+        self.stdout.write(
+            f'{variant:>5} concurrency={concurrency:<4} '
+            f'throughput={len(traffic) / elapsed:.0f}req/s '
+            f'p50={summary["p50"]:.2f}ms p95={summary["p95"]:.2f}ms p99={summary["p99"]:.2f}ms'
+        )
@@ -0,0 +1,56 @@
+import random
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from shortener import cache, redirects
+
+from ._bench import isolated_database, seed_links, summarize, timer
+
+
+class Command(BaseCommand):
+    help = 'Measure redirect latency with the slug cache on and off, using a throwaway database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--links', type=int, default=1000, help='Number of links to seed.')
+        parser.add_argument('--requests', type=int, default=5000, help='Redirects per run.')
+        parser.add_argument('--hot', type=int, default=100, help='Number of links receiving the traffic.')
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            slugs = [link.slug for link in seed_links(options['links'])]
+            hot_slugs = slugs[: options['hot']]
+            traffic = [random.choice(hot_slugs) for _ in range(options['requests'])]
+            for enabled in (False, True):
+                self.run(traffic, enabled)
+
+    # Clicks are not enqueued and rate limits are off, so only the lookup path is measured.
+    @override_settings(RATELIMIT_ENABLE=False)
+    def run(self, traffic: list[str], enabled: bool):
+        factory = RequestFactory()
+        for slug in set(traffic):
+            cache.invalidate_link(slug)
+        cache.reset_cache_stats()
+        samples = []
+        with (
+            override_settings(LINK_CACHE_ENABLED=enabled),
+            mock.patch.object(redirects, 'submit_click', return_value=True),
+            CaptureQueriesContext(connection) as queries,
+        ):
+            for slug in traffic:
+                request = factory.get(f'/{slug}/')
+                with timer(samples):
+                    redirects.redirect_url_sync(request, query_slug=slug)
+
+        summary = summarize(samples)
+        self.stdout.write(
+            f'cache={"on " if enabled else "off"} '
+            f'mean={summary["mean"]:.3f}ms p50={summary["p50"]:.3f}ms '
+            f'p95={summary["p95"]:.3f}ms p99={summary["p99"]:.3f}ms '
+            f'queries/request={len(queries) / len(traffic):.3f}'
+        )
+        if enabled:
+            self.stdout.write(f'cache stats: {cache.get_cache_stats()}')
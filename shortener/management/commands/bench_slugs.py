@@ -0,0 +1,70 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from shortener.models import Link
+from shortener.slugs import get_slug_allocator, random_slug, refill_slug_pool
+from shortener.views import create_new_link
+
+from ._bench import isolated_database
+
+
+class Command(BaseCommand):
+    help = 'Measure link creation throughput per slug allocator at increasing table fill levels.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fill', type=int, nargs='+', default=[0, 10_000, 100_000], help='Existing links before each run.'
+        )
+        parser.add_argument('--links', type=int, default=1000, help='Links created per allocator and fill level.')
+
+    def handle(self, *args, **options):
+        allocators = ['random', 'pool']
+        if connection.vendor == 'postgresql':
+            allocators.append('sequence')
+        else:
+            self.stdout.write('Skipping the sequence allocator, which requires PostgreSQL.')
+
+        # Slugs of the throwaway database need no stable key
+        with isolated_database(), override_settings(SLUG_PERMUTATION_KEY=settings.SLUG_PERMUTATION_KEY or 'bench'):
+            user = User.objects.create(username='bench')
+            for fill in sorted(options['fill']):
+                self.fill_to(user, fill)
+                for name in allocators:
+                    self.run(user, name, fill, options['links'])
+
+    def fill_to(self, user: User, target: int):
+        missing = target - Link.objects.count()
+        while missing > 0:
+            chunk = min(missing, 10_000)
+            Link.objects.bulk_create(
+                [Link(user=user, url='https://example.com/', slug=random_slug()) for _ in range(chunk)],
+                ignore_conflicts=True,
+            )
+            missing = target - Link.objects.count()
+
+    def run(self, user: User, name: str, fill: int, count: int):
+        allocator = get_slug_allocator(name)
+        if name == 'pool':
+            refill_slug_pool(count)  # Done by a periodic task in production, so not timed
+
+        with override_settings(SLUG_ALLOCATOR=name), CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for i in range(count):
+                link = create_new_link(user, f'https://example.com/{name}/{i}')
+                assert link is not None
+            elapsed = time.perf_counter() - start
+
+        inserts = sum(query['sql'].startswith('INSERT') for query in queries)
+        self.stdout.write(
+            f'fill={fill:<9} allocator={name:<8} '
+            f'throughput={count / elapsed:.0f}links/s '
+            f'queries/link={len(queries) / count:.2f} '
+            f'collisions={inserts - count} '
+            f'collision_free={allocator.collision_free}'
+        )
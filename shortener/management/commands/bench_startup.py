@@ -0,0 +1,103 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a fresh interpreter per app: time the import of the ASGI module and its URLconf, then
+# send redirects through the application with the slug lookup and click hand-off stubbed, so
+# only the framework, middleware and routing are measured. Prints one JSON line.
+PROBE = """
+import asyncio, json, resource, sys, time
+start = time.perf_counter()
+import importlib
+application = importlib.import_module(sys.argv[1]).application
+from django.urls import get_resolver
+get_resolver().url_patterns
+startup = time.perf_counter() - start
+modules = len(sys.modules)
+
+from unittest import mock
+from django.test import override_settings
+from shortener import redirects
+from shortener.cache import CachedLink
+
+scope = {
+    'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'https',
+    'path': '/abcdefg/', 'raw_path': b'/abcdefg/', 'query_string': b'', 'root_path': '',
+    'headers': [(b'host', b'bench.local')], 'client': ('127.0.0.1', 50000), 'server': ('bench.local', 443),
+}
+
+async def request():
+    messages, body = [], [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    async def receive():
+        if body:
+            return body.pop()
+        await asyncio.Future()  # No disconnect; the handler cancels this once it responds
+    async def send(message):
+        messages.append(message)
+    await application(scope, receive, send)
+    return messages[0]['status']
+
+async def run(count):
+    assert await request() == 302
+    begin = time.perf_counter()
+    for _ in range(count):
+        await request()
+    return time.perf_counter() - begin
+
+async def lookup(slug):
+    return CachedLink(1, 'https://example.com/')
+
+with (
+    override_settings(ALLOWED_HOSTS=['bench.local'], RATELIMIT_ENABLE=False),
+    mock.patch.object(redirects, 'alookup_link', lookup),
+    mock.patch.object(redirects, 'submit_click', return_value=True),
+):
+    elapsed = asyncio.run(run(int(sys.argv[2])))
+print(json.dumps({
+    'startup_ms': startup * 1000,
+    'modules': modules,
+    'request_us': elapsed / int(sys.argv[2]) * 1e6,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+APPS = {
+    'full': 'url_shortener.asgi',
+    'redirect': 'url_shortener.redirect_asgi',
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare startup time, memory and per-request overhead of the full and the redirect-only ASGI apps.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Redirects per run.')
+        parser.add_argument('--runs', type=int, default=3, help='Fresh processes per app; the medians are shown.')
+
+    def handle(self, *args, **options):
+        results = {name: [] for name in APPS}
+        for _ in range(options['runs']):
+            for name, module in APPS.items():
+                results[name].append(self.probe(module, options['requests']))
+
+        for name, runs in results.items():
+            median = {key: sorted(run[key] for run in runs)[len(runs) // 2] for key in runs[0]}
+            self.stdout.write(
+                f'{name:>8}: startup={median["startup_ms"]:.0f}ms modules={median["modules"]} '
+                f'max_rss={median["max_rss_mb"]:.1f}MB per_request={median["request_us"]:.0f}us'
+            )
+
+    def probe(self, module: str, requests: int) -> dict:
+        # The full app only defaults DJANGO_SETTINGS_MODULE, so it uses the settings of this command
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE, module, str(requests)],
+            env=os.environ.copy(),
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode:
+            raise CommandError(f'{module} failed:\n{result.stderr}')
+        return json.loads(result.stdout.splitlines()[-1])
@@ -0,0 +1,53 @@
+import csv
+import ipaddress
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shortener.iprange import Range, write_table
+
+
+def parse_row(row: list[str]) -> Range:
+    """Parse `start,end,country,asn` or `network,country,asn`; the ASN may be prefixed with AS."""
+    if '/' in row[0]:
+        network = ipaddress.ip_network(row[0].strip(), strict=False)
+        start, end, rest = str(network[0]), str(network[-1]), row[1:]
+    else:
+        start, end, rest = str(ipaddress.ip_address(row[0].strip())), str(ipaddress.ip_address(row[1].strip())), row[2:]
+    country = rest[0].strip() if rest else ''
+    asn = rest[1].strip().upper().removeprefix('AS') if len(rest) > 1 else ''
+    return Range(start, end, country, int(asn) if asn.isdigit() else 0)
+
+
+class Command(BaseCommand):
+    help = (
+        'Build the memory-mapped IP range table used to add countries and ASNs to clicks, from a '
+        'CSV of `start,end,country,asn` or `network,country,asn` rows. Workers pick up the new '
+        'file on their next click batch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--input', required=True, help='CSV file of IP ranges.')
+        parser.add_argument('--output', default=settings.IP_RANGES_PATH, help='Defaults to IP_RANGES_PATH.')
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            raise CommandError('Set IP_RANGES_PATH or pass --output.')
+
+        def ranges():
+            with open(options['input'], encoding='utf-8', newline='') as stream:
+                for line, row in enumerate(csv.reader(stream), 1):
+                    if not row or row[0].startswith('#'):
+                        continue
+                    try:
+                        yield parse_row(row)
+                    except (ValueError, IndexError):
+                        if line == 1:
+                            continue  # Header
+                        raise CommandError(f'Invalid range on line {line}: {row}') from None
+
+        try:
+            v4_count, v6_count = write_table(ranges(), options['output'])
+        except ValueError as e:
+            raise CommandError(str(e)) from None
+        self.stdout.write(f'Wrote {v4_count} IPv4 and {v6_count} IPv6 ranges to {options["output"]}.')
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from shortener.models import Click, Link
+
+from ._transfer import FIELDS, open_stream, write_records
+
+
+class Command(BaseCommand):
+    help = 'Stream links or clicks to JSONL or CSV with constant memory, using a server-side cursor.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=FIELDS)
+        parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl')
+        parser.add_argument('--output', default='-', help="File to write, '-' for stdout.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows fetched per round trip.')
+
+    def handle(self, *args, **options):
+        if options['model'] == 'links':
+            # Deleted links too, so that they stay deleted (and their slugs taken) after an import
+            fields = ['user__username' if field == 'user' else field for field in FIELDS['links']]
+            rows = Link.all_objects.order_by('id').values_list(*fields)
+        else:
+            rows = Click.objects.order_by('id').values_list('link__slug', 'ip', 'clicked_at')
+
+        with open_stream(options['output'], 'w') as stream:
+            count = write_records(
+                stream,
+                options['format'],
+                FIELDS[options['model']],
+                rows.iterator(chunk_size=options['chunk_size']),
+            )
+        self.stderr.write(f'Exported {count} {options["model"]}.')
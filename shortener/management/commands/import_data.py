@@ -0,0 +1,132 @@
+import csv
+import io
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from shortener.cache import register_new_slugs
+from shortener.iprange import enrich_clicks
+from shortener.models import Click, Link
+from shortener.rollups import add_to_rollups
+from shortener.urlhash import url_hash
+from shortener.visitors import add_visitors
+
+from ._transfer import FIELDS, chunked, open_stream, read_records
+
+
+@contextmanager
+def keep_created_at():
+    """Let bulk_create keep imported `Link.created_at` values instead of auto_now_add."""
+    field = Link._meta.get_field('created_at')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream links or clicks from JSONL or CSV (as written by export_data) into the database '
+        'in chunks, with constant memory. Links are matched by slug, users by username.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=FIELDS)
+        parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl')
+        parser.add_argument('--input', default='-', help="File to read, '-' for stdin.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows inserted per statement.')
+        parser.add_argument('--copy', action='store_true', help='Load clicks with COPY (PostgreSQL only).')
+
+    def handle(self, *args, **options):
+        if options['copy'] and (options['model'] != 'clicks' or connection.vendor != 'postgresql'):
+            raise CommandError('--copy is only supported for clicks on PostgreSQL.')
+
+        imported = skipped = 0
+        with open_stream(options['input'], 'r') as stream:
+            records = read_records(stream, options['format'])
+            for chunk in chunked(records, options['chunk_size']):
+                if options['model'] == 'links':
+                    done = self.import_links(chunk)
+                else:
+                    done = self.import_clicks(chunk, use_copy=options['copy'])
+                imported += done
+                skipped += len(chunk) - done
+        self.stderr.write(f'Imported {imported} {options["model"]}, skipped {skipped}.')
+
+    def import_links(self, records: list[dict]) -> int:
+        """Insert links, creating missing users; links whose slug exists are skipped."""
+        usernames = {record['user'] for record in records}
+        users = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+        missing = [User(username=username) for username in usernames - users.keys()]
+        for user in missing:
+            user.set_unusable_password()
+        User.objects.bulk_create(missing)
+        users.update(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+
+        now = timezone.now()
+        links = [
+            Link(
+                user_id=users[record['user']],
+                url=record['url'],
+                url_hash=url_hash(record['url']),
+                slug=record['slug'],
+                redirect_mode=record['redirect_mode'],
+                cache_max_age=int(record['cache_max_age']),
+                expires_at=record['expires_at'],
+                deleted_at=record['deleted_at'],
+                created_at=record.get('created_at') or now,
+            )
+            for record in records
+        ]
+        existing = set(Link.all_objects.filter(slug__in=[link.slug for link in links]).values_list('slug', flat=True))
+        links = [link for link in links if link.slug not in existing]
+        with keep_created_at():
+            Link.objects.bulk_create(links, ignore_conflicts=True)
+        register_new_slugs([link.slug for link in links])
+        return len(links)
+
+    def import_clicks(self, records: list[dict], use_copy: bool) -> int:
+        """Insert clicks of known links along with their rollups and visitors; unknown slugs are skipped."""
+        slugs = {record['link'] for record in records}
+        link_ids = dict(Link.objects.filter(slug__in=slugs).values_list('slug', 'id'))
+        clicks = [
+            Click(link_id=link_ids[record['link']], ip=record['ip'], clicked_at=record['clicked_at'])
+            for record in records
+            if record['link'] in link_ids
+        ]
+        enrich_clicks(clicks)
+        with transaction.atomic():
+            if use_copy:
+                self.copy_clicks(clicks)
+            else:
+                Click.objects.bulk_create(clicks)
+            add_to_rollups(clicks)
+        add_visitors(clicks)
+        return len(clicks)
+
+    def copy_clicks(self, clicks: list[Click]):
+        now = timezone.now()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows(
+            (click.link_id, click.ip, click.country, click.asn, click.clicked_at.isoformat(), now.isoformat())
+            for click in clicks
+        )
+        buffer.seek(0)
+
+        table = connection.ops.quote_name(Click._meta.db_table)
+        # csv writes '' unquoted, which COPY reads as NULL; an unknown country is '' (NOT NULL) and an unknown ASN NULL
+        sql = (
+            f'COPY {table} (link_id, ip, country, asn, clicked_at, created_at) '
+            'FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (country))'
+        )
+        with connection.cursor() as cursor:
+            if hasattr(cursor.cursor, 'copy_expert'):  # psycopg2
+                cursor.cursor.copy_expert(sql, buffer)
+            else:  # psycopg 3
+                with cursor.cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
@@ -0,0 +1,240 @@
+import asyncio
+import json
+import random
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from shortener.cache import local_cache
+from shortener.models import Click, Link
+from shortener.rollups import add_to_rollups
+from shortener.slugs import random_slug
+from url_shortener.celery import app
+
+from ._bench import isolated_database, summarize
+
+# Endpoint: (method, path template, expected status)
+ENDPOINTS = {
+    'redirect': ('GET', '/{slug}/', 302),
+    'index': ('GET', '/', 200),
+    'shorten': ('POST', '/', 302),
+    'stats': ('GET', '/{slug}/stats/', 200),
+    'delete': ('POST', '/{slug}/delete/', 302),
+}
+# Options that change the workload; a baseline is only comparable under the same ones
+WORKLOAD_OPTIONS = ['users', 'links_per_user', 'clicks_per_link', 'requests', 'concurrency', 'celery', 'seed']
+# Query counts are deterministic for a seed, so any increase beyond noise from caching is a regression
+QUERY_SLACK = 0.5
+
+
+def busy_time(intervals: list[tuple[float, float]]) -> float:
+    """Return the time covered by at least one of the (start, end) intervals."""
+    total, covered_until = 0.0, float('-inf')
+    for start, end in sorted(intervals):
+        if end > covered_until:
+            total += end - max(start, covered_until)
+            covered_until = end
+    return total
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway database and drive the redirect, index, shorten, stats and delete endpoints '
+        'concurrently through the ASGI handler. Report throughput overall and per endpoint, latency percentiles '
+        'and queries per request, and optionally save them as a baseline or fail on regressions against one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--links-per-user', type=int, default=100)
+        parser.add_argument('--clicks-per-link', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint.')
+        parser.add_argument('--concurrency', type=int, default=20, help='In-flight requests.')
+        parser.add_argument(
+            '--celery',
+            choices=['eager', 'broker'],
+            default='eager',
+            help='Run click tasks inline, or send them to the configured broker for a local worker.',
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Seeds the data shape and the request mix.')
+        parser.add_argument('--baseline', default='loadtest-baseline.json', help='Baseline file.')
+        parser.add_argument('--save-baseline', action='store_true', help='Write the results to the baseline.')
+        parser.add_argument('--check', action='store_true', help='Fail when results regress from the baseline.')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.3, help='Allowed relative change of throughput, p50 and p95.'
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        always_eager = app.conf.task_always_eager
+        app.conf.task_always_eager = options['celery'] == 'eager'
+        try:
+            with (
+                isolated_database(),
+                override_settings(RATELIMIT_ENABLE=False, SECURE_SSL_REDIRECT=False, ALLOWED_HOSTS=['testserver']),
+            ):
+                users = self.seed(options['users'], options['links_per_user'], options['clicks_per_link'])
+                local_cache.clear()
+                traffic, probes = self.plan(users, options['requests'])
+                throughput, results = asyncio.run(self.run(traffic, options['concurrency']))
+                for name, queries in self.count_queries(probes).items():
+                    results[name]['queries'] = queries
+        finally:
+            app.conf.task_always_eager = always_eager
+
+        self.stdout.write(f'overall  throughput={throughput:.0f}req/s')
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<8} throughput={result["throughput"]:.0f}req/s '
+                f'p50={result["p50"]:.2f}ms p95={result["p95"]:.2f}ms p99={result["p99"]:.2f}ms '
+                f'queries/req={result["queries"]:.2f}'
+            )
+
+        workload = {option: options[option] for option in WORKLOAD_OPTIONS}
+        baseline_path = Path(options['baseline'])
+        if options['check']:
+            self.check_baseline(baseline_path, workload, throughput, results, options['tolerance'])
+        if options['save_baseline']:
+            baseline = {'workload': workload, 'throughput': throughput, 'results': results}
+            baseline_path.write_text(json.dumps(baseline, indent=2) + '\n')
+            self.stdout.write(f'Saved baseline to {baseline_path}.')
+
+    def seed(self, user_count: int, links_per_user: int, clicks_per_link: int) -> list[User]:
+        """Create users with links and a month of clicks, one batch per user."""
+        now = timezone.now()
+        users = User.objects.bulk_create(User(username=f'load{i}') for i in range(user_count))
+        for user in users:
+            links = Link.objects.bulk_create(
+                Link(user=user, url=f'https://example.com/{user.pk}/{i}', slug=random_slug())
+                for i in range(links_per_user)
+            )
+            clicks = Click.objects.bulk_create(
+                (
+                    Click(link=link, ip='127.0.0.1', clicked_at=now - timedelta(minutes=self.rng.randrange(43_200)))
+                    for link in links
+                    for _ in range(clicks_per_link)
+                ),
+                batch_size=5000,
+            )
+            add_to_rollups(clicks)
+        return users
+
+    def plan(self, users: list[User], count: int) -> tuple[list[tuple], list[tuple]]:
+        """Return the shuffled concurrent requests, and a few requests per endpoint for counting queries.
+
+        Each request is (endpoint, user, slug). Deleted links are set aside so that no other
+        request targets them.
+        """
+        links = list(Link.objects.order_by('id').values_list('user_id', 'slug'))
+        self.rng.shuffle(links)
+        probe_count = min(20, count)
+        if len(links) < 2 * (count + probe_count):
+            raise CommandError('Seed at least twice as many links as delete requests.')
+        doomed, links = links[: count + probe_count], links[count + probe_count :]
+        users_by_id = {user.pk: user for user in users}
+
+        def requests(endpoint: str, n: int, pool: list[tuple]) -> list[tuple]:
+            picks = (self.rng.choice(pool) for _ in range(n))
+            return [(endpoint, users_by_id[user_id], slug) for user_id, slug in picks]
+
+        traffic, probes = [], []
+        for endpoint in ('redirect', 'index', 'shorten', 'stats'):
+            traffic += requests(endpoint, count, links)
+            probes += requests(endpoint, probe_count, links)
+        traffic += [('delete', users_by_id[user_id], slug) for user_id, slug in doomed[:count]]
+        probes += [('delete', users_by_id[user_id], slug) for user_id, slug in doomed[count:]]
+        self.rng.shuffle(traffic)
+        return traffic, probes
+
+    async def run(self, traffic: list[tuple], concurrency: int) -> tuple[float, dict[str, dict]]:
+        """Send the mixed traffic and return its overall throughput and the throughput and latencies per endpoint.
+
+        An endpoint's throughput is its request count over the time it had requests in flight, so
+        it depends on the mix as well as on the endpoint; compare it only within one workload.
+        """
+        clients = {}
+        for _, user, _ in traffic:
+            if user.pk not in clients:
+                clients[user.pk] = AsyncClient()
+                await clients[user.pk].aforce_login(user)
+        anonymous = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+        intervals = {name: [] for name in ENDPOINTS}
+
+        async def send(endpoint: str, user: User, slug: str):
+            method, template, expected = ENDPOINTS[endpoint]
+            client = anonymous if endpoint == 'redirect' else clients[user.pk]
+            path = template.format(slug=slug)
+            async with semaphore:
+                sent = time.perf_counter()
+                if method == 'GET':
+                    response = await client.get(path)
+                else:
+                    response = await client.post(path, {'url': f'https://example.org/{slug}'})
+                intervals[endpoint].append((sent, time.perf_counter()))
+            if response.status_code != expected:
+                raise CommandError(f'{method} {path} returned {response.status_code}, expected {expected}.')
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send(*request) for request in traffic))
+        elapsed = time.perf_counter() - start
+        results = {
+            name: {
+                'throughput': len(spans) / busy_time(spans),
+                **summarize([(done - sent) * 1000 for sent, done in spans]),
+            }
+            for name, spans in intervals.items()
+        }
+        return len(traffic) / elapsed, results
+
+    def count_queries(self, probes: list[tuple]) -> dict[str, float]:
+        """Send requests one at a time on this thread and average their queries per endpoint."""
+        clients = {}
+        queries = {name: [] for name in ENDPOINTS}
+        for endpoint, user, slug in probes:
+            method, template, _ = ENDPOINTS[endpoint]
+            if endpoint == 'redirect':
+                client = Client()
+            else:
+                client = clients.get(user.pk)
+                if client is None:
+                    client = clients[user.pk] = Client()
+                    client.force_login(user)
+            with CaptureQueriesContext(connection) as captured:
+                if method == 'GET':
+                    client.get(template.format(slug=slug))
+                else:
+                    client.post(template.format(slug=slug), {'url': f'https://example.org/{slug}'})
+            queries[endpoint].append(len(captured))
+        return {name: sum(counts) / len(counts) for name, counts in queries.items()}
+
+    def check_baseline(self, path: Path, workload: dict, throughput: float, results: dict[str, dict], tolerance: float):
+        try:
+            baseline = json.loads(path.read_text())
+        except FileNotFoundError:
+            raise CommandError(f'No baseline at {path}; record one with --save-baseline.') from None
+        if baseline['workload'] != workload:
+            raise CommandError(f'The baseline was recorded with a different workload: {baseline["workload"]}.')
+
+        regressions = []
+        if throughput < baseline['throughput'] * (1 - tolerance):
+            regressions.append(f'throughput {throughput:.0f} < {baseline["throughput"]:.0f}req/s')
+        for name, expected in baseline['results'].items():
+            actual = results[name]
+            if actual['throughput'] < expected['throughput'] * (1 - tolerance):
+                regressions.append(f'{name} throughput {actual["throughput"]:.0f} < {expected["throughput"]:.0f}req/s')
+            for key in ('p50', 'p95'):  # p99 of a few hundred samples is too noisy to gate on
+                if actual[key] > expected[key] * (1 + tolerance):
+                    regressions.append(f'{name} {key} {actual[key]:.2f} > {expected[key]:.2f}ms')
+            if actual['queries'] > expected['queries'] + QUERY_SLACK:
+                regressions.append(f'{name} queries/req {actual["queries"]:.2f} > {expected["queries"]:.2f}')
+        if regressions:
+            raise CommandError('Regressions from the baseline:\n' + '\n'.join(regressions))
+        self.stdout.write(f'No regressions from {path} (tolerance {tolerance:.0%}).')
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from shortener.partitions import create_partitions, drop_expired_clicks, is_partitioned
+
+
+class Command(BaseCommand):
+    help = (
+        'Create the upcoming monthly click partitions (PostgreSQL) and fold clicks older than '
+        'CLICK_RETENTION_MONTHS into daily rollups before dropping them. Also run daily by Celery beat.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, help='Defaults to CLICK_PARTITIONS_AHEAD.')
+        parser.add_argument('--no-retention', action='store_true', help='Only create partitions.')
+
+    def handle(self, *args, **options):
+        if is_partitioned():
+            for name in create_partitions(options['months_ahead']):
+                self.stdout.write(f'Created partition {name}.')
+        else:
+            self.stdout.write('Clicks are not partitioned, which requires PostgreSQL.')
+
+        if not options['no_retention']:
+            dropped, deleted = drop_expired_clicks()
+            for name in dropped:
+                self.stdout.write(f'Dropped partition {name}.')
+            self.stdout.write(f'Deleted {deleted} expired clicks outside partitions.')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from shortener.purge import pending_purges, purge_deleted_links, sweep_expired_links
+
+
+class Command(BaseCommand):
+    help = (
+        'Soft-delete expired links and purge the clicks of deleted links in batches, for up to '
+        'LINK_PURGE_TIME_BUDGET seconds. Also run every minute by Celery beat.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', action='store_true', help='Only list links waiting to be purged.')
+
+    def handle(self, *args, **options):
+        if not options['status']:
+            expired = sweep_expired_links()
+            purged = purge_deleted_links()
+            self.stdout.write(f'Expired {expired} links, purged {purged} deleted links.')
+        for slug, clicks in pending_purges():
+            self.stdout.write(f'{slug}: {clicks} clicks left to purge')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shortener.redis_client import get_redis
+from shortener.slugfilter import rebuild_filter
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the Bloom filter of existing slugs in Redis from the links table. Celery beat '
+        'rebuilds it when it is missing or half-way to SLUG_FILTER_MAX_AGE.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10_000, help='Slugs read and added per batch.')
+
+    def handle(self, *args, **options):
+        if get_redis() is None:
+            raise CommandError('The slug filter requires REDIS_URL.')
+        count = rebuild_filter(options['chunk_size'])
+        if count is None:
+            raise CommandError('The filter is disabled or another rebuild is running.')
+        self.stdout.write(f'Added {count} slugs to the slug filter.')
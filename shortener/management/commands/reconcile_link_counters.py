@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+
+from shortener.models import Click, ClickRollup, Link
+from shortener.partitions import retention_start
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute Link.click_count and last_clicked_at from stored clicks, plus the daily rollups '
+        'of clicks past the retention window, a chunk of links at a time. Run once after upgrading.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Links per transaction.')
+
+    def handle(self, *args, **options):
+        kept_since = retention_start()
+        last_id, fixed = 0, 0
+        while True:
+            with transaction.atomic():
+                # Locked first, so a concurrent click batch is either counted here or increments after
+                links = list(
+                    Link.objects.select_for_update()
+                    .filter(id__gt=last_id)
+                    .order_by('id')
+                    .only('id', 'click_count', 'last_clicked_at')[: options['chunk_size']]
+                )
+                if not links:
+                    break
+                ids = [link.id for link in links]
+                clicks = Click.objects.filter(link_id__in=ids)
+                expired = {}
+                if kept_since:
+                    clicks = clicks.filter(clicked_at__gte=kept_since)
+                    expired = dict(
+                        ClickRollup.objects.filter(
+                            link_id__in=ids, period=ClickRollup.Period.DAY, bucket__lt=kept_since
+                        )
+                        .values('link_id')
+                        .annotate(clicks=Sum('clicks'))
+                        .values_list('link_id', 'clicks')
+                        .order_by()
+                    )
+                stats = {
+                    row['link_id']: row
+                    for row in clicks.values('link_id').annotate(clicks=Count('id'), last=Max('clicked_at')).order_by()
+                }
+
+                changed = []
+                for link in links:
+                    row = stats.get(link.id, {})
+                    click_count = row.get('clicks', 0) + expired.get(link.id, 0)
+                    # Without kept clicks, the time of an expired last click is only known from the counter
+                    last_clicked_at = row.get('last') or (link.last_clicked_at if click_count else None)
+                    if (click_count, last_clicked_at) != (link.click_count, link.last_clicked_at):
+                        link.click_count, link.last_clicked_at = click_count, last_clicked_at
+                        changed.append(link)
+                Link.objects.bulk_update(changed, ['click_count', 'last_clicked_at'])
+                fixed += len(changed)
+                last_id = ids[-1]
+        self.stdout.write(f'Corrected the counters of {fixed} links.')
@@ -0,0 +1,322 @@
+"""Counters and histograms exposed in the Prometheus text format.
+
+Recording only adds to an in-memory dict. A background thread adds the increments to
+Redis hashes every METRICS_FLUSH_INTERVAL seconds, so the endpoint reports totals across
+all web and Celery worker processes. Without Redis it reports the serving process only.
+"""
+
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+import redis
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_PREFIX = 'metrics:'
+# Seconds, from cached redirects up to slow pages
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50)
+
+REGISTRY: dict[str, 'Metric'] = {}
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        # (sample suffix, label values, bucket index) -> increment since the last flush
+        self._pending = defaultdict(float)
+        # Totals of this process, reported when Redis is not configured
+        self._totals = defaultdict(float)
+        REGISTRY[name] = self
+
+    def _add(self, key: tuple, amount: float) -> None:
+        with self._lock:
+            self._pending[key] += amount
+
+    def take_pending(self) -> dict[tuple, float]:
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(float)
+        return pending
+
+    def restore_pending(self, pending: dict[tuple, float]) -> None:
+        for key, amount in pending.items():
+            self._add(key, amount)
+
+    def _labels(self, values: tuple, extra: str = '') -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def header(self, name: str) -> list[str]:
+        return [f'# HELP {name} {self.documentation}', f'# TYPE {name} {self.type}']
+
+    def render(self, samples: dict[tuple, float]) -> list[str]:
+        lines = self.header(self.name)
+        for (suffix, labels, _), value in sorted(samples.items()):
+            lines.append(f'{self.name}{suffix}{self._labels(labels)} {_number(value)}')
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._add(('_total', labels, None), amount)
+
+    def header(self, name: str) -> list[str]:
+        return super().header(f'{name}_total')
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels: str) -> None:
+        # Buckets are stored individually and made cumulative when rendered
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._pending['_bucket', labels, index] += 1
+            self._pending['_sum', labels, None] += value
+            self._pending['_count', labels, None] += 1
+
+    def render(self, samples: dict[tuple, float]) -> list[str]:
+        lines = self.header(self.name)
+        for labels in sorted({labels for _, labels, _ in samples}):
+            cumulative = 0
+            for index, bound in enumerate((*self.buckets, '+Inf')):
+                cumulative += samples.get(('_bucket', labels, index), 0)
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{self._labels(labels, le)} {_number(cumulative)}')
+            for suffix in ('_sum', '_count'):
+                lines.append(f'{self.name}{suffix}{self._labels(labels)} {_number(samples[suffix, labels, None])}')
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+REQUEST_LATENCY = Histogram('shortener_request_duration_seconds', 'Request latency by view.', ('view',))
+REQUESTS = Counter('shortener_requests', 'Responses by view and status code.', ('view', 'status'))
+DB_QUERIES = Histogram(
+    'shortener_db_queries_per_request', 'Database queries per request by view.', ('view',), QUERY_COUNT_BUCKETS
+)
+DB_TIME = Counter('shortener_db_query_seconds', 'Time spent in database queries by view.', ('view',))
+RATELIMITED = Counter('shortener_ratelimit_rejections', 'Requests rejected by a rate limit, by view.', ('view',))
+CLICK_HANDOFF = Counter(
+    'shortener_click_handoff',
+    'Clicks leaving the redirect queue by outcome: published, spooled, replayed or dropped.',
+    ('outcome',),
+)
+PURGED_CLICKS = Counter('shortener_purged_clicks', 'Clicks of deleted links purged in the background.')
+TASK_DURATION = Histogram(
+    'shortener_celery_task_duration_seconds', 'Celery task run time by task and final state.', ('task', 'state')
+)
+
+
+# Queries of the current request: [count, seconds], set by the middleware. Context variables
+# follow sync_to_async into worker threads, so queries of async views are counted too.
+_query_stats: ContextVar[list | None] = ContextVar('query_stats', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper that adds to the stats of the current request, if any."""
+    stats = _query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - start
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """`connection_created` receiver adding `record_query` to every new database connection."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def _observe_request(request, response, elapsed: float, stats: list) -> None:
+    match = request.resolver_match
+    view = match.view_name if match else 'unmatched'
+    REQUEST_LATENCY.observe(elapsed, view)
+    REQUESTS.inc(view, str(response.status_code))
+    DB_QUERIES.observe(stats[0], view)
+    if stats[1]:
+        DB_TIME.inc(view, amount=stats[1])
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Record latency, status and database queries of every request by view name."""
+    if not settings.METRICS_ENABLED:
+        raise MiddlewareNotUsed
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            stats = [0, 0.0]
+            token = _query_stats.set(stats)
+            start = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _query_stats.reset(token)
+            _observe_request(request, response, time.perf_counter() - start, stats)
+            return response
+
+    else:
+
+        def middleware(request):
+            stats = [0, 0.0]
+            token = _query_stats.set(stats)
+            start = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                _query_stats.reset(token)
+            _observe_request(request, response, time.perf_counter() - start, stats)
+            return response
+
+    return middleware
+
+
+_task_starts: dict[str, float] = {}
+
+
+def task_started(task_id: str) -> None:
+    """Note the start of a Celery task; connected to its signals in `url_shortener.celery`."""
+    _task_starts[task_id] = time.perf_counter()
+
+
+def task_finished(task_id: str, task, state: str | None) -> None:
+    start = _task_starts.pop(task_id, None)
+    if start is not None:
+        TASK_DURATION.observe(time.perf_counter() - start, task.name, state or 'UNKNOWN')
+
+
+_flush_lock = threading.Lock()
+
+
+def flush() -> None:
+    """Move increments recorded since the last flush into the shared (or process) totals."""
+    client = get_redis()
+    with _flush_lock:
+        increments = {metric: metric.take_pending() for metric in REGISTRY.values()}
+        if client is None:
+            for metric, pending in increments.items():
+                for key, amount in pending.items():
+                    metric._totals[key] += amount
+            return
+        try:
+            with client.pipeline(transaction=False) as pipe:
+                for metric, pending in increments.items():
+                    for key, amount in pending.items():
+                        pipe.hincrbyfloat(REDIS_PREFIX + metric.name, json.dumps(key), amount)
+                pipe.execute()
+        except redis.RedisError:
+            logger.warning('Failed to flush metrics, retrying later.', exc_info=True)
+            for metric, pending in increments.items():
+                metric.restore_pending(pending)
+
+
+def _flush_forever() -> None:
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        flush()
+
+
+def start_flusher() -> None:
+    """Flush to Redis in the background, also in processes forked afterwards."""
+    if settings.METRICS_ENABLED and settings.REDIS_URL:
+        threading.Thread(target=_flush_forever, name='metrics-flush', daemon=True).start()
+        os.register_at_fork(after_in_child=_after_fork)
+
+
+def _after_fork() -> None:
+    global _flush_lock
+    # Increments inherited from the parent are flushed by the parent, and its locks may be held
+    _flush_lock = threading.Lock()
+    for metric in REGISTRY.values():
+        metric._lock = threading.Lock()
+        metric._pending.clear()
+    threading.Thread(target=_flush_forever, name='metrics-flush', daemon=True).start()
+
+
+def _totals() -> dict[str, dict[tuple, float]]:
+    client = get_redis()
+    if client is None:
+        return {metric.name: dict(metric._totals) for metric in REGISTRY.values()}
+    with client.pipeline(transaction=False) as pipe:
+        for name in REGISTRY:
+            pipe.hgetall(REDIS_PREFIX + name)
+        hashes = pipe.execute()
+    totals = {}
+    for name, fields in zip(REGISTRY, hashes):
+        samples = totals[name] = {}
+        for field, value in fields.items():
+            suffix, labels, index = json.loads(field)
+            samples[suffix, tuple(labels), index] = float(value)
+    return totals
+
+
+def _queue_gauges() -> list[str]:
+    """Backlog of the click stream and the Celery queue, read at scrape time."""
+    client = get_redis()
+    if client is None:
+        return []
+    stream = settings.CLICK_STREAM
+    with client.pipeline(transaction=False) as pipe:
+        pipe.xlen(stream)
+        pipe.xrange(stream, count=1)  # Flushed entries are deleted, so this is the oldest pending click
+        pipe.llen('celery')  # Default queue of the Redis broker
+        length, oldest, celery_length = pipe.execute(raise_on_error=False)
+    lag = 0.0
+    if oldest and not isinstance(oldest, Exception):
+        lag = max(0.0, time.time() - int(oldest[0][0].split(b'-')[0]) / 1000)
+    gauges = [
+        ('shortener_click_stream_length', 'Clicks waiting in the stream.', length),
+        ('shortener_click_stream_lag_seconds', 'Age of the oldest click waiting in the stream.', lag),
+        ('shortener_celery_queue_length', 'Tasks waiting in the default Celery queue.', celery_length),
+    ]
+    lines = []
+    for name, documentation, value in gauges:
+        if not isinstance(value, Exception):
+            lines += [f'# HELP {name} {documentation}', f'# TYPE {name} gauge', f'{name} {_number(value)}']
+    return lines
+
+
+def render_metrics() -> str:
+    flush()
+    totals = _totals()
+    lines = []
+    for metric in REGISTRY.values():
+        lines += metric.render(totals.get(metric.name, {}))
+    lines += _queue_gauges()
+    return '\n'.join(lines) + '\n'
@@ -15,7 +15,12 @@ class Migration(migrations.Migration):
             fields=[
                 ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
                 ('url', models.URLField(help_text='An url to be shorten')),
-                ('slug', models.CharField(help_text='A random 7-character code (i.e. [a-zA-Z0-9])', max_length=7, unique=True)),
+                (
+                    'slug',
+                    models.CharField(
+                        help_text='A random 7-character code (i.e. [a-zA-Z0-9])', max_length=7, unique=True
+                    ),
+                ),
                 ('created_at', models.DateTimeField(auto_now_add=True)),
             ],
         ),
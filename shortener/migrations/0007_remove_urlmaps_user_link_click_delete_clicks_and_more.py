@@ -22,9 +22,19 @@ class Migration(migrations.Migration):
             fields=[
                 ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
                 ('url', models.URLField(help_text='An url to be shorten', max_length=2048)),
-                ('slug', models.CharField(help_text='A random 7-character code (i.e. [a-zA-Z0-9])', max_length=7, unique=True)),
+                (
+                    'slug',
+                    models.CharField(
+                        help_text='A random 7-character code (i.e. [a-zA-Z0-9])', max_length=7, unique=True
+                    ),
+                ),
                 ('created_at', models.DateTimeField(auto_now_add=True)),
-                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='links', to=settings.AUTH_USER_MODEL)),
+                (
+                    'user',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name='links', to=settings.AUTH_USER_MODEL
+                    ),
+                ),
             ],
             options={
                 'ordering': ['-created_at'],
@@ -36,7 +46,12 @@ class Migration(migrations.Migration):
                 ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
                 ('ip', models.GenericIPAddressField()),
                 ('created_at', models.DateTimeField(auto_now_add=True)),
-                ('link', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='clicks', to='shortener.link')),
+                (
+                    'link',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name='clicks', to='shortener.link'
+                    ),
+                ),
             ],
             options={
                 'ordering': ['-created_at'],
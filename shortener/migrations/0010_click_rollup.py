@@ -0,0 +1,63 @@
+# Generated by Django 6.0.1 on 2026-10-18 19:43
+
+from datetime import UTC
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncHour
+
+
+def backfill_rollups(apps, schema_editor):
+    """Aggregate existing clicks into hourly and daily rollups."""
+    Click = apps.get_model('shortener', 'Click')
+    ClickRollup = apps.get_model('shortener', 'ClickRollup')
+    db_alias = schema_editor.connection.alias
+
+    for period, trunc in (('hour', TruncHour('clicked_at', tzinfo=UTC)), ('day', TruncDay('clicked_at'))):
+        buckets = (
+            Click.objects.using(db_alias)
+            .annotate(bucket=trunc)
+            .values('link_id', 'bucket')
+            .annotate(clicks=Count('id'))
+            .order_by()
+        )
+        batch = []
+        for row in buckets.iterator(chunk_size=2000):
+            batch.append(ClickRollup(period=period, **row))
+            if len(batch) == 2000:
+                ClickRollup.objects.using(db_alias).bulk_create(batch)
+                batch = []
+        ClickRollup.objects.using(db_alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0009_alter_click_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClickRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField(help_text='Start of the hour (UTC) or of the day (TIME_ZONE)')),
+                ('clicks', models.PositiveIntegerField(default=0)),
+                (
+                    'link',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='shortener.link'
+                    ),
+                ),
+            ],
+            options={
+                'ordering': ['-bucket'],
+                'constraints': [
+                    models.UniqueConstraint(fields=('link', 'period', 'bucket'), name='unique_click_rollup'),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0.1 on 2026-10-18 19:45
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0010_click_rollup'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='click',
+            options={'ordering': ['-clicked_at', '-id']},
+        ),
+        migrations.AlterModelOptions(
+            name='link',
+            options={'ordering': ['-created_at', '-id']},
+        ),
+    ]
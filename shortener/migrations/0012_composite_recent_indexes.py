@@ -0,0 +1,61 @@
+# Generated by Django 6.0.1 on 2026-10-18 19:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class AddIndexConcurrentlyIfPostgres(AddIndexConcurrently):
+    """Build the index without blocking writes on PostgreSQL; other backends have no CONCURRENTLY."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('shortener', '0011_add_id_ordering_tiebreak'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Create the composite indexes before dropping the FK indexes they replace
+        AddIndexConcurrentlyIfPostgres(
+            model_name='click',
+            index=models.Index(fields=['link', '-clicked_at', '-id'], name='click_link_recent_idx'),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name='link',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='link_user_recent_idx'),
+        ),
+        migrations.AlterField(
+            model_name='click',
+            name='link',
+            field=models.ForeignKey(
+                db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='clicks', to='shortener.link'
+            ),
+        ),
+        migrations.AlterField(
+            model_name='link',
+            name='user',
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='links',
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-18 19:47
+
+from django.db import migrations, models
+
+
+def create_slug_sequence(apps, schema_editor):
+    """Create the sequence behind the `sequence` slug allocator (PostgreSQL only)."""
+    if schema_editor.connection.vendor == 'postgresql':
+        # INCREMENT BY matches SLUG_SEQUENCE_BLOCK: each value starts a block of slugs
+        schema_editor.execute('CREATE SEQUENCE IF NOT EXISTS shortener_slug_seq INCREMENT BY 100')
+
+
+def drop_slug_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP SEQUENCE IF EXISTS shortener_slug_seq')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0012_composite_recent_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlugPool',
+            fields=[
+                ('slug', models.CharField(max_length=7, primary_key=True, serialize=False)),
+            ],
+        ),
+        migrations.RunPython(create_slug_sequence, drop_slug_sequence),
+    ]
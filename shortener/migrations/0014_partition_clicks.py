@@ -0,0 +1,105 @@
+# Generated by Django 6.0.1 on 2026-10-18 20:05
+
+from datetime import datetime
+
+from django.db import migrations
+from django.utils import timezone
+
+# Partitions created ahead of the current month; `maintain_clicks` keeps creating them afterwards
+MONTHS_AHEAD = 3
+
+
+def month_start(moment, months=0):
+    local = timezone.localtime(moment)
+    year, month = divmod(local.year * 12 + local.month - 1 + months, 12)
+    return timezone.make_aware(datetime(year, month + 1, 1))
+
+
+def partition_clicks(apps, schema_editor):
+    """Rebuild the click table partitioned by local month of clicked_at (PostgreSQL only).
+
+    The primary key must include the partition key, so it becomes (id, clicked_at);
+    ids stay unique as they all come from one sequence. The table is copied in the
+    migration's transaction, which blocks click inserts until it commits.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    execute = schema_editor.execute
+    execute('ALTER TABLE shortener_click RENAME TO shortener_click_old')
+    execute('ALTER INDEX IF EXISTS shortener_click_pkey RENAME TO shortener_click_old_pkey')
+    execute('ALTER INDEX click_link_recent_idx RENAME TO click_link_recent_old_idx')
+
+    execute('CREATE SEQUENCE shortener_click_new_id_seq')
+    execute(
+        'CREATE TABLE shortener_click ('
+        " id bigint NOT NULL DEFAULT nextval('shortener_click_new_id_seq'),"
+        ' ip inet NOT NULL,'
+        ' clicked_at timestamp with time zone NOT NULL,'
+        ' created_at timestamp with time zone NOT NULL,'
+        ' link_id bigint NOT NULL REFERENCES shortener_link (id) DEFERRABLE INITIALLY DEFERRED,'
+        ' PRIMARY KEY (id, clicked_at)'
+        ') PARTITION BY RANGE (clicked_at)'
+    )
+    execute('ALTER SEQUENCE shortener_click_new_id_seq OWNED BY shortener_click.id')
+    execute('CREATE INDEX click_link_recent_idx ON shortener_click (link_id, clicked_at DESC, id DESC)')
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT MIN(clicked_at) FROM shortener_click_old')
+        oldest = cursor.fetchone()[0] or timezone.now()
+    month = month_start(oldest)
+    last = month_start(timezone.now(), MONTHS_AHEAD)
+    while month <= last:
+        following = month_start(month, 1)
+        execute(
+            f'CREATE TABLE shortener_click_p{month:%Y_%m} PARTITION OF shortener_click '
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')"
+        )
+        month = following
+    execute('CREATE TABLE shortener_click_default PARTITION OF shortener_click DEFAULT')
+
+    execute(
+        'INSERT INTO shortener_click (id, ip, clicked_at, created_at, link_id) '
+        'SELECT id, ip, clicked_at, created_at, link_id FROM shortener_click_old'
+    )
+    execute("SELECT setval('shortener_click_new_id_seq', COALESCE(MAX(id), 0) + 1, false) FROM shortener_click")
+    execute('DROP TABLE shortener_click_old')
+    execute('ALTER SEQUENCE shortener_click_new_id_seq RENAME TO shortener_click_id_seq')
+
+
+def unpartition_clicks(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    execute = schema_editor.execute
+    execute('ALTER TABLE shortener_click RENAME TO shortener_click_partitioned')
+    execute('ALTER INDEX shortener_click_pkey RENAME TO shortener_click_partitioned_pkey')
+    execute('ALTER INDEX click_link_recent_idx RENAME TO click_link_recent_partitioned_idx')
+    execute(
+        'CREATE TABLE shortener_click ('
+        ' id bigint NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,'
+        ' ip inet NOT NULL,'
+        ' clicked_at timestamp with time zone NOT NULL,'
+        ' created_at timestamp with time zone NOT NULL,'
+        ' link_id bigint NOT NULL REFERENCES shortener_link (id) DEFERRABLE INITIALLY DEFERRED'
+        ')'
+    )
+    execute('CREATE INDEX click_link_recent_idx ON shortener_click (link_id, clicked_at DESC, id DESC)')
+    execute(
+        'INSERT INTO shortener_click (id, ip, clicked_at, created_at, link_id) '
+        'SELECT id, ip, clicked_at, created_at, link_id FROM shortener_click_partitioned'
+    )
+    execute(
+        "SELECT setval(pg_get_serial_sequence('shortener_click', 'id'), COALESCE(MAX(id), 0) + 1, false) "
+        'FROM shortener_click'
+    )
+    execute('DROP TABLE shortener_click_partitioned')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0013_slug_pool_and_sequence'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_clicks, unpartition_clicks),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 6.0.1 on 2026-10-18 20:40
+
+from django.db import migrations, models
+
+from shortener.urlhash import url_hash
+
+
+def backfill_url_hashes(apps, schema_editor):
+    """Hash the URLs of existing links in batches of primary keys."""
+    Link = apps.get_model('shortener', 'Link')
+    db_alias = schema_editor.connection.alias
+    links = Link.objects.using(db_alias).only('id', 'url').order_by('id')
+
+    last_id = 0
+    while batch := list(links.filter(id__gt=last_id)[:2000]):
+        for link in batch:
+            link.url_hash = url_hash(link.url)
+        Link.objects.using(db_alias).bulk_update(batch, ['url_hash'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0014_partition_clicks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='link',
+            name='url_hash',
+            field=models.CharField(
+                default='',
+                editable=False,
+                help_text='SHA-256 of the normalized URL, to find duplicates of a user',
+                max_length=64,
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_url_hashes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['user', 'url_hash'], name='link_user_url_hash_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-18 21:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0015_link_url_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='link',
+            name='redirect_mode',
+            field=models.CharField(
+                choices=[
+                    ('temporary', '暫時轉址 (302，精確計數)'),
+                    ('cached', '可快取轉址 (302)'),
+                    ('permanent', '永久轉址 (301)'),
+                ],
+                default='temporary',
+                max_length=9,
+            ),
+        ),
+        migrations.AddField(
+            model_name='link',
+            name='cache_max_age',
+            field=models.PositiveIntegerField(
+                default=3600, help_text='Seconds a cached or permanent redirect may be reused without reaching us'
+            ),
+        ),
+    ]
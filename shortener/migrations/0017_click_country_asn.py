@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-18 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0016_link_redirect_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='click',
+            name='country',
+            field=models.CharField(blank=True, db_default='', default='', max_length=2),
+        ),
+        migrations.AddField(
+            model_name='click',
+            name='asn',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-18 22:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0017_click_country_asn'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='link',
+            name='click_count',
+            field=models.PositiveBigIntegerField(db_default=0, default=0),
+        ),
+        migrations.AddField(
+            model_name='link',
+            name='last_clicked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-18 23:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0018_link_click_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='link',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, help_text='Deleted by a periodic sweep once passed', null=True),
+        ),
+        migrations.AddField(
+            model_name='link',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(
+                condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='link_deleted_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(
+                condition=models.Q(('deleted_at__isnull', True), ('expires_at__isnull', False)),
+                fields=['expires_at'],
+                name='link_expiring_idx',
+            ),
+        ),
+    ]
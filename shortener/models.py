@@ -1,30 +1,118 @@
 from django.contrib.auth.models import User
 from django.db import models
 
+from .urlhash import url_hash
+
+
+class ActiveLinkManager(models.Manager):
+    """Links that are not deleted; deleted links wait for `purge.purge_deleted_links`."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 
 class Link(models.Model):
     """Map URLs to assigned slugs for authenticated users."""
 
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='links')
+    class RedirectMode(models.TextChoices):
+        # Every click reaches the server and is counted
+        TEMPORARY = 'temporary', '暫時轉址 (302，精確計數)'
+        # Clients and CDNs may reuse the redirect for `cache_max_age` seconds, so counts are approximate
+        CACHED = 'cached', '可快取轉址 (302)'
+        PERMANENT = 'permanent', '永久轉址 (301)'
+
+    # Indexed by `link_user_recent_idx`, which also serves lookups by user alone
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='links', db_index=False)
     url = models.URLField(max_length=2048, help_text='An url to be shorten')
     slug = models.CharField(
         max_length=7,
         unique=True,
         help_text='A random 7-character code (i.e. [a-zA-Z0-9])',
     )
+    url_hash = models.CharField(
+        max_length=64, editable=False, help_text='SHA-256 of the normalized URL, to find duplicates of a user'
+    )
+    redirect_mode = models.CharField(max_length=9, choices=RedirectMode.choices, default=RedirectMode.TEMPORARY)
+    cache_max_age = models.PositiveIntegerField(
+        default=3600, help_text='Seconds a cached or permanent redirect may be reused without reaching us'
+    )
+    # Maintained per click batch by `rollups.add_to_rollups`, see `reconcile_link_counters`
+    click_count = models.PositiveBigIntegerField(default=0, db_default=0)
+    last_clicked_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True, help_text='Deleted by a periodic sweep once passed')
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ActiveLinkManager()
+    # Includes deleted links, whose slugs stay taken until they are purged
+    all_objects = models.Manager()
+
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # A user's links, newest first (index page)
+            models.Index(fields=['user', '-created_at', '-id'], name='link_user_recent_idx'),
+            # A user's links for a URL (dedup)
+            models.Index(fields=['user', 'url_hash'], name='link_user_url_hash_idx'),
+            # Links waiting to be purged, and links to expire; both are small sets
+            models.Index(fields=['deleted_at'], name='link_deleted_idx', condition=models.Q(deleted_at__isnull=False)),
+            models.Index(
+                fields=['expires_at'],
+                name='link_expiring_idx',
+                condition=models.Q(expires_at__isnull=False, deleted_at__isnull=True),
+            ),
+        ]
+
+    @property
+    def counts_are_approximate(self) -> bool:
+        return self.redirect_mode != self.RedirectMode.TEMPORARY
+
+    def save(self, *args, **kwargs):
+        # Bulk inserts bypass save() and set url_hash themselves
+        self.url_hash = url_hash(self.url)
+        super().save(*args, **kwargs)
+
+
+class SlugPool(models.Model):
+    """Pre-generated slugs not assigned to any link yet, used by the `pool` slug allocator."""
+
+    slug = models.CharField(max_length=7, primary_key=True)
 
 
 class Click(models.Model):
     """Record click events on a shortened link."""
 
-    link = models.ForeignKey(Link, on_delete=models.CASCADE, related_name='clicks')
+    # Indexed by `click_link_recent_idx`, which also serves lookups by link alone
+    link = models.ForeignKey(Link, on_delete=models.CASCADE, related_name='clicks', db_index=False)
     ip = models.GenericIPAddressField()
+    # From the local IP range table (see shortener.iprange); empty or null when unknown
+    country = models.CharField(max_length=2, blank=True, default='', db_default='')
+    asn = models.PositiveIntegerField(null=True, blank=True)
     clicked_at = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        ordering = ['-clicked_at']
+        ordering = ['-clicked_at', '-id']
+        indexes = [
+            # A link's clicks, newest first (stats drill-down)
+            models.Index(fields=['link', '-clicked_at', '-id'], name='click_link_recent_idx'),
+        ]
+
+
+class ClickRollup(models.Model):
+    """Click counts of a link per hour or per local day, maintained at ingestion."""
+
+    class Period(models.TextChoices):
+        HOUR = 'hour'
+        DAY = 'day'
+
+    link = models.ForeignKey(Link, on_delete=models.CASCADE, related_name='rollups')
+    period = models.CharField(max_length=4, choices=Period.choices)
+    bucket = models.DateTimeField(help_text='Start of the hour (UTC) or of the day (TIME_ZONE)')
+    clicks = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['link', 'period', 'bucket'], name='unique_click_rollup'),
+        ]
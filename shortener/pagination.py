@@ -0,0 +1,90 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.db.models import Model, Q, QuerySet
+
+
+class KeysetPage:
+    """A page of rows ordered by (field, id) descending, linked by opaque cursors."""
+
+    def __init__(self, object_list: list[Model], next_cursor: str | None, previous_cursor: str | None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_cursor(direction: str, value: datetime, pk: int) -> str:
+    payload = json.dumps([direction, value.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple[str, datetime, int] | None:
+    """Return (direction, value, pk), or None for a missing or malformed cursor."""
+    if not cursor:
+        return None
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, value, pk = json.loads(payload)
+        if direction not in ('next', 'prev'):
+            return None
+        return direction, datetime.fromisoformat(value), int(pk)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+def keyset_query(queryset: QuerySet, field: str, cursor: str | None, per_page: int) -> QuerySet:
+    """Return the rows of the page at `cursor` plus one to tell whether more follow.
+
+    Rows before a `prev` cursor come back in ascending order.
+    """
+    position = decode_cursor(cursor)
+    if position is None:
+        return queryset.order_by(f'-{field}', '-id')[: per_page + 1]
+
+    direction, value, pk = position
+    # The leading `field <= value` (or >=) keeps the condition usable as an index range
+    if direction == 'next':
+        queryset = queryset.filter(Q(**{f'{field}__lte': value}), Q(**{f'{field}__lt': value}) | Q(id__lt=pk))
+        return queryset.order_by(f'-{field}', '-id')[: per_page + 1]
+    queryset = queryset.filter(Q(**{f'{field}__gte': value}), Q(**{f'{field}__gt': value}) | Q(id__gt=pk))
+    return queryset.order_by(field, 'id')[: per_page + 1]
+
+
+def paginate_keyset(queryset: QuerySet, field: str, cursor: str | None, per_page: int) -> KeysetPage:
+    """Fetch the page after or before `cursor` without OFFSET or COUNT(*).
+
+    Every page costs one index range scan on (field, id), however deep it is.
+    """
+    rows = list(keyset_query(queryset, field, cursor, per_page))
+    has_more, rows = len(rows) > per_page, rows[:per_page]
+    position = decode_cursor(cursor)
+    if position is None:
+        has_next, has_previous = has_more, False
+    elif position[0] == 'next':
+        has_next, has_previous = has_more, True
+    else:
+        rows.reverse()
+        has_next, has_previous = True, has_more
+
+    next_cursor = previous_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor('next', getattr(rows[-1], field), rows[-1].id)
+    if rows and has_previous:
+        previous_cursor = encode_cursor('prev', getattr(rows[0], field), rows[0].id)
+    return KeysetPage(rows, next_cursor, previous_cursor)
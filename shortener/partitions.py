@@ -0,0 +1,149 @@
+"""Monthly partitions of the click table (PostgreSQL) and click retention.
+
+Partitions span local months of TIME_ZONE, so every daily rollup falls in a single partition.
+"""
+
+import logging
+import re
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+
+from .models import Click
+from .rollups import day_bucket, recount_daily_rollups
+
+logger = logging.getLogger(__name__)
+
+PARTITION_SUFFIX = re.compile(r'_p(\d{4})_(\d{2})$')
+
+
+def month_start(moment: datetime, months: int = 0) -> datetime:
+    """Return the local midnight starting the month `months` after the one of `moment`."""
+    local = timezone.localtime(moment)
+    year, month = divmod(local.year * 12 + local.month - 1 + months, 12)
+    return timezone.make_aware(datetime(year, month + 1, 1))
+
+
+def partition_name(month: datetime) -> str:
+    return f'{Click._meta.db_table}_p{timezone.localtime(month):%Y_%m}'
+
+
+def is_partitioned() -> bool:
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [Click._meta.db_table])
+        return cursor.fetchone() is not None
+
+
+def list_partitions() -> dict[datetime, str]:
+    """Return the monthly partitions of the click table by the start of their month."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = inhrelid '
+            'WHERE inhparent = to_regclass(%s)',
+            [Click._meta.db_table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        if match := PARTITION_SUFFIX.search(name):
+            partitions[timezone.make_aware(datetime(int(match[1]), int(match[2]), 1))] = name
+    return partitions
+
+
+def create_partitions(months_ahead: int | None = None) -> list[str]:
+    """Create the partitions of this month and the next `months_ahead` ones; return the new ones.
+
+    Clicks of a month without a partition land in the default partition, and are moved
+    into the new partition when it is created.
+    """
+    months_ahead = settings.CLICK_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+    existing = list_partitions()
+    quote = connection.ops.quote_name
+    table = quote(Click._meta.db_table)
+    default = quote(f'{Click._meta.db_table}_default')
+
+    created = []
+    now = timezone.now()
+    for offset in range(months_ahead + 1):
+        start = month_start(now, offset)
+        if start in existing:
+            continue
+        name = partition_name(start)
+        # Literal bounds, as DDL cannot take bind parameters with psycopg 3
+        lower, upper = f"'{start.isoformat()}'", f"'{month_start(start, 1).isoformat()}'"
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'CREATE TABLE {quote(name)} (LIKE {table} INCLUDING DEFAULTS)')
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM {default} WHERE clicked_at >= {lower} AND clicked_at < {upper} '
+                f'RETURNING *) INSERT INTO {quote(name)} SELECT * FROM moved'
+            )
+            cursor.execute(
+                f'ALTER TABLE {table} ATTACH PARTITION {quote(name)} FOR VALUES FROM ({lower}) TO ({upper})'
+            )
+        logger.info('Created click partition %s.', name)
+        created.append(name)
+    return created
+
+
+def retention_start() -> datetime | None:
+    """Return the start of the oldest month whose clicks are kept, or None to keep all clicks."""
+    if not settings.CLICK_RETENTION_MONTHS:
+        return None
+    return month_start(timezone.now(), -settings.CLICK_RETENTION_MONTHS)
+
+
+def drop_partition(month: datetime, name: str) -> None:
+    """Recount the daily rollups of a partition's month, then drop the partition.
+
+    The drop takes an ACCESS EXCLUSIVE lock on the click table (PostgreSQL cannot detach
+    concurrently while the default partition exists), so it runs in a transaction of its
+    own after the recount has committed, and gives up after CLICK_PARTITION_LOCK_TIMEOUT
+    rather than queueing inserts behind it. A failed drop is recounted again on the next run.
+    """
+    with transaction.atomic():
+        recount_daily_rollups(month, month_start(month, 1))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"SET LOCAL lock_timeout = '{settings.CLICK_PARTITION_LOCK_TIMEOUT}s'")
+        cursor.execute(f'DROP TABLE {connection.ops.quote_name(name)}')
+
+
+def drop_expired_clicks() -> tuple[list[str], int]:
+    """Fold clicks older than the retention window into daily rollups, then delete them.
+
+    Expired partitions are dropped whole; remaining old clicks (the default partition, or
+    all clicks without partitioning) are deleted a day at a time. Each step recounts before
+    it deletes, so an interrupted run can simply be repeated. A busy partition stops the run.
+    Return the dropped partitions and the number of clicks deleted row by row.
+    """
+    cutoff = retention_start()
+    if cutoff is None:
+        return [], 0
+
+    dropped = []
+    if is_partitioned():
+        for month, name in sorted(list_partitions().items()):
+            if month_start(month, 1) > cutoff:
+                break
+            try:
+                drop_partition(month, name)
+            except OperationalError:
+                logger.warning('Click partition %s is busy, dropping it on the next run.', name, exc_info=True)
+                break
+            logger.info('Dropped click partition %s.', name)
+            dropped.append(name)
+
+    deleted = 0
+    expired = Click.objects.filter(clicked_at__lt=cutoff).order_by('clicked_at')
+    while (oldest := expired.values_list('clicked_at', flat=True).first()) is not None:
+        start = day_bucket(oldest)
+        end = min(day_bucket(start + timedelta(days=1, hours=12)), cutoff)
+        with transaction.atomic():
+            recount_daily_rollups(start, end)
+            deleted += Click.objects.filter(clicked_at__gte=start, clicked_at__lt=end).delete()[0]
+    if deleted:
+        logger.info('Deleted %d clicks older than %s.', deleted, cutoff)
+    return dropped, deleted
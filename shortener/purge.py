@@ -0,0 +1,84 @@
+"""Soft deletion of links, and purging their clicks in the background.
+
+Deleting a link with many clicks through the ORM cascade would load and delete every click
+in the request. Instead the link is marked deleted, which hides it from redirects and
+listings at once, and a periodic task deletes its clicks in bounded batches before the
+link row itself. Expired links are marked deleted by the same task.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .cache import invalidate_link
+from .metrics import PURGED_CLICKS
+from .models import Click, ClickRollup, Link
+
+logger = logging.getLogger(__name__)
+
+
+def soft_delete_links(links) -> int:
+    """Mark a queryset of links deleted and drop them from the slug cache."""
+    slugs = list(links.values_list('slug', flat=True))
+    deleted = Link.objects.filter(slug__in=slugs).update(deleted_at=timezone.now())
+    for slug in slugs:
+        invalidate_link(slug)
+    return deleted
+
+
+def sweep_expired_links() -> int:
+    """Soft-delete links whose expiry date has passed."""
+    return soft_delete_links(Link.objects.filter(expires_at__lte=timezone.now()))
+
+
+def purge_link(link_id: int, deadline: float) -> bool:
+    """Delete a deleted link's clicks in batches, then the link; return False if out of time.
+
+    Each batch commits on its own, so progress survives interruptions and repeated runs resume.
+    """
+    # Newest first through click_link_recent_idx; the time bounds of a batch let partitions be pruned
+    clicks = Click.objects.filter(link_id=link_id).order_by('-clicked_at', '-id').values_list('id', 'clicked_at')
+    while time.monotonic() < deadline:
+        batch = list(clicks[: settings.LINK_PURGE_BATCH_SIZE])
+        if not batch:
+            break
+        ids = [click_id for click_id, _ in batch]
+        deleted, _ = Click.objects.filter(
+            link_id=link_id, id__in=ids, clicked_at__gte=batch[-1][1], clicked_at__lte=batch[0][1]
+        ).delete()
+        PURGED_CLICKS.inc(amount=deleted)
+        logger.info('Purged %d clicks of deleted link %d.', deleted, link_id)
+    else:
+        return False
+
+    with transaction.atomic():
+        ClickRollup.objects.filter(link_id=link_id).delete()
+        # No clicks or rollups are left, so the cascade has nothing to collect
+        Link.all_objects.filter(id=link_id, deleted_at__isnull=False).delete()
+    logger.info('Purged deleted link %d.', link_id)
+    return True
+
+
+def purge_deleted_links() -> int:
+    """Purge deleted links, oldest deletion first, for up to LINK_PURGE_TIME_BUDGET seconds.
+
+    Return the number of links fully purged; the rest continue on the next run.
+    """
+    deadline = time.monotonic() + settings.LINK_PURGE_TIME_BUDGET
+    purged = 0
+    pending = Link.all_objects.filter(deleted_at__isnull=False).order_by('deleted_at').values_list('id', flat=True)
+    for link_id in pending[:100]:
+        if not purge_link(link_id, deadline):
+            break
+        purged += 1
+    return purged
+
+
+def pending_purges() -> list[tuple[str, int]]:
+    """Return (slug, clicks left) of links waiting to be purged."""
+    pending = Link.all_objects.filter(deleted_at__isnull=False).order_by('deleted_at')
+    return list(pending.annotate(clicks_left=Count('clicks')).values_list('slug', 'clicks_left'))
@@ -0,0 +1,221 @@
+import hashlib
+import ipaddress
+import logging
+import re
+from functools import wraps
+from typing import NamedTuple
+
+import redis
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from django_ratelimit import ALL
+from django_ratelimit.core import is_ratelimited
+from django_ratelimit.exceptions import Ratelimited
+
+from .metrics import RATELIMITED
+from .redis_client import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_PREFIX = 'rl:'
+
+# Generic cell rate algorithm (a token bucket holding `limit` requests, refilled evenly
+# over `period`) for every limit of a view at once. Each key stores the theoretical arrival
+# time in microseconds. A request is only counted when it passes all limits, so a blocked
+# client recovers at the configured rate. Returns the 1-based index of the first exceeded
+# limit, or 0.
+GCRA_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000000 + tonumber(time[2])
+local arrivals = {}
+for i, key in ipairs(KEYS) do
+    local period = tonumber(ARGV[2 * i - 1]) * 1000000
+    local interval = math.floor(period / tonumber(ARGV[2 * i]))
+    local arrival = math.max(tonumber(redis.call('GET', key)) or now, now) + interval
+    if arrival - now > period then
+        return i
+    end
+    arrivals[i] = arrival
+end
+for i, key in ipairs(KEYS) do
+    redis.call('SET', key, arrivals[i], 'PX', math.ceil((arrivals[i] - now) / 1000))
+end
+return 0
+"""
+GCRA_SHA = hashlib.sha1(GCRA_SCRIPT.encode()).hexdigest()
+
+# Rates and keys are read as django_ratelimit reads them, without relying on its private helpers
+RATE_RE = re.compile(r'(\d+)/(\d*)([smhd])?')
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+class Limit(NamedTuple):
+    group: str
+    key: object
+    rate: str
+    method: object
+    block: bool
+
+
+def _group(fn) -> str:
+    """Name limits after the view like django_ratelimit does, so both share counters in LocMemCache."""
+    return f'{fn.__module__}.{fn.__qualname__}'
+
+
+def _split_rate(rate: str | tuple[int, int]) -> tuple[int, int]:
+    """Return the request count and period in seconds of a rate such as '20/m' or '5/10s'."""
+    if isinstance(rate, tuple):
+        return rate
+    count, multiplier, period = RATE_RE.match(rate).groups()
+    return int(count), PERIODS[(period or 's').lower()] * int(multiplier or 1)
+
+
+def _method_matches(request, method) -> bool:
+    if method == ALL:
+        return True
+    methods = method if isinstance(method, (list, tuple)) else [method]
+    return request.method in [m.upper() for m in methods]
+
+
+def _client_ip(request) -> str:
+    """Return the client network, masked by RATELIMIT_IPV4_MASK or RATELIMIT_IPV6_MASK like django_ratelimit."""
+    ip_meta = getattr(settings, 'RATELIMIT_IP_META_KEY', None)
+    if not ip_meta:
+        ip = request.META['REMOTE_ADDR']
+    elif callable(ip_meta):
+        ip = ip_meta(request)
+    elif '.' in ip_meta:
+        ip = import_string(ip_meta)(request)
+    else:
+        ip = request.META[ip_meta]
+    mask = getattr(settings, 'RATELIMIT_IPV6_MASK', 64) if ':' in ip else getattr(settings, 'RATELIMIT_IPV4_MASK', 32)
+    return str(ipaddress.ip_network(f'{ip}/{mask}', strict=False).network_address)
+
+
+KEYS = {
+    'ip': _client_ip,
+    'user': lambda request: str(request.user.pk),
+    'user_or_ip': lambda request: str(request.user.pk) if request.user.is_authenticated else _client_ip(request),
+}
+
+
+def _key_value(limit: Limit, request) -> str:
+    if callable(limit.key):
+        return limit.key(limit.group, request)
+    return KEYS[limit.key](request)
+
+
+def _redis_call(request, limits: list[Limit]) -> tuple[list[str], list]:
+    keys, args = [], []
+    for limit in limits:
+        count, period = _split_rate(limit.rate)
+        keys.append(f'{REDIS_PREFIX}{limit.group}:{count}/{period}s:{_key_value(limit, request)}')
+        args += [period, count]
+    return keys, args
+
+
+def _fail(limits: list[Limit]) -> int:
+    logger.warning('Rate limit check failed for %s.', limits[0].group, exc_info=True)
+    return 0 if settings.RATELIMIT_FAIL_OPEN else 1
+
+
+def _check(request, limits: list[Limit]) -> int:
+    """Count the request against all `limits` in one Redis round trip.
+
+    Return the 1-based position of the first exceeded limit, or 0 if none is.
+    """
+    client = get_redis()
+    if client is None:
+        return _check_cache(request, limits)
+    keys, args = _redis_call(request, limits)
+    try:
+        try:
+            return int(client.evalsha(GCRA_SHA, len(keys), *keys, *args))
+        except redis.exceptions.NoScriptError:
+            return int(client.eval(GCRA_SCRIPT, len(keys), *keys, *args))
+    except redis.RedisError:
+        return _fail(limits)
+
+
+async def _acheck(request, limits: list[Limit]) -> int:
+    client = get_async_redis()
+    if client is None:
+        # The default LocMemCache does not block, so the check runs on the event loop
+        return _check_cache(request, limits)
+    keys, args = _redis_call(request, limits)
+    try:
+        try:
+            return int(await client.evalsha(GCRA_SHA, len(keys), *keys, *args))
+        except redis.exceptions.NoScriptError:
+            return int(await client.eval(GCRA_SCRIPT, len(keys), *keys, *args))
+    except redis.RedisError:
+        return _fail(limits)
+
+
+def _check_cache(request, limits: list[Limit]) -> int:
+    """Fixed-window counters of django_ratelimit in the default cache, used without Redis."""
+    for position, limit in enumerate(limits, 1):
+        if is_ratelimited(
+            request=request, group=limit.group, key=limit.key, rate=limit.rate, method=limit.method, increment=True
+        ):
+            return position
+    return 0
+
+
+def ratelimit(group=None, key=None, rate=None, method=ALL, block=True):
+    """Rate limit a sync or async view, with the arguments of `django_ratelimit.decorators.ratelimit`.
+
+    Keys are 'ip', 'user', 'user_or_ip' or a callable taking the group and the request.
+
+    With REDIS_URL set, limits are shared by all processes and stacked decorators are merged,
+    so all limits of a view are checked with one atomic script call. Without Redis, each limit
+    falls back to django_ratelimit's counters in the default cache.
+    """
+
+    def decorator(fn):
+        stacked = getattr(fn, 'ratelimit_wrapper', None) is fn
+        view = fn.__wrapped__ if stacked else fn
+        if not callable(key) and key not in KEYS:
+            raise ImproperlyConfigured(f'Unsupported rate limit key {key!r}.')
+        limit = Limit(group or _group(view), key, rate, method, block)
+        if stacked:
+            # The outer limit is checked first, as with nested wrappers
+            fn.ratelimits.insert(0, limit)
+            return fn
+
+        def applicable(request) -> list[Limit]:
+            if not getattr(settings, 'RATELIMIT_ENABLE', True):
+                return []
+            return [limit for limit in _wrapped.ratelimits if _method_matches(request, limit.method)]
+
+        def handle(request, limits: list[Limit], position: int):
+            request.limited = bool(position) or getattr(request, 'limited', False)
+            if position and limits[position - 1].block:
+                RATELIMITED.inc(view.__name__)
+                cls = getattr(settings, 'RATELIMIT_EXCEPTION_CLASS', Ratelimited)
+                raise (import_string(cls) if isinstance(cls, str) else cls)()
+
+        if iscoroutinefunction(fn):
+
+            @wraps(fn)
+            async def _wrapped(request, *args, **kw):
+                if limits := applicable(request):
+                    handle(request, limits, await _acheck(request, limits))
+                return await fn(request, *args, **kw)
+
+        else:
+
+            @wraps(fn)
+            def _wrapped(request, *args, **kw):
+                if limits := applicable(request):
+                    handle(request, limits, _check(request, limits))
+                return fn(request, *args, **kw)
+
+        _wrapped.ratelimits = [limit]
+        # Copied onto other decorators' wrappers by functools.wraps, so identity tells stacking apart
+        _wrapped.ratelimit_wrapper = _wrapped
+        return _wrapped
+
+    return decorator
@@ -0,0 +1,111 @@
+from collections import Counter
+from collections.abc import Iterable
+from datetime import UTC, datetime, timedelta
+
+from django.db import connection
+from django.db.models import Count
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from .models import Click, ClickRollup, Link
+
+Period = ClickRollup.Period
+
+
+def hour_bucket(moment: datetime) -> datetime:
+    return moment.astimezone(UTC).replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(moment: datetime) -> datetime:
+    return timezone.localtime(moment).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_to_rollups(clicks: Iterable[Click]) -> None:
+    """Add a batch of clicks to the hourly and daily rollups with one upsert per bucket,
+    and to the counters of their links with one update per link.
+    """
+    counts = Counter()
+    links = {}  # link id -> [clicks, last clicked_at]
+    for click in clicks:
+        counts[click.link_id, Period.HOUR, hour_bucket(click.clicked_at)] += 1
+        counts[click.link_id, Period.DAY, day_bucket(click.clicked_at)] += 1
+        link = links.setdefault(click.link_id, [0, click.clicked_at])
+        link[0] += 1
+        link[1] = max(link[1], click.clicked_at)
+    if not counts:
+        return
+
+    table = connection.ops.quote_name(ClickRollup._meta.db_table)
+    # Supported by both PostgreSQL and SQLite; the ORM's upsert can only overwrite the count
+    sql = (
+        f'INSERT INTO {table} (link_id, period, bucket, clicks) VALUES (%s, %s, %s, %s) '
+        f'ON CONFLICT (link_id, period, bucket) DO UPDATE SET clicks = {table}.clicks + EXCLUDED.clicks'
+    )
+    adapt = connection.ops.adapt_datetimefield_value
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            sql,
+            [(link_id, period, adapt(bucket), n) for (link_id, period, bucket), n in sorted(counts.items())],
+        )
+    _add_to_link_counters(links)
+
+
+def _add_to_link_counters(links: dict[int, list]) -> None:
+    # Relative increments, so concurrent batches only wait on each other's row locks, which
+    # are taken in id order like the rollups above; a viral link gets one update per batch.
+    table = connection.ops.quote_name(Link._meta.db_table)
+    sql = (
+        f'UPDATE {table} SET click_count = click_count + %s, last_clicked_at = CASE '
+        f'WHEN last_clicked_at IS NULL OR last_clicked_at < %s THEN %s ELSE last_clicked_at END WHERE id = %s'
+    )
+    adapt = connection.ops.adapt_datetimefield_value
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            sql, [(n, adapt(last), adapt(last), link_id) for link_id, (n, last) in sorted(links.items())]
+        )
+
+
+def recount_daily_rollups(start: datetime, end: datetime) -> None:
+    """Recount the daily rollups in [start, end) from raw clicks and drop the hourly ones.
+
+    Run before the clicks are deleted, after which daily rollups are their only record.
+    Both bounds must be local midnights so that no day is counted partially.
+    """
+    days = (
+        Click.objects.filter(clicked_at__gte=start, clicked_at__lt=end)
+        .annotate(bucket=TruncDay('clicked_at'))
+        .values('link_id', 'bucket')
+        .annotate(clicks=Count('id'))
+        .order_by()
+    )
+    ClickRollup.objects.bulk_create(
+        [ClickRollup(period=Period.DAY, **row) for row in days],
+        batch_size=2000,
+        update_conflicts=True,
+        unique_fields=['link', 'period', 'bucket'],
+        update_fields=['clicks'],
+    )
+    ClickRollup.objects.filter(period=Period.HOUR, bucket__gte=start, bucket__lt=end).delete()
+
+
+def get_click_summary(link: Link, days: int = 30, hours: int = 24) -> dict:
+    """Return the total and recent per-day and per-hour click series of a link."""
+    now = timezone.now()
+    first_day = day_bucket(now) - timedelta(days=days - 1)
+    first_hour = hour_bucket(now) - timedelta(hours=hours - 1)
+
+    daily = dict(link.rollups.filter(period=Period.DAY, bucket__gte=first_day).values_list('bucket', 'clicks'))
+    hourly = dict(link.rollups.filter(period=Period.HOUR, bucket__gte=first_hour).values_list('bucket', 'clicks'))
+
+    # Day buckets are compared as instants, so DST shifts in TIME_ZONE are handled by day_bucket
+    day_starts = [day_bucket(first_day + timedelta(days=i, hours=12)) for i in range(days)]
+    hour_starts = [first_hour + timedelta(hours=i) for i in range(hours)]
+    daily = [(start, daily.get(start, 0)) for start in day_starts]
+    hourly = [(start, hourly.get(start, 0)) for start in hour_starts]
+    return {
+        'total': link.click_count,  # Kept on the link, so the total needs no scan of its rollups
+        'daily': daily,
+        'daily_max': max(n for _, n in daily) or 1,
+        'hourly': hourly,
+        'hourly_max': max(n for _, n in hourly) or 1,
+    }
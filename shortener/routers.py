@@ -0,0 +1,109 @@
+"""Routing between the primary database and an optional read replica (DATABASE_REPLICA_URL).
+
+Reads stay on the primary unless code opts in with `replica_reads()`, as the read-heavy paths
+do: redirect lookups, the stats page and the link list. Writes always go to the primary.
+A request that writes shortener data gets a cookie pinning that client's replica reads to
+the primary for REPLICA_PIN_SECONDS, so users see their own changes despite replication lag.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+
+REPLICA = 'replica'
+PIN_COOKIE = 'pin_primary'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+# [pinned, wrote] of the current request, mutable so that views in sync_to_async threads update it
+_request_state = ContextVar('request_state', default=None)
+
+
+def has_replica() -> bool:
+    return REPLICA in settings.DATABASES
+
+
+@contextmanager
+def replica_reads():
+    """Send shortener reads in the block, or decorated function, to the replica if there is one."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or not has_replica():
+            return None
+        # Sessions, users and the like stay on the primary
+        if model._meta.app_label != 'shortener':
+            return None
+        state = _request_state.get()
+        if state is not None and state[0]:
+            return DEFAULT_DB_ALIAS
+        # Reads inside a transaction must see its own writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None and model._meta.app_label == 'shortener':
+            state[1] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # Both aliases hold the same data
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
+
+
+def _pin_if_written(response, state: list) -> None:
+    if state[1]:
+        response.set_cookie(
+            PIN_COOKIE,
+            '1',
+            max_age=settings.REPLICA_PIN_SECONDS,
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=True,
+            samesite='Lax',
+        )
+
+
+@sync_and_async_middleware
+def replica_pin_middleware(get_response):
+    """Keep replica reads of a client on the primary for a while after it writes."""
+    if not has_replica():
+        raise MiddlewareNotUsed
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            state = [PIN_COOKIE in request.COOKIES, False]
+            token = _request_state.set(state)
+            try:
+                response = await get_response(request)
+            finally:
+                _request_state.reset(token)
+            _pin_if_written(response, state)
+            return response
+
+    else:
+
+        def middleware(request):
+            state = [PIN_COOKIE in request.COOKIES, False]
+            token = _request_state.set(state)
+            try:
+                response = get_response(request)
+            finally:
+                _request_state.reset(token)
+            _pin_if_written(response, state)
+            return response
+
+    return middleware
@@ -0,0 +1,188 @@
+"""Reject lookups of slugs that cannot exist before they reach the database.
+
+Malformed slugs are rejected by shape. With REDIS_URL set, a Bloom filter of all slugs
+is kept as a Redis bitmap shared by every process, so a slug created by one worker is
+known to all of them at once. The filter answers "maybe" for slugs of deleted links
+until the periodic rebuild, which only costs the database query it would have saved.
+"""
+
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+
+from url_shortener.celery import app
+
+from .models import Link
+from .redis_client import get_redis
+from .slugs import ALPHABET, SLUG_LENGTH
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = 'slugfilter:lock'
+SLUG_RE = re.compile(f'[{re.escape(ALPHABET)}]{{{SLUG_LENGTH}}}')
+# Links created while a rebuild streams the table are added to the replaced filter only
+REBUILD_OVERLAP = timedelta(minutes=5)
+
+_last_build_request = float('-inf')
+
+
+def is_valid_slug(slug: str) -> bool:
+    return SLUG_RE.fullmatch(slug) is not None
+
+
+def filter_size() -> tuple[int, int]:
+    """Return the bit count and hash count for SLUG_FILTER_CAPACITY at SLUG_FILTER_ERROR_RATE."""
+    capacity, error_rate = settings.SLUG_FILTER_CAPACITY, settings.SLUG_FILTER_ERROR_RATE
+    bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+    return bits, max(1, round(bits / capacity * math.log(2)))
+
+
+def filter_key(suffix: str = '') -> str:
+    # Keyed by size, so a changed capacity starts from a missing filter instead of a wrong one
+    bits, hashes = filter_size()
+    return f'slugfilter:{bits}:{hashes}{suffix}'
+
+
+def bit_positions(slug: str) -> list[int]:
+    # Double hashing: k positions from two 64-bit halves of one digest
+    digest = hashlib.blake2b(slug.encode(), digest_size=16).digest()
+    first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+    bits, hashes = filter_size()
+    return [(first + i * second) % bits for i in range(hashes)]
+
+
+def _get_args(slug: str) -> list:
+    args = []
+    for position in bit_positions(slug):
+        args += ['GET', 'u1', position]
+    return args
+
+
+def queue_contains(pipe, slug: str) -> None:
+    """Queue the membership check of `slug` on a (sync or async) pipeline; see `parse_contains`."""
+    key = filter_key()
+    pipe.exists(key)
+    pipe.execute_command('BITFIELD', key, *_get_args(slug))
+
+
+def parse_contains(exists: int, bits: list[int]) -> bool:
+    """Return False only when the filter exists and rules the slug out.
+
+    A missing filter, as after a deploy or a Redis flush, rules nothing out and has a build queued.
+    """
+    if not exists:
+        _request_build()
+        return True
+    return all(bits)
+
+
+def _request_build() -> None:
+    """Queue a build of the missing filter, at most once per SLUG_FILTER_BUILD_RETRY in this process."""
+    global _last_build_request
+    now = time.monotonic()
+    if now - _last_build_request < settings.SLUG_FILTER_BUILD_RETRY:
+        return
+    _last_build_request = now
+    # Sent from a thread, as connecting to a broker that is down blocks for seconds
+    threading.Thread(target=_send_build_task, daemon=True).start()
+
+
+def _send_build_task() -> None:
+    try:
+        # By name, so that the redirect-only app needs no task modules
+        app.send_task('shortener.tasks.rebuild_slug_filter', retry=False)
+    except OperationalError:
+        logger.warning('Failed to queue a build of the slug filter.', exc_info=True)
+
+
+# Only sets bits of an existing filter: bits set on a missing key would create a filter
+# that rules out every slug added before.
+ADD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for _, position in ipairs(ARGV) do
+    redis.call('SETBIT', KEYS[1], position, 1)
+end
+return 1
+"""
+
+
+def _set_bits(client, key: str, slugs: list[str], chunk_size: int = 1000) -> None:
+    with client.pipeline(transaction=False) as pipe:
+        for start in range(0, len(slugs), chunk_size):
+            positions = [position for slug in slugs[start : start + chunk_size] for position in bit_positions(slug)]
+            pipe.eval(ADD_SCRIPT, 1, key, *positions)
+        pipe.execute()
+
+
+def add_slugs(slugs: list[str]) -> None:
+    """Add the slugs of new links to the filter once the current transaction commits.
+
+    After the commit, a concurrent rebuild either streams the links or adds them again
+    after swapping in the new filter.
+    """
+    if get_redis() is not None and settings.SLUG_FILTER_ENABLED and slugs:
+        transaction.on_commit(lambda: _add_slugs(slugs))
+
+
+def _add_slugs(slugs: list[str]) -> None:
+    client = get_redis()
+    try:
+        _set_bits(client, filter_key(), slugs)
+    except redis.RedisError:
+        # A slug missing from the filter would 404, so drop the filter until it is rebuilt
+        logger.warning('Failed to add slugs to the slug filter, dropping it.', exc_info=True)
+        try:
+            client.delete(filter_key())
+        except redis.RedisError:
+            logger.error('Failed to drop the slug filter; it may reject new slugs.', exc_info=True)
+
+
+def rebuild_filter(chunk_size: int = 10_000, force: bool = True) -> int | None:
+    """Build the filter from all slugs into a new key and swap it in.
+
+    Without `force`, only a missing filter or one close to expiring is rebuilt. Return
+    the number of slugs, or None when nothing was built.
+    """
+    client = get_redis()
+    if client is None or not settings.SLUG_FILTER_ENABLED:
+        return None
+    if not force and client.ttl(filter_key()) > settings.SLUG_FILTER_MAX_AGE / 2:
+        return None
+    if not client.set(LOCK_KEY, 1, nx=True, ex=60 * 60):
+        return None
+    try:
+        started = timezone.now()
+        key, build_key = filter_key(), filter_key(':building')
+        client.delete(build_key)
+        client.setbit(build_key, filter_size()[0] - 1, 0)  # Allocate the bitmap once instead of growing it
+        count = 0
+        batch = []
+        for slug in Link.objects.order_by().values_list('slug', flat=True).iterator(chunk_size=chunk_size):
+            batch.append(slug)
+            if len(batch) == chunk_size:
+                _set_bits(client, build_key, batch)
+                count += len(batch)
+                batch = []
+        _set_bits(client, build_key, batch)
+        count += len(batch)
+        # Expiry bounds how long slugs of deleted links pass, should rebuilds stop
+        client.expire(build_key, settings.SLUG_FILTER_MAX_AGE)
+        client.rename(build_key, key)
+        recent = Link.objects.filter(created_at__gte=started - REBUILD_OVERLAP).values_list('slug', flat=True)
+        _add_slugs(list(recent))
+        logger.info('Rebuilt the slug filter with %d slugs.', count)
+        return count
+    finally:
+        client.delete(LOCK_KEY)
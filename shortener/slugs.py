@@ -0,0 +1,193 @@
+import hashlib
+import logging
+import secrets
+import threading
+from functools import cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+
+from .models import Link, SlugPool
+
+logger = logging.getLogger(__name__)
+
+ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+SLUG_LENGTH = 7  # 62^7 = ~3.5 trillion
+SLUG_SPACE = len(ALPHABET) ** SLUG_LENGTH
+
+
+def encode_slug(number: int) -> str:
+    """Encode a number below SLUG_SPACE as a fixed-width base62 slug."""
+    chars = []
+    for _ in range(SLUG_LENGTH):
+        number, remainder = divmod(number, len(ALPHABET))
+        chars.append(ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+
+def decode_slug(slug: str) -> int:
+    """Return the number `encode_slug` encoded as `slug`."""
+    number = 0
+    for char in slug:
+        number = number * len(ALPHABET) + ALPHABET.index(char)
+    return number
+
+
+def random_slug() -> str:
+    return ''.join(secrets.choice(ALPHABET) for _ in range(SLUG_LENGTH))
+
+
+class SlugAllocator:
+    """Hands out slugs for new links."""
+
+    # Whether two calls can return the same slug, i.e. inserts may need a retry
+    collision_free = False
+
+    def allocate(self, count: int = 1) -> list[str]:
+        raise NotImplementedError
+
+
+class RandomSlugAllocator(SlugAllocator):
+    """Random slugs; collisions are retried by the caller and grow as the table fills."""
+
+    def allocate(self, count: int = 1) -> list[str]:
+        return [random_slug() for _ in range(count)]
+
+
+class FeistelPermutation:
+    """Keyed bijection over [0, space), the slug space by default.
+
+    A balanced Feistel network permutes numbers of an even bit width (42 bits for the slug
+    space); values falling outside the space are encrypted again (cycle walking), which
+    takes 1.25 rounds on average for the slug space.
+    """
+
+    rounds = 4
+
+    def __init__(self, key: bytes, space: int = SLUG_SPACE):
+        self.key = hashlib.blake2b(key, digest_size=32).digest()
+        self.space = space
+        self.half_bits = -(-(space - 1).bit_length() // 2)
+        self.mask = (1 << self.half_bits) - 1
+
+    def _round(self, value: int, round_index: int) -> int:
+        data = value.to_bytes(-(-self.half_bits // 8), 'big') + bytes([round_index])
+        digest = hashlib.blake2b(data, key=self.key, digest_size=4).digest()
+        return int.from_bytes(digest, 'big') & self.mask
+
+    def _encrypt(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.mask
+        for round_index in range(self.rounds):
+            left, right = right, left ^ self._round(right, round_index)
+        return (left << self.half_bits) | right
+
+    def permute(self, value: int) -> int:
+        if not 0 <= value < self.space:
+            raise ValueError(f'{value} is outside the permuted space.')
+        value = self._encrypt(value)
+        while value >= self.space:
+            value = self._encrypt(value)
+        return value
+
+
+class SequenceSlugAllocator(SlugAllocator):
+    """Map a database sequence through a keyed permutation: random-looking, never repeating.
+
+    The sequence increments by SLUG_SEQUENCE_BLOCK, so each process reserves a block
+    of numbers per query and creating a link is usually a single INSERT.
+    """
+
+    collision_free = True
+    sequence_name = 'shortener_slug_seq'
+
+    def __init__(self):
+        # Not SECRET_KEY: rotating it would change the permutation and collide with issued slugs
+        if not settings.SLUG_PERMUTATION_KEY:
+            raise ImproperlyConfigured('SLUG_PERMUTATION_KEY is required for sequence slugs.')
+        self.permutation = FeistelPermutation(settings.SLUG_PERMUTATION_KEY.encode())
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+
+    def _reserve_blocks(self, count: int) -> list[int]:
+        if connection.vendor != 'postgresql':
+            raise ImproperlyConfigured('Sequence slugs require PostgreSQL.')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT nextval(%s) FROM generate_series(1, %s)', [self.sequence_name, count])
+            return [row[0] for row in cursor.fetchall()]
+
+    def allocate(self, count: int = 1) -> list[str]:
+        block = settings.SLUG_SEQUENCE_BLOCK
+        numbers = []
+        with self._lock:
+            while len(numbers) < count:
+                if self._next == self._end:
+                    needed = count - len(numbers)
+                    starts = self._reserve_blocks(-(-needed // block))
+                    # Blocks handed out across processes interleave, each is used on its own
+                    for start in starts[:-1]:
+                        numbers.extend(range(start, start + block))
+                    self._next, self._end = starts[-1], starts[-1] + block
+                take = min(count - len(numbers), self._end - self._next)
+                numbers.extend(range(self._next, self._next + take))
+                self._next += take
+        return [encode_slug(self.permutation.permute(number)) for number in numbers[:count]]
+
+
+class PoolSlugAllocator(SlugAllocator):
+    """Take slugs from a pre-generated pool, refilled in bulk by `refill_slug_pool`."""
+
+    collision_free = True
+
+    def allocate(self, count: int = 1) -> list[str]:
+        table = connection.ops.quote_name(SlugPool._meta.db_table)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {table} WHERE slug IN '
+                    f'(SELECT slug FROM {table} LIMIT %s FOR UPDATE SKIP LOCKED) RETURNING slug',
+                    [count],
+                )
+                slugs = [row[0] for row in cursor.fetchall()]
+        else:
+            with transaction.atomic():
+                slugs = list(SlugPool.objects.values_list('slug', flat=True)[:count])
+                SlugPool.objects.filter(slug__in=slugs).delete()
+
+        if len(slugs) < count:
+            logger.warning('Slug pool ran dry, falling back to random slugs.')
+            slugs += RandomSlugAllocator().allocate(count - len(slugs))
+        return slugs
+
+
+def refill_slug_pool(target_size: int | None = None) -> int:
+    """Top the pool up to `target_size` with random slugs not in use; return how many were added."""
+    target_size = target_size or settings.SLUG_POOL_SIZE
+    initial_size = SlugPool.objects.count()
+    size = initial_size
+    while size < target_size:
+        candidates = set(RandomSlugAllocator().allocate(min(target_size - size, 10_000)))
+        candidates -= set(Link.all_objects.filter(slug__in=candidates).values_list('slug', flat=True))
+        SlugPool.objects.bulk_create([SlugPool(slug=slug) for slug in candidates], ignore_conflicts=True)
+        size = SlugPool.objects.count()
+    return size - initial_size
+
+
+ALLOCATORS = {
+    'random': RandomSlugAllocator,
+    'sequence': SequenceSlugAllocator,
+    'pool': PoolSlugAllocator,
+}
+
+
+@cache
+def _allocator(name: str) -> SlugAllocator:
+    try:
+        return ALLOCATORS[name]()
+    except KeyError:
+        raise ImproperlyConfigured(f'Unknown slug allocator {name!r}.') from None
+
+
+def get_slug_allocator(name: str | None = None) -> SlugAllocator:
+    """Return the allocator named by SLUG_ALLOCATOR (or `name`), shared per process."""
+    return _allocator(name or settings.SLUG_ALLOCATOR)
@@ -1,17 +1,47 @@
 from datetime import datetime
 
 from celery import shared_task
-from django.db import IntegrityError
+from django.conf import settings
 
-from .models import Click
+from . import partitions, purge, slugfilter, slugs
+from .ingest import ClickRecord, drain_click_stream, store_clicks
 
 
 @shared_task(ignore_result=True)
 def record_click(target_link_id: int, user_ip: str, clicked_at: datetime):
-    """Record a click event for a link."""
+    """Record a click event for a link, used when the click stream is unavailable."""
+    store_clicks([ClickRecord(link_id=target_link_id, ip=user_ip, clicked_at=clicked_at)])
 
-    try:
-        Click.objects.create(link_id=target_link_id, ip=user_ip, clicked_at=clicked_at)
-    except IntegrityError:
-        # TODO: use logger instead.
-        print('Link ID not found.')
+
+@shared_task(ignore_result=True)
+def flush_clicks():
+    """Drain buffered click events from the Redis stream into the database."""
+    return drain_click_stream()
+
+
+@shared_task(ignore_result=True)
+def refill_slug_pool():
+    """Keep the pre-generated slug pool full when the `pool` allocator is in use."""
+    if settings.SLUG_ALLOCATOR == 'pool':
+        return slugs.refill_slug_pool()
+
+
+@shared_task(ignore_result=True, soft_time_limit=60 * 30, time_limit=60 * 35)
+def maintain_clicks():
+    """Create upcoming click partitions and drop clicks past the retention window."""
+    if partitions.is_partitioned():
+        partitions.create_partitions()
+    partitions.drop_expired_clicks()
+
+
+@shared_task(ignore_result=True, soft_time_limit=60 * 30, time_limit=60 * 35)
+def rebuild_slug_filter():
+    """Build the slug filter when it is missing or half-way to expiring."""
+    return slugfilter.rebuild_filter(force=False)
+
+
+@shared_task(ignore_result=True, soft_time_limit=60 * 5, time_limit=60 * 6)
+def purge_links():
+    """Soft-delete expired links, then purge the clicks and rows of deleted links."""
+    purge.sweep_expired_links()
+    return purge.purge_deleted_links()
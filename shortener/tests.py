@@ -1,3 +1,1466 @@
-from django.test import TestCase
+import base64
+import csv
+import fcntl
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time as time_module
+from datetime import UTC, datetime, time, timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import fakeredis
+import redis
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django_ratelimit.core import is_ratelimited
+from django_ratelimit.decorators import ratelimit as django_ratelimit
+from django_ratelimit.exceptions import Ratelimited
+from kombu.exceptions import OperationalError
+
+from url_shortener import redirect_settings
+
+from . import cache, clickqueue, ingest, leaderboard, metrics, partitions, purge, slugfilter, tasks, visitors
+from .models import Click, ClickRollup, Link
+from .pagination import decode_cursor, encode_cursor, keyset_query, paginate_keyset
+from .ratelimit import KEYS, _split_rate, ratelimit
+from .rollups import add_to_rollups, day_bucket, get_click_summary, hour_bucket
+from .routers import PIN_COOKIE, REPLICA, ReplicaRouter, replica_pin_middleware, replica_reads
+from .slugs import SLUG_SPACE, FeistelPermutation, SequenceSlugAllocator, decode_slug, encode_slug
+from .urlhash import url_hash
+from .views import create_links_in_bulk, create_new_link, find_existing_links
+
+
+class QueryPlanTests(TestCase):
+    """Guard the index access paths of the hot queries against model changes.
+
+    Plans depend on table statistics, so the tables are seeded with a realistic
+    shape (many users, links and clicks) and analyzed before explaining.
+    """
+
+    users = 50
+    links_per_user = 20
+    clicks_per_link = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        users = User.objects.bulk_create(User(username=f'user{i}') for i in range(cls.users))
+        links = Link.objects.bulk_create(
+            Link(
+                user=user,
+                url=f'https://example.com/{user.pk}/{i}',
+                url_hash=url_hash(f'https://example.com/{user.pk}/{i}'),
+                slug=f'{user.pk:03d}{i:04d}',
+            )
+            for user in users
+            for i in range(cls.links_per_user)
+        )
+        Click.objects.bulk_create(
+            (
+                Click(link=link, ip='127.0.0.1', clicked_at=now - timedelta(minutes=i))
+                for link in links
+                for i in range(cls.clicks_per_link)
+            ),
+            batch_size=5000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.user = users[0]
+        cls.link = links[0]
+
+    def index_names(self, index_name: str) -> list[str]:
+        """Return the index and, on a partitioned table, its per-partition indexes."""
+        names = [index_name]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(%s)', [index_name]
+                )
+                names += [row[0] for row in cursor.fetchall()]
+        return names
+
+    def assertUsesIndex(self, queryset, index_name: str):
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in self.index_names(index_name)), plan)
+        if connection.vendor == 'postgresql':
+            # A Sort node, not the `Sort Key` of a Merge Append over partitions
+            self.assertNotRegex(plan, r'(?m)^\s*(->\s+)?(Incremental )?Sort\s+\(')
+        elif connection.vendor == 'sqlite':
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def second_page_query(self, queryset, field: str, per_page: int):
+        """Return the query `paginate_keyset` runs for the page after the first."""
+        cursor = paginate_keyset(queryset, field, None, per_page).next_cursor
+        return keyset_query(queryset, field, cursor, per_page)
+
+    def test_recent_clicks_of_link(self):
+        self.assertUsesIndex(keyset_query(self.link.clicks.all(), 'clicked_at', None, 30), 'click_link_recent_idx')
+
+    def test_click_keyset_page(self):
+        queryset = self.second_page_query(self.link.clicks.all(), 'clicked_at', 10)
+        self.assertUsesIndex(queryset, 'click_link_recent_idx')
+
+    def test_recent_links_of_user(self):
+        self.assertUsesIndex(keyset_query(self.user.links.all(), 'created_at', None, 10), 'link_user_recent_idx')
+
+    def test_link_keyset_page(self):
+        queryset = self.second_page_query(self.user.links.all(), 'created_at', 5)
+        self.assertUsesIndex(queryset, 'link_user_recent_idx')
+
+    def test_link_of_user_by_url_hash(self):
+        queryset = self.user.links.filter(url_hash__in=[self.link.url_hash]).order_by()
+        self.assertUsesIndex(queryset, 'link_user_url_hash_idx')
+        self.assertEqual(find_existing_links(self.user, [self.link.url_hash]), {self.link.url_hash: self.link})
+
+    def unique_index_name(self, column: str) -> str:
+        """Return the name the backend gave the index of a `unique=True` Link column."""
+        table = Link._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                # Inline UNIQUE constraints are unnamed to Django's introspection on SQLite
+                cursor.execute(f'PRAGMA index_list({table})')
+                for name in [row[1] for row in cursor.fetchall() if row[2]]:
+                    cursor.execute(f'PRAGMA index_info({name})')
+                    if [row[2] for row in cursor.fetchall()] == [column]:
+                        return name
+            constraints = connection.introspection.get_constraints(cursor, table)
+        return next(
+            name
+            for name, constraint in constraints.items()
+            if constraint['columns'] == [column] and constraint['unique'] and not constraint['primary_key']
+        )
+
+    def test_link_by_slug(self):
+        self.assertUsesIndex(Link.objects.filter(slug=self.link.slug), self.unique_index_name('slug'))
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='pages')
+        Link.objects.bulk_create(
+            Link(user=cls.user, url=f'https://example.com/{i}', slug=f'page{i:03d}') for i in range(7)
+        )
+        # Ties on created_at are ordered by id alone
+        cls.moment = timezone.now()
+        cls.user.links.update(created_at=cls.moment)
+
+    def test_cursor_round_trips(self):
+        cursor = encode_cursor('next', self.moment, 42)
+        self.assertEqual(decode_cursor(cursor), ('next', self.moment, 42))
+
+    def test_tampered_or_malformed_cursor_is_ignored(self):
+        payloads = [['sideways', self.moment.isoformat(), 1], ['next', 'yesterday', 1], ['next', 1], {'a': 1}]
+        cursors = ['', 'not base64!', base64.urlsafe_b64encode(b'[').decode()]
+        cursors += [base64.urlsafe_b64encode(json.dumps(payload).encode()).decode() for payload in payloads]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(decode_cursor(cursor))
+                page = paginate_keyset(self.user.links.all(), 'created_at', cursor, 3)
+                self.assertFalse(page.has_previous)
+
+    def test_ties_are_paged_by_id(self):
+        ids = sorted(self.user.links.values_list('id', flat=True), reverse=True)
+        pages, cursor = [], None
+        while True:
+            page = paginate_keyset(self.user.links.all(), 'created_at', cursor, 3)
+            pages.append([link.id for link in page])
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(pages, [ids[:3], ids[3:6], ids[6:]])
+
+        page = paginate_keyset(self.user.links.all(), 'created_at', page.previous_cursor, 3)
+        self.assertEqual([link.id for link in page], ids[3:6])
+        self.assertTrue(page.has_next)
+        self.assertTrue(page.has_previous)
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    """Routing decisions between the primary and a replica alias, configured or not.
+
+    Outside of TestCase's transaction, as reads in a transaction stay on the primary.
+    """
+
+    databases = {DEFAULT_DB_ALIAS}
+
+    def setUp(self):
+        patcher = mock.patch('shortener.routers.has_replica', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = ReplicaRouter()
+
+    def test_reads_use_replica_only_when_opted_in(self):
+        self.assertIsNone(self.router.db_for_read(Link))
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Link), REPLICA)
+            self.assertIsNone(self.router.db_for_read(User))  # Not shortener data
+        self.assertEqual(self.router.db_for_write(Link), DEFAULT_DB_ALIAS)
+        self.assertFalse(self.router.allow_migrate(REPLICA, 'shortener'))
+
+    def test_reads_in_transaction_use_primary(self):
+        with replica_reads(), transaction.atomic():
+            self.assertEqual(self.router.db_for_read(Link), DEFAULT_DB_ALIAS)
+
+    def test_write_pins_client_to_primary(self):
+        routed = []
+
+        def write(request):
+            self.router.db_for_write(Link)  # As saving a link does
+            return HttpResponse()
+
+        def read(request):
+            with replica_reads():
+                routed.append(self.router.db_for_read(Link))
+            return HttpResponse()
+
+        response = replica_pin_middleware(write)(RequestFactory().post('/'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        response = replica_pin_middleware(read)(RequestFactory().get('/'))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        request = RequestFactory().get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        replica_pin_middleware(read)(request)
+        self.assertEqual(routed, [REPLICA, DEFAULT_DB_ALIAS])
+
+    def test_lookup_retries_replica_miss_on_primary(self):
+        with mock.patch.object(cache, '_load_link', side_effect=[None, 'primary']) as load:
+            self.assertEqual(cache.load_link('abcdefg'), ('primary', DEFAULT_DB_ALIAS))
+        load.assert_has_calls([mock.call('abcdefg', REPLICA), mock.call('abcdefg', DEFAULT_DB_ALIAS)])
+
+    def test_replica_reads_expire_soon_in_shared_cache(self):
+        self.assertEqual(cache.shared_timeout(DEFAULT_DB_ALIAS), settings.LINK_CACHE_TIMEOUT)
+        self.assertEqual(cache.shared_timeout(REPLICA), settings.LINK_CACHE_REPLICA_TIMEOUT)
+
+
+class ExportClicksTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='owner')
+        cls.other = User.objects.create(username='other')
+        cls.link = Link.objects.create(
+            user=cls.owner, url='https://example.com/', url_hash=url_hash('https://example.com/'), slug='abcdefg'
+        )
+        today = timezone.localdate()
+        cls.days = [today - timedelta(days=2), today - timedelta(days=1), today]
+        Click.objects.bulk_create(
+            Click(link=cls.link, ip=f'10.0.0.{i}', clicked_at=timezone.make_aware(datetime.combine(day, time(12))))
+            for i, day in enumerate(cls.days)
+        )
+
+    async def export(self, user: User, query: str):
+        await self.async_client.aforce_login(user)
+        response = await self.async_client.get(f'/abcdefg/stats/export/?{query}', secure=True)
+        if not response.streaming:
+            return response, None
+        return response, b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+    async def test_csv_of_date_range(self):
+        start, end = self.days[1], self.days[2]
+        response, body = await self.export(self.owner, f'format=csv&start={start}&end={end}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment; filename="abcdefg-clicks.csv"', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(body)))
+        self.assertEqual(rows[0], ['clicked_at', 'ip', 'country', 'asn'])
+        self.assertEqual([row[1] for row in rows[1:]], ['10.0.0.1', '10.0.0.2'])
+
+    async def test_ndjson(self):
+        response, body = await self.export(self.owner, 'format=ndjson')
+        records = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([record['ip'] for record in records], ['10.0.0.0', '10.0.0.1', '10.0.0.2'])
+
+    async def test_requires_owner_and_valid_arguments(self):
+        response, _ = await self.export(self.other, 'format=csv')
+        self.assertEqual(response.status_code, 404)
+        response, _ = await self.export(self.owner, 'format=xml')
+        self.assertEqual(response.status_code, 400)
+        response, _ = await self.export(self.owner, 'start=yesterday')
+        self.assertEqual(response.status_code, 400)
+
+
+class ImportClicksTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='importer')
+        cls.link = Link.objects.create(
+            user=user, url='https://example.com/', url_hash=url_hash('https://example.com/'), slug='abcdefg'
+        )
+
+    def import_clicks(self, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as file:
+            file.write('link,ip,clicked_at\nabcdefg,10.0.0.1,2026-01-02T03:04:05+00:00\n')
+            file.flush()
+            call_command('import_data', 'clicks', '--format', 'csv', '--input', file.name, *args, stderr=io.StringIO())
+        return list(Click.objects.filter(link=self.link).values_list('ip', 'country', 'asn'))
+
+    def test_clicks_without_location(self):
+        with self.settings(IP_RANGES_PATH=None):
+            self.assertEqual(self.import_clicks(), [('10.0.0.1', '', None)])
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY needs PostgreSQL.')
+    def test_copy_clicks_without_location(self):
+        with self.settings(IP_RANGES_PATH=None):
+            self.assertEqual(self.import_clicks('--copy'), [('10.0.0.1', '', None)])
+
+
+class TransferLinksTests(TestCase):
+    fields = [
+        'slug', 'url', 'user__username', 'redirect_mode', 'cache_max_age', 'expires_at', 'deleted_at', 'created_at'
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='mover')
+        Link.objects.create(user=user, url='https://example.com/a', slug='plainly')
+        Link.objects.create(
+            user=user,
+            url='https://example.com/b',
+            slug='settled',
+            redirect_mode=Link.RedirectMode.PERMANENT,
+            cache_max_age=60,
+            expires_at=timezone.now() + timedelta(days=7),
+        )
+        Link.objects.create(user=user, url='https://example.com/c', slug='deleted', deleted_at=timezone.now())
+
+    def test_round_trip(self):
+        expected = list(Link.all_objects.order_by('slug').values_list(*self.fields))
+        for fmt in ('jsonl', 'csv'):
+            with self.subTest(format=fmt), tempfile.NamedTemporaryFile(suffix=f'.{fmt}') as file:
+                call_command('export_data', 'links', '--format', fmt, '--output', file.name, stderr=io.StringIO())
+                Link.all_objects.all().delete()
+                call_command('import_data', 'links', '--format', fmt, '--input', file.name, stderr=io.StringIO())
+                self.assertEqual(list(Link.all_objects.order_by('slug').values_list(*self.fields)), expected)
+                self.assertEqual(sorted(Link.objects.values_list('slug', flat=True)), ['plainly', 'settled'])
+
+    def test_export_format(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.csv') as file:
+            call_command('export_data', 'links', '--format', 'csv', '--output', file.name, stderr=io.StringIO())
+            rows = list(csv.DictReader(file))
+        self.assertEqual(list(rows[0]), ['slug', 'url', 'user', *self.fields[3:]])
+        self.assertEqual([row['slug'] for row in rows], ['plainly', 'settled', 'deleted'])
+        self.assertEqual(rows[0]['user'], 'mover')
+        self.assertEqual([rows[0]['cache_max_age'], rows[0]['expires_at'], rows[0]['deleted_at']], ['3600', '', ''])
+
+
+@override_settings(RATELIMIT_ENABLE=False)
+class BulkShortenTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='bulk')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def upload(self, content: str):
+        file = io.BytesIO(content.encode())
+        file.name = 'urls.csv'
+        return self.client.post('/bulk/', {'csv_file': file}, secure=True)
+
+    def test_csv_over_limit_is_rejected(self):
+        with self.settings(BULK_SHORTEN_MAX_URLS=2):
+            self.assertEqual(self.upload('url\nhttps://a.example/\nhttps://b.example/\n').status_code, 200)
+            response = self.upload('https://a.example/\nhttps://b.example/\nhttps://c.example/\n')
+            self.assertEqual(response.status_code, 400)
+
+    def test_slug_exhaustion_is_unavailable(self):
+        with mock.patch('shortener.views.create_links_in_bulk', side_effect=IntegrityError):
+            response = self.client.post(
+                '/bulk/', {'urls': ['https://a.example/']}, content_type='application/json', secure=True
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('error', response.json())
+
+
+@override_settings(LINK_DEDUP=True)
+class LinkDedupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='dedup')
+
+    def test_reuses_only_links_with_same_settings(self):
+        url = 'https://example.com/'
+        temporary = create_new_link(self.user, url, redirect_mode=Link.RedirectMode.TEMPORARY)
+        self.assertEqual(create_new_link(self.user, url), temporary)
+        self.assertEqual(create_links_in_bulk(self.user, [url]), [temporary])
+
+        permanent = create_new_link(self.user, url, redirect_mode=Link.RedirectMode.PERMANENT)
+        self.assertNotEqual(permanent, temporary)
+        self.assertEqual(create_new_link(self.user, url, redirect_mode=Link.RedirectMode.PERMANENT), permanent)
+        expiring = create_new_link(self.user, url, expires_at=timezone.now() + timedelta(days=1))
+        self.assertNotIn(expiring, (temporary, permanent))
+
+
+class SequenceSlugTests(SimpleTestCase):
+    def test_permutation_is_bijection(self):
+        for space in (1000, 1024):
+            permutation = FeistelPermutation(b'key', space=space)
+            self.assertEqual(sorted(permutation.permute(value) for value in range(space)), list(range(space)))
+        self.assertNotEqual(
+            [FeistelPermutation(b'key', space=1000).permute(value) for value in range(10)],
+            [FeistelPermutation(b'other', space=1000).permute(value) for value in range(10)],
+        )
+
+    def test_slug_round_trips(self):
+        permutation = FeistelPermutation(b'key')
+        for number in (0, 1, 12345, SLUG_SPACE - 1, permutation.permute(SLUG_SPACE - 1)):
+            slug = encode_slug(number)
+            self.assertEqual(len(slug), 7)
+            self.assertEqual(decode_slug(slug), number)
+
+    @override_settings(SLUG_PERMUTATION_KEY=None)
+    def test_key_is_required(self):
+        with self.assertRaises(ImproperlyConfigured):
+            SequenceSlugAllocator()
+
+
+def limited_view(*rates: str):
+    """Return a sync view with stacked per-IP limits, outermost first."""
+
+    def view(request):
+        return HttpResponse()
+
+    for rate in reversed(rates):
+        view = ratelimit(key='ip', rate=rate)(view)
+    return view
+
+
+@override_settings(RATELIMIT_ENABLE=True, RATELIMIT_FAIL_OPEN=True)
+class RateLimitTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        patcher = mock.patch('shortener.ratelimit.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.request = RequestFactory().get('/')
+
+    def test_burst_then_reject(self):
+        view = limited_view('3/m')
+        for _ in range(3):
+            self.assertEqual(view(self.request).status_code, 200)
+        with self.assertRaises(Ratelimited):
+            view(self.request)
+
+    def test_recovers_after_interval(self):
+        view = limited_view('5/s')
+        for _ in range(5):
+            view(self.request)
+        with self.assertRaises(Ratelimited):
+            view(self.request)
+        time_module.sleep(0.25)  # One request is let through every 200ms
+        self.assertEqual(view(self.request).status_code, 200)
+        with self.assertRaises(Ratelimited):
+            view(self.request)
+
+    def test_stacked_limits_in_one_call(self):
+        view = limited_view('100/m', '2/m')
+        with mock.patch.object(self.redis, 'evalsha', wraps=self.redis.evalsha) as evalsha:
+            view(self.request)
+            view(self.request)
+            with self.assertRaises(Ratelimited):
+                view(self.request)
+        self.assertEqual(evalsha.call_count, 3)
+        self.assertEqual({call.args[1] for call in evalsha.call_args_list}, {2})  # Keys per call
+
+    async def test_async_view(self):
+        @ratelimit(key='ip', rate='100/m')
+        @ratelimit(key='ip', rate='1/m')
+        async def view(request):
+            return HttpResponse()
+
+        client = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer())
+        with mock.patch('shortener.ratelimit.get_async_redis', return_value=client):
+            self.assertEqual((await view(self.request)).status_code, 200)
+            with self.assertRaises(Ratelimited):
+                await view(self.request)
+
+    def test_falls_back_to_cache_without_redis(self):
+        view = limited_view('2/m')
+        caches['default'].clear()
+        with (
+            mock.patch('shortener.ratelimit.get_redis', return_value=None),
+            mock.patch('shortener.ratelimit.is_ratelimited', wraps=is_ratelimited) as fallback,
+        ):
+            view(self.request)
+            view(self.request)
+            with self.assertRaises(Ratelimited):
+                view(self.request)
+        self.assertEqual(fallback.call_count, 3)
+
+    def test_redis_errors_fail_open_or_closed(self):
+        broken = mock.Mock(evalsha=mock.Mock(side_effect=redis.ConnectionError))
+        view = limited_view('1/m')
+        with mock.patch('shortener.ratelimit.get_redis', return_value=broken), self.assertLogs('shortener.ratelimit'):
+            for _ in range(2):
+                self.assertEqual(view(self.request).status_code, 200)
+            with self.settings(RATELIMIT_FAIL_OPEN=False), self.assertRaises(Ratelimited):
+                view(self.request)
+
+    def test_keys_and_rates_read_like_django_ratelimit(self):
+        rates = ['7/s', '60/m', '5/10s', '2/h', '3/d']
+        self.assertEqual([_split_rate(rate) for rate in rates], [(7, 1), (60, 60), (5, 10), (2, 3600), (3, 86400)])
+        self.assertEqual(KEYS['ip'](self.request), '127.0.0.1')
+        with self.settings(RATELIMIT_IPV6_MASK=48):
+            self.assertEqual(KEYS['ip'](RequestFactory().get('/', REMOTE_ADDR='2001:db8:1:2::1')), '2001:db8:1::')
+        with self.assertRaises(ImproperlyConfigured):
+            ratelimit(key='header:x-real-ip', rate='1/s')(limited_view())
+
+
+@override_settings(RATELIMIT_ENABLE=True)
+class RedirectRateLimitTests(TestCase):
+    """Without Redis, the async redirect must limit exactly like django_ratelimit's own decorator."""
+
+    group = 'shortener.redirects.redirect_url'
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='limited')
+        Link.objects.create(user=user, url='https://example.com/', slug='limited')
+
+    def setUp(self):
+        caches['default'].clear()
+        for patcher in (
+            mock.patch('shortener.ratelimit.get_async_redis', return_value=None),
+            mock.patch('shortener.redirects.submit_click', return_value=True),
+            mock.patch('django_ratelimit.core.time.time', return_value=1_800_000_000),  # One window throughout
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_blocks_like_django_ratelimit(self):
+        statuses = []
+        with mock.patch.object(LocMemCache, 'add', autospec=True, side_effect=LocMemCache.add) as add:
+            while 403 not in statuses:
+                response = await self.async_client.get('/limited/', secure=True)
+                statuses.append(response.status_code)
+        keys = [call.args[1] for call in add.call_args_list]
+
+        @django_ratelimit(group=self.group, key='ip', rate='7/s', method='GET')
+        @django_ratelimit(group=self.group, key='ip', rate='60/m', method='GET')
+        def reference(request):
+            return HttpResponse()
+
+        caches['default'].clear()
+        request = RequestFactory().get('/limited/')  # From 127.0.0.1, like the test client
+        with mock.patch.object(LocMemCache, 'add', autospec=True, side_effect=LocMemCache.add) as add:
+            for _ in range(len(statuses) - 1):
+                reference(request)
+            with self.assertRaises(Ratelimited):
+                reference(request)
+        self.assertEqual(statuses, [302] * 7 + [403])
+        self.assertEqual(keys, [call.args[1] for call in add.call_args_list])
+
+
+@override_settings(SLUG_FILTER_ENABLED=True, SLUG_FILTER_CAPACITY=1000)
+class SlugFilterTests(TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        self.send_build_task = slugfilter._send_build_task
+        self.build_requests = threading.Semaphore(0)
+        for patcher in (
+            mock.patch('shortener.slugfilter.get_redis', return_value=self.redis),
+            mock.patch('shortener.slugfilter._send_build_task', side_effect=self.build_requests.release),
+            mock.patch('shortener.slugfilter._last_build_request', float('-inf')),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.user = User.objects.create(username='filter')
+
+    def contains(self, slug: str) -> bool:
+        with self.redis.pipeline(transaction=False) as pipe:
+            slugfilter.queue_contains(pipe, slug)
+            return slugfilter.parse_contains(*pipe.execute())
+
+    def test_is_valid_slug(self):
+        self.assertTrue(slugfilter.is_valid_slug('aZ09bY8'))
+        for slug in ('aZ09bY', 'aZ09bY8c', 'aZ09-Y8', 'aZ09bY8\n'):
+            self.assertFalse(slugfilter.is_valid_slug(slug), slug)
+
+    def test_parse_contains(self):
+        self.assertTrue(slugfilter.parse_contains(0, [0, 0]))  # No filter rules nothing out
+        self.assertTrue(slugfilter.parse_contains(1, [1, 1]))
+        self.assertFalse(slugfilter.parse_contains(1, [1, 0]))
+
+    def test_missing_filter_queues_a_build(self):
+        Link.objects.create(user=self.user, url='https://example.com/', slug='aaaaaaa')
+        with mock.patch('shortener.slugfilter.time.monotonic', return_value=1000):
+            self.assertTrue(self.contains('bbbbbbb'))
+            self.assertTrue(self.contains('ccccccc'))
+        with mock.patch('shortener.slugfilter.time.monotonic', return_value=1000 + settings.SLUG_FILTER_BUILD_RETRY):
+            self.assertTrue(self.contains('ddddddd'))
+        for _ in range(2):  # Once per SLUG_FILTER_BUILD_RETRY
+            self.assertTrue(self.build_requests.acquire(timeout=5))
+        self.assertFalse(self.build_requests.acquire(timeout=0.1))
+
+        self.assertEqual(slugfilter.rebuild_filter(force=False), 1)  # As the queued task does
+        self.assertTrue(self.contains('aaaaaaa'))
+        self.assertFalse(self.contains('bbbbbbb'))
+        self.assertFalse(self.build_requests.acquire(timeout=0.1))
+
+    def test_build_request_sends_the_task_by_name(self):
+        with mock.patch.object(slugfilter.app, 'send_task') as send_task:
+            self.send_build_task()
+        send_task.assert_called_once_with('shortener.tasks.rebuild_slug_filter', retry=False)
+        with (
+            mock.patch.object(slugfilter.app, 'send_task', side_effect=OperationalError),
+            self.assertLogs('shortener.slugfilter', 'WARNING'),
+        ):
+            self.send_build_task()
+
+    def test_adding_does_not_create_filter(self):
+        slugfilter._add_slugs(['aaaaaaa'])
+        self.assertFalse(self.redis.exists(slugfilter.filter_key()))
+        self.assertTrue(self.contains('bbbbbbb'))
+
+    def test_rebuild_adds_slugs_created_meanwhile(self):
+        Link.objects.create(user=self.user, url='https://example.com/', slug='aaaaaaa')
+        rename = self.redis.rename
+
+        def create_then_rename(*args):
+            # Created after the table was streamed; its own add went to the replaced filter
+            Link.objects.create(user=self.user, url='https://example.com/', slug='bbbbbbb')
+            return rename(*args)
+
+        with mock.patch.object(self.redis, 'rename', side_effect=create_then_rename):
+            self.assertEqual(slugfilter.rebuild_filter(), 1)
+        self.assertTrue(self.contains('aaaaaaa'))
+        self.assertTrue(self.contains('bbbbbbb'))
+        self.assertFalse(self.contains('ccccccc'))
+        self.assertFalse(self.redis.exists(slugfilter.LOCK_KEY))
+
+
+class ClickRetentionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='retention')
+        cls.link = Link.objects.create(user=user, url='https://example.com/', slug='keepers')
+
+    def add_clicks(self, *moments: datetime) -> None:
+        clicks = [Click(link=self.link, ip='10.0.0.1', clicked_at=moment) for moment in moments]
+        add_to_rollups(Click.objects.bulk_create(clicks))
+
+    def partition_of(self, click_id: int) -> str:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT tableoid::regclass::text FROM shortener_click WHERE id = %s', [click_id])
+            return cursor.fetchone()[0]
+
+    @override_settings(CLICK_RETENTION_MONTHS=0)
+    def test_keeps_everything_by_default(self):
+        self.add_clicks(timezone.now() - timedelta(days=800))
+        self.assertEqual(partitions.drop_expired_clicks(), ([], 0))
+        self.assertEqual(Click.objects.count(), 1)
+
+    @override_settings(CLICK_RETENTION_MONTHS=1)
+    def test_expired_clicks_are_folded_into_daily_rollups(self):
+        now = timezone.now()
+        old = partitions.month_start(now, -3) + timedelta(days=1, hours=12)
+        self.add_clicks(old, old + timedelta(hours=1), now)
+
+        # Old clicks fall in the default partition on PostgreSQL, so both backends delete row by row
+        self.assertEqual(partitions.drop_expired_clicks(), ([], 2))
+        self.assertEqual(list(Click.objects.values_list('clicked_at', flat=True)), [now])
+        rollups = self.link.rollups.filter(bucket__lt=partitions.month_start(now, -1))
+        self.assertEqual(list(rollups.values_list('period', 'clicks')), [(ClickRollup.Period.DAY, 2)])
+        self.assertEqual(get_click_summary(Link.objects.get(pk=self.link.pk))['total'], 3)  # Kept on the link
+
+    @skipUnless(connection.vendor == 'postgresql', 'Partitioning requires PostgreSQL')
+    def test_new_partition_takes_over_clicks_of_default(self):
+        later = partitions.month_start(timezone.now(), 6) + timedelta(days=2)
+        self.add_clicks(later)
+        click = Click.objects.get()
+        self.assertEqual(self.partition_of(click.id), 'shortener_click_default')
+
+        created = partitions.create_partitions(months_ahead=6)
+        self.assertIn(partitions.partition_name(later), created)
+        self.assertEqual(self.partition_of(click.id), partitions.partition_name(later))
+        self.assertEqual(partitions.create_partitions(months_ahead=6), [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Partitioning requires PostgreSQL')
+    @override_settings(CLICK_RETENTION_MONTHS=1)
+    def test_expired_partition_is_dropped(self):
+        now = timezone.now()
+        self.add_clicks(now, now)
+        name = partitions.partition_name(now)
+        with mock.patch('django.utils.timezone.now', return_value=partitions.month_start(now, 3)):
+            partitions.create_partitions()
+            dropped, deleted = partitions.drop_expired_clicks()
+        self.assertIn(name, dropped)
+        self.assertNotIn(name, partitions.list_partitions().values())
+        self.assertFalse(Click.objects.exists())
+        self.assertEqual(self.link.rollups.get(period=ClickRollup.Period.DAY).clicks, 2)
+
+
+class ClickSpoolTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.spool = clickqueue.Spool(directory.name)
+        self.redis = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+
+    def entries(self, count: int, start: int = 0) -> list[dict]:
+        return [{'l': i, 'i': '10.0.0.1', 't': '0'} for i in range(start, start + count)]
+
+    def streamed(self) -> list[int]:
+        return [int(fields[b'l']) for _, fields in self.redis.xrange(settings.CLICK_STREAM)]
+
+    def test_replay_appends_in_batches_and_deletes_files(self):
+        self.spool.append(self.entries(3))
+        self.spool.append(self.entries(2, start=3))
+        with mock.patch('shortener.clickqueue._xadd', wraps=clickqueue._xadd) as xadd:
+            self.assertEqual(self.spool.replay(self.redis, batch_size=2), 5)
+        self.assertEqual([len(call.args[1]) for call in xadd.call_args_list], [2, 2, 1])
+        self.assertEqual(self.streamed(), list(range(5)))
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+    def test_failed_replay_respools_only_the_unsent_tail(self):
+        self.spool.append(self.entries(5))
+        calls, xadd = [], clickqueue._xadd
+
+        def failing_second_batch(client, entries):
+            calls.append(entries)
+            if len(calls) == 2:
+                raise redis.ConnectionError
+            xadd(client, entries)
+
+        with mock.patch('shortener.clickqueue._xadd', side_effect=failing_second_batch):
+            with self.assertRaises(redis.ConnectionError):
+                self.spool.replay(self.redis, batch_size=2)
+        self.assertEqual(self.streamed(), [0, 1])
+        self.assertEqual(self.spool.replay(self.redis, batch_size=2), 3)
+        self.assertEqual(self.streamed(), list(range(5)))
+        self.assertFalse(self.spool.has_files())
+
+    def test_fresh_claims_are_left_and_stale_ones_taken_over(self):
+        self.spool.append(self.entries(1))
+        fresh = self.spool.path.rename(self.directory / f'other{clickqueue.CLAIMED_SUFFIX}')
+        self.assertEqual(self.spool.replay(self.redis, batch_size=10), 0)
+        self.assertTrue(fresh.exists())
+
+        stale = time_module.time() - clickqueue.STALE_CLAIM - 1
+        os.utime(fresh, (stale, stale))
+        self.assertEqual(self.spool.replay(self.redis, batch_size=10), 1)
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+    def test_replay_waits_for_a_write_in_progress(self):
+        self.spool.append(self.entries(1))
+        with open(self.spool.path, 'ab') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            replay = threading.Thread(target=self.spool.replay, args=(self.redis, 10))
+            replay.start()
+            time_module.sleep(0.1)
+            self.assertEqual(self.streamed(), [])
+            file.write(b'{"l": 1, "i": "10.0.0.1", "t": "0"}\n')
+        replay.join(timeout=5)
+        self.assertEqual(self.streamed(), [0, 1])
+
+    def test_writer_of_a_claimed_file_finds_it_deleted(self):
+        self.spool.append(self.entries(1))
+        with open(self.spool.path, 'rb') as reader, open(self.spool.path, 'ab') as writer:
+            fcntl.flock(reader, fcntl.LOCK_EX)  # Holds the replay back until it has claimed the file
+            replay = threading.Thread(target=self.spool.replay, args=(self.redis, 10))
+            replay.start()
+            time_module.sleep(0.1)
+            fcntl.flock(reader, fcntl.LOCK_UN)
+            time_module.sleep(0.1)
+            # Opened before the claim, like `append`: the lock comes only once the file is gone
+            fcntl.flock(writer, fcntl.LOCK_EX)
+            self.assertEqual(os.fstat(writer.fileno()).st_nlink, 0)
+        replay.join(timeout=5)
+        self.assertEqual(self.streamed(), [0])
+
+
+@override_settings(CLICK_QUEUE_SIZE=2, CLICK_QUEUE_FULL_POLICY='spool', CLICK_RETRY_INTERVAL=0.5)
+class ClickQueueTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = self.settings(CLICK_SPOOL_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.redis = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        patcher = mock.patch('shortener.clickqueue.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def idle_queue(self) -> clickqueue.ClickQueue:
+        """Return a queue whose publisher thread exits at once, to drive it by hand."""
+        with mock.patch.object(clickqueue.ClickQueue, '_run'):
+            click_queue = clickqueue.ClickQueue()
+        click_queue.thread.join()
+        return click_queue
+
+    def spooled(self, click_queue) -> int:
+        return sum(len(path.read_bytes().splitlines()) for path in click_queue.spool.directory.glob('*.spool'))
+
+    def test_full_queue_overflows_to_publisher_or_drops(self):
+        click_queue = self.idle_queue()
+        for i in range(5):
+            click_queue.put({'l': i})
+        self.assertEqual((click_queue.queue.qsize(), click_queue.overflow.qsize()), (2, 2))
+        self.assertEqual(self.spooled(click_queue), 0)  # Redirects never write the spool
+
+        with self.settings(CLICK_QUEUE_FULL_POLICY='drop'):
+            click_queue.put({'l': 5})
+        self.assertEqual(click_queue.overflow.qsize(), 2)
+
+    def test_spools_while_redis_fails_then_replays(self):
+        click_queue = self.idle_queue()
+        entries = [clickqueue.stream_fields(1, '10.0.0.1', timezone.now()) for _ in range(3)]
+        with mock.patch.object(self.redis, 'pipeline', side_effect=redis.ConnectionError), self.assertLogs():
+            click_queue.publish(entries)
+        self.assertEqual(self.spooled(click_queue), 3)
+
+        click_queue.publish([])  # Within the retry interval
+        self.assertEqual(len(list(click_queue.spool.directory.iterdir())), 1)
+
+        click_queue.retry_at = 0
+        click_queue.publish(entries[:1])
+        self.assertEqual(self.redis.xlen(settings.CLICK_STREAM), 4)
+        self.assertFalse(click_queue.spool.has_files())
+
+    def test_close_spools_queued_and_in_flight_clicks(self):
+        published = threading.Event()
+
+        def stuck_publish(entries):
+            published.set()
+            time_module.sleep(2)
+
+        click_queue = clickqueue.ClickQueue()
+        with mock.patch.object(click_queue, 'publish', side_effect=stuck_publish):
+            click_queue.put({'l': 1})
+            published.wait(timeout=5)
+            click_queue.put({'l': 2})
+            click_queue.close()
+        self.assertEqual(self.spooled(click_queue), 2)
+
+    def test_close_stops_the_thread(self):
+        click_queue = clickqueue.ClickQueue()
+        click_queue.put({'l': 1, 'i': '10.0.0.1', 't': '0'})
+        click_queue.close()
+        self.assertFalse(click_queue.thread.is_alive())
+        self.assertEqual(self.redis.xlen(settings.CLICK_STREAM) + self.spooled(click_queue), 1)
+
+
+class PurgeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='purge')
+
+    def create_link(self, slug: str, clicks: int = 0, **fields) -> Link:
+        link = Link.objects.create(user=self.user, url='https://example.com/', slug=slug, **fields)
+        now = timezone.now()
+        batch = [Click(link=link, ip='10.0.0.1', clicked_at=now - timedelta(minutes=i)) for i in range(clicks)]
+        add_to_rollups(Click.objects.bulk_create(batch))
+        return link
+
+    def test_soft_delete_hides_links_and_invalidates_cache(self):
+        link, kept = self.create_link('deleted'), self.create_link('keptone')
+        with mock.patch('shortener.purge.invalidate_link') as invalidate:
+            self.assertEqual(purge.soft_delete_links(Link.objects.filter(pk=link.pk)), 1)
+        invalidate.assert_called_once_with('deleted')
+        self.assertEqual(list(Link.objects.all()), [kept])
+        self.assertIsNotNone(Link.all_objects.get(pk=link.pk).deleted_at)
+
+    def test_sweep_deletes_only_expired_links(self):
+        now = timezone.now()
+        self.create_link('expired', expires_at=now - timedelta(minutes=1))
+        self.create_link('expires', expires_at=now + timedelta(days=1))
+        self.create_link('forever')
+        self.assertEqual(purge.sweep_expired_links(), 1)
+        self.assertEqual(sorted(Link.objects.values_list('slug', flat=True)), ['expires', 'forever'])
+
+    @override_settings(LINK_PURGE_BATCH_SIZE=2)
+    def test_purge_link_deletes_clicks_in_batches_then_the_link(self):
+        link = self.create_link('deleted', clicks=5)
+        purge.soft_delete_links(Link.objects.filter(pk=link.pk))
+        self.assertFalse(purge.purge_link(link.pk, deadline=time_module.monotonic() - 1))
+        self.assertEqual(Click.objects.count(), 5)
+
+        with mock.patch('shortener.purge.Click.objects.filter', wraps=Click.objects.filter) as click_filter:
+            self.assertTrue(purge.purge_link(link.pk, deadline=time_module.monotonic() + 60))
+        self.assertEqual(click_filter.call_count, 1 + 3)  # The batch query, then one delete per batch
+        self.assertFalse(Click.objects.exists())
+        self.assertFalse(ClickRollup.objects.exists())
+        self.assertFalse(Link.all_objects.filter(pk=link.pk).exists())
+
+    def test_purge_deleted_links_and_pending_purges(self):
+        first, second = self.create_link('deletd1', clicks=3), self.create_link('deletd2', clicks=1)
+        active = self.create_link('activex', clicks=2)
+        purge.soft_delete_links(Link.objects.filter(pk=first.pk))
+        purge.soft_delete_links(Link.objects.filter(pk=second.pk))
+        with self.assertNumQueries(1):
+            self.assertEqual(purge.pending_purges(), [('deletd1', 3), ('deletd2', 1)])
+
+        self.assertEqual(purge.purge_deleted_links(), 2)
+        self.assertEqual(purge.pending_purges(), [])
+        self.assertEqual(list(Link.all_objects.all()), [active])
+        self.assertEqual(Click.objects.count(), 2)
+
+
+@override_settings(CLICK_BATCH_SIZE=2)
+class IngestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='ingest')
+        cls.link = Link.objects.create(user=user, url='https://example.com/a', slug='ingestA')
+        cls.other = Link.objects.create(user=user, url='https://example.com/b', slug='ingestB')
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        patcher = mock.patch('shortener.ingest.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_clicks(self, link: Link, count: int) -> None:
+        for i in range(count):
+            self.redis.xadd(settings.CLICK_STREAM, clickqueue.stream_fields(link.pk, f'10.0.0.{i}', timezone.now()))
+
+    def pending(self) -> int:
+        return self.redis.xpending(settings.CLICK_STREAM, settings.CLICK_CONSUMER_GROUP)['pending']
+
+    def test_drains_in_batches_and_removes_entries(self):
+        self.add_clicks(self.link, 4)
+        self.redis.xadd(settings.CLICK_STREAM, {'l': 'x'})
+        with (
+            mock.patch('shortener.ingest.store_clicks', wraps=ingest.store_clicks) as store,
+            self.assertLogs('shortener.ingest', 'WARNING'),
+        ):
+            self.assertEqual(ingest.drain_click_stream(), 4)
+        self.assertEqual([len(call.args[0]) for call in store.call_args_list], [2, 2])
+        self.assertEqual(Click.objects.filter(link=self.link).count(), 4)
+        self.assertEqual((self.redis.xlen(settings.CLICK_STREAM), self.pending()), (0, 0))
+
+    def test_failed_chunk_stays_pending_until_claimed(self):
+        self.add_clicks(self.link, 2)
+        with mock.patch('shortener.ingest.store_clicks', side_effect=IntegrityError), self.assertRaises(IntegrityError):
+            ingest.drain_click_stream()
+        self.assertEqual((self.redis.xlen(settings.CLICK_STREAM), self.pending()), (2, 2))
+
+        self.assertEqual(ingest.drain_click_stream(), 0)  # Not idle long enough to be claimed
+        self.assertEqual(self.pending(), 2)
+
+        with self.settings(CLICK_CLAIM_IDLE=0):
+            self.assertEqual(ingest.drain_click_stream(), 2)
+        self.assertEqual((self.redis.xlen(settings.CLICK_STREAM), self.pending()), (0, 0))
+        self.assertEqual(Click.objects.count(), 2)
+
+    def test_skips_clicks_of_links_deleted_during_insert(self):
+        bulk_create, attempts = Click.objects.bulk_create, []
+
+        def delete_link(clicks):
+            if not attempts:
+                Link.all_objects.filter(pk=self.other.pk).delete()
+
+        def fail_once(clicks, **kwargs):
+            attempts.append(len(clicks))
+            if len(attempts) == 1:
+                raise IntegrityError  # As the foreign key check would
+            return bulk_create(clicks, **kwargs)
+
+        records = [ingest.ClickRecord(link.pk, '10.0.0.1', timezone.now()) for link in (self.link, self.other)]
+        with (
+            mock.patch('shortener.ingest.enrich_clicks', side_effect=delete_link),
+            mock.patch.object(Click.objects, 'bulk_create', side_effect=fail_once),
+        ):
+            self.assertEqual(ingest.store_clicks(records), 1)
+        self.assertEqual(attempts, [2, 1])
+        self.assertEqual(list(Click.objects.values_list('link', flat=True)), [self.link.pk])
+
+    def test_gives_up_after_a_second_integrity_error(self):
+        records = [ingest.ClickRecord(self.link.pk, '10.0.0.1', timezone.now())]
+        with (
+            mock.patch.object(Click.objects, 'bulk_create', side_effect=IntegrityError) as bulk_create,
+            self.assertRaises(IntegrityError),
+        ):
+            ingest.store_clicks(records)
+        self.assertEqual(bulk_create.call_count, 2)
+
+
+class RollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='rollup')
+        cls.link = Link.objects.create(user=user, url='https://example.com/a', slug='rolling')
+        cls.other = Link.objects.create(user=user, url='https://example.com/b', slug='rolled2')
+
+    def clicks(self, link: Link, *moments: datetime) -> list[Click]:
+        return [Click(link=link, ip='10.0.0.1', clicked_at=moment) for moment in moments]
+
+    def rollups(self, period: str) -> dict:
+        rows = ClickRollup.objects.filter(period=period).values_list('link_id', 'bucket', 'clicks')
+        return {(link_id, bucket): clicks for link_id, bucket, clicks in rows}
+
+    def test_batches_add_to_existing_buckets_and_counters(self):
+        now = datetime(2026, 3, 10, 15, 30, tzinfo=UTC)  # 23:30 on the 10th in TIME_ZONE
+        earlier = now - timedelta(hours=2)
+        add_to_rollups(self.clicks(self.link, now, now, earlier) + self.clicks(self.other, earlier))
+        add_to_rollups(self.clicks(self.link, now, now + timedelta(hours=1)))
+
+        self.assertEqual(
+            self.rollups(ClickRollup.Period.HOUR),
+            {
+                (self.link.pk, hour_bucket(now)): 3,
+                (self.link.pk, hour_bucket(earlier)): 1,
+                (self.link.pk, hour_bucket(now + timedelta(hours=1))): 1,
+                (self.other.pk, hour_bucket(earlier)): 1,
+            },
+        )
+        self.assertEqual(
+            self.rollups(ClickRollup.Period.DAY),
+            {
+                (self.link.pk, day_bucket(now)): 4,
+                (self.link.pk, day_bucket(now + timedelta(hours=1))): 1,
+                (self.other.pk, day_bucket(earlier)): 1,
+            },
+        )
+
+        self.link.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.link.click_count, self.link.last_clicked_at), (5, now + timedelta(hours=1)))
+        self.assertEqual((self.other.click_count, self.other.last_clicked_at), (1, earlier))
+
+    def test_late_batch_does_not_move_last_click_back(self):
+        now = timezone.now()
+        add_to_rollups(self.clicks(self.link, now))
+        add_to_rollups(self.clicks(self.link, now - timedelta(minutes=5)))
+        self.link.refresh_from_db()
+        self.assertEqual((self.link.click_count, self.link.last_clicked_at), (2, now))
+
+    def test_empty_batch_writes_nothing(self):
+        with self.assertNumQueries(0):
+            add_to_rollups([])
+
+    def test_click_summary(self):
+        now = timezone.now()
+        add_to_rollups(self.clicks(self.link, now, now, now - timedelta(days=3), now - timedelta(days=40)))
+        self.link.refresh_from_db()
+        summary = get_click_summary(self.link, days=7, hours=4)
+
+        self.assertEqual(summary['total'], 4)  # Including the click outside both series
+        self.assertEqual(len(summary['daily']), 7)
+        self.assertEqual(summary['daily'][-1], (day_bucket(now), 2))
+        self.assertEqual(summary['daily'][-4], (day_bucket(now - timedelta(days=3)), 1))
+        self.assertEqual(sum(n for _, n in summary['daily']), 3)
+        self.assertEqual(summary['daily_max'], 2)
+        self.assertEqual(summary['hourly'][-1], (hour_bucket(now), 2))
+        self.assertEqual([n for _, n in summary['hourly'][:-1]], [0, 0, 0])
+
+    def test_click_summary_without_clicks(self):
+        summary = get_click_summary(self.other, days=3, hours=2)
+        self.assertEqual(summary['total'], 0)
+        self.assertEqual([n for _, n in summary['daily'] + summary['hourly']], [0] * 5)
+        self.assertEqual((summary['daily_max'], summary['hourly_max']), (1, 1))
+
+
+class ReconcileCountersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='reconcile')
+
+    def create_link(self, slug: str, *moments: datetime) -> Link:
+        link = Link.objects.create(user=self.user, url='https://example.com/', slug=slug)
+        add_to_rollups(Click.objects.bulk_create([Click(link=link, ip='10.0.0.1', clicked_at=m) for m in moments]))
+        return link
+
+    def reconcile(self) -> str:
+        output = io.StringIO()
+        call_command('reconcile_link_counters', '--chunk-size', '2', stdout=output)
+        return output.getvalue().strip()
+
+    def counters(self) -> dict:
+        rows = Link.objects.values_list('slug', 'click_count', 'last_clicked_at')
+        return {slug: (count, last) for slug, count, last in rows}
+
+    def test_corrects_drifted_counters(self):
+        now = timezone.now()
+        self.create_link('drifted', now, now - timedelta(hours=1))
+        self.create_link('counted', now)
+        self.create_link('noclick')
+        Link.objects.filter(slug='drifted').update(click_count=7, last_clicked_at=None)
+        Link.objects.filter(slug='noclick').update(click_count=3, last_clicked_at=now)
+
+        self.assertEqual(self.reconcile(), 'Corrected the counters of 2 links.')
+        self.assertEqual(self.counters(), {'drifted': (2, now), 'counted': (1, now), 'noclick': (0, None)})
+        self.assertEqual(self.reconcile(), 'Corrected the counters of 0 links.')
+
+    def test_repeated_batches_need_no_correction(self):
+        now = timezone.now()
+        link = self.create_link('batched', now)
+        for i in range(1, 4):
+            clicks = [Click(link=link, ip='10.0.0.1', clicked_at=now - timedelta(minutes=i)) for _ in range(i)]
+            add_to_rollups(Click.objects.bulk_create(clicks))
+        self.assertEqual(self.counters(), {'batched': (7, now)})
+        self.assertEqual(self.reconcile(), 'Corrected the counters of 0 links.')
+
+    @override_settings(CLICK_RETENTION_MONTHS=1)
+    def test_counts_expired_clicks_from_daily_rollups(self):
+        now = timezone.now()
+        last_click = now - timedelta(days=100)
+        expired = Link.objects.create(user=self.user, url='https://example.com/', slug='expired')
+        ClickRollup.objects.create(link=expired, period=ClickRollup.Period.DAY, bucket=day_bucket(last_click), clicks=4)
+        Link.objects.filter(pk=expired.pk).update(click_count=9, last_clicked_at=last_click)
+        mixed = self.create_link('mixedup', now)
+        ClickRollup.objects.create(link=mixed, period=ClickRollup.Period.DAY, bucket=day_bucket(last_click), clicks=2)
+
+        self.assertEqual(self.reconcile(), 'Corrected the counters of 2 links.')
+        self.assertEqual(self.counters(), {'expired': (4, last_click), 'mixedup': (3, now)})
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Needs concurrent writers.')
+class ConcurrentCounterTests(TransactionTestCase):
+    def test_concurrent_batches_add_up(self):
+        user = User.objects.create(username='busy')
+        link = Link.objects.create(user=user, url='https://example.com/', slug='viral01')
+        barrier, errors = threading.Barrier(4), []
+
+        def write_batches():
+            try:
+                barrier.wait()
+                for _ in range(10):
+                    with transaction.atomic():
+                        clicks = [Click(link=link, ip='10.0.0.1', clicked_at=timezone.now()) for _ in range(5)]
+                        add_to_rollups(Click.objects.bulk_create(clicks))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=write_batches) for _ in range(barrier.parties)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        link.refresh_from_db()
+        self.assertEqual(link.click_count, 4 * 10 * 5)
+        self.assertEqual(sum(link.rollups.filter(period=ClickRollup.Period.DAY).values_list('clicks', flat=True)), 200)
+        output = io.StringIO()
+        call_command('reconcile_link_counters', stdout=output)
+        self.assertEqual(output.getvalue().strip(), 'Corrected the counters of 0 links.')
+
+
+class LocalLRUTests(SimpleTestCase):
+    def test_evicts_least_recently_used(self):
+        lru = cache.LocalLRU(maxsize=2, timeout=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual([lru.get(key) for key in 'abc'], [1, None, 3])
+        lru.delete('a')
+        self.assertIsNone(lru.get('a'))
+
+    def test_entries_expire(self):
+        lru = cache.LocalLRU(maxsize=2, timeout=60)
+        with mock.patch('shortener.cache.time.monotonic', return_value=1000):
+            lru.set('a', 1)
+        with mock.patch('shortener.cache.time.monotonic', return_value=1059):
+            self.assertEqual(lru.get('a'), 1)
+        with mock.patch('shortener.cache.time.monotonic', return_value=1061):
+            self.assertIsNone(lru.get('a'))
+
+
+@override_settings(SLUG_FILTER_ENABLED=False)
+class LinkCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='cached')
+        cls.link = Link.objects.create(user=user, url='https://example.com/a', slug='cached1', cache_max_age=60)
+
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=server)
+        for target, client in [
+            ('get_redis', self.redis),
+            ('get_async_redis', fakeredis.FakeAsyncRedis(server=server)),
+        ]:
+            patcher = mock.patch(f'shortener.cache.{target}', return_value=client)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for clear in (cache.local_cache.clear, cache.miss_cache.clear, cache.reset_cache_stats):
+            clear()
+            self.addCleanup(clear)
+
+    def test_fills_both_tiers_from_the_database(self):
+        expected = cache.CachedLink(self.link.pk, self.link.url, Link.RedirectMode.TEMPORARY, 60)
+        with self.assertNumQueries(1):
+            self.assertEqual(cache.lookup_link('cached1'), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.lookup_link('cached1'), expected)
+        self.assertEqual(cache.decode(self.redis.get(cache.cache_key('cached1'))), expected)
+        self.assertGreater(self.redis.ttl(cache.cache_key('cached1')), settings.LINK_CACHE_LOCAL_TIMEOUT)
+
+        cache.local_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.lookup_link('cached1'), expected)
+        self.assertEqual(cache.get_cache_stats(), {'local_hits': 1, 'shared_hits': 1, 'misses': 1, 'rejected': 0})
+
+    def test_remembers_misses(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(cache.lookup_link('missing'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(cache.lookup_link('missing'))
+            self.assertIsNone(cache.lookup_link('bad!'))
+        self.assertEqual(cache.get_cache_stats()['rejected'], 2)
+
+        Link.objects.create(user=self.link.user, url='https://example.com/b', slug='missing')
+        with mock.patch('shortener.cache.add_slugs'):
+            cache.register_new_slugs(['missing'])
+        self.assertEqual(cache.lookup_link('missing').url, 'https://example.com/b')
+
+    def test_invalidation_clears_both_tiers(self):
+        cache.lookup_link('cached1')
+        Link.objects.filter(pk=self.link.pk).update(deleted_at=timezone.now())
+        cache.invalidate_link('cached1')
+        self.assertIsNone(self.redis.get(cache.cache_key('cached1')))
+        with self.assertNumQueries(1):
+            self.assertIsNone(cache.lookup_link('cached1'))
+
+    def test_broken_shared_tier_falls_back_to_the_database(self):
+        with (
+            mock.patch.object(self.redis, 'pipeline', side_effect=redis.ConnectionError),
+            mock.patch.object(self.redis, 'set', side_effect=redis.ConnectionError),
+            self.assertLogs('shortener.cache', 'WARNING'),
+        ):
+            self.assertEqual(cache.lookup_link('cached1').id, self.link.pk)
+
+    async def test_async_lookup_shares_the_tiers(self):
+        link = await cache.alookup_link('cached1')
+        self.assertEqual(link.id, self.link.pk)
+        self.assertEqual(cache.decode(self.redis.get(cache.cache_key('cached1'))), link)
+        cache.local_cache.clear()
+        self.assertEqual(await cache.alookup_link('cached1'), link)
+        self.assertIsNone(await cache.alookup_link('missing'))
+        self.assertIsNone(await cache.alookup_link('missing'))
+        self.assertEqual(cache.get_cache_stats(), {'local_hits': 0, 'shared_hits': 1, 'misses': 2, 'rejected': 1})
+
+
+@override_settings(
+    ROOT_URLCONF='url_shortener.redirect_urls', MIDDLEWARE=redirect_settings.MIDDLEWARE, RATELIMIT_ENABLE=False
+)
+class RedirectAppTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='slim')
+        Link.objects.create(user=user, url='https://example.com/slim', slug='slimapp')
+
+    async def test_resolves_a_slug(self):
+        with mock.patch('shortener.redirects.submit_click', return_value=True) as submit_click:
+            response = await self.async_client.get('/slimapp/', secure=True)
+        self.assertEqual((response.status_code, response['Location']), (302, 'https://example.com/slim'))
+        submit_click.assert_called_once()
+
+        response = await self.async_client.get('/slimapp', secure=True)
+        self.assertEqual((response.status_code, response['Location']), (301, '/slimapp/'))
+        self.assertEqual((await self.async_client.get('/', secure=True)).status_code, 404)
+
+    def test_loads_only_the_redirect_path(self):
+        script = (
+            'import json, sys\n'
+            'from django.urls import resolve\n'
+            'from url_shortener.redirect_asgi import application\n'
+            'resolve("/slimapp/")\n'
+            'print(json.dumps(sorted(sys.modules)))\n'
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        )
+        modules = json.loads(result.stdout)
+        self.assertIn('shortener.redirects', modules)
+        unwanted = ('shortener.views', 'shortener.tasks', 'allauth', 'django.contrib.sessions', 'django.contrib.admin')
+        self.assertEqual([name for name in modules if name.startswith(unwanted)], [])
+
+
+@override_settings(METRICS_TOKEN='scraper-token')
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username='ops', is_staff=True)
+        cls.user = User.objects.create(username='notops')
+
+    def setUp(self):
+        metrics.flush()  # Keeps increments of earlier tests out of this one's totals
+        self.redis = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        patcher = mock.patch('shortener.metrics.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def scrape(self, **headers) -> HttpResponse:
+        return self.client.get('/metrics', secure=True, headers=headers)
+
+    def samples(self, body: str, prefix: str) -> dict[str, str]:
+        return dict(line.rsplit(' ', 1) for line in body.splitlines() if line.startswith(prefix))
+
+    def test_token_or_staff_only(self):
+        self.assertEqual(self.scrape().status_code, 404)
+        self.assertEqual(self.scrape(authorization='Bearer wrong').status_code, 404)
+        self.assertEqual(self.scrape(authorization='Bearer scraper-token').status_code, 200)
+        self.client.force_login(self.user)
+        self.assertEqual(self.scrape().status_code, 404)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.scrape().status_code, 200)
+        with self.settings(METRICS_TOKEN=None):
+            self.client.logout()
+            self.assertEqual(self.scrape(authorization='Bearer None').status_code, 404)
+
+    def test_exposition_format(self):
+        metrics.TASK_DURATION.observe(0.003, 'shortener.tasks.test', 'SUCCESS')
+        metrics.RATELIMITED.inc('say "hi"\n')
+        self.scrape(authorization='Bearer scraper-token')
+        response = self.scrape(authorization='Bearer scraper-token')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+
+        self.assertIn('# TYPE shortener_celery_task_duration_seconds histogram\n', body)
+        labels = 'task="shortener.tasks.test",state="SUCCESS"'
+        task = self.samples(body, 'shortener_celery_task_duration_seconds')
+        self.assertEqual(task[f'shortener_celery_task_duration_seconds_bucket{{{labels},le="0.0025"}}'], '0')
+        self.assertEqual(task[f'shortener_celery_task_duration_seconds_bucket{{{labels},le="0.005"}}'], '1')
+        self.assertEqual(task[f'shortener_celery_task_duration_seconds_bucket{{{labels},le="+Inf"}}'], '1')
+        self.assertEqual(task[f'shortener_celery_task_duration_seconds_sum{{{labels}}}'], '0.003')
+        self.assertEqual(task[f'shortener_celery_task_duration_seconds_count{{{labels}}}'], '1')
+
+        self.assertIn('# TYPE shortener_ratelimit_rejections_total counter\n', body)
+        self.assertIn('shortener_ratelimit_rejections_total{view="say \\"hi\\"\\n"} 1\n', body)
+        requests = self.samples(body, 'shortener_requests_total')
+        self.assertEqual(requests['shortener_requests_total{view="metrics",status="200"}'], '1')  # The first scrape
+        self.assertEqual(self.samples(body, 'shortener_click_stream_length'), {'shortener_click_stream_length': '0'})
+
+    def test_task_duration_from_celery_signals(self):
+        tasks.refill_slug_pool.apply()
+        body = self.scrape(authorization='Bearer scraper-token').content.decode()
+        labels = 'task="shortener.tasks.refill_slug_pool",state="SUCCESS"'
+        self.assertIn(f'shortener_celery_task_duration_seconds_count{{{labels}}} 1\n', body)
+
+    def test_unavailable_without_redis(self):
+        with mock.patch.object(self.redis, 'pipeline', side_effect=redis.ConnectionError), self.assertLogs():
+            response = self.scrape(authorization='Bearer scraper-token')
+        self.assertEqual(response.status_code, 503)
+
+
+@override_settings(RATELIMIT_ENABLE=False)
+class UniqueVisitorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='visited')
+        cls.link = Link.objects.create(user=cls.user, url='https://example.com/', slug='visited')
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        patcher = mock.patch('shortener.visitors.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def store(self, *clicks: tuple[str, datetime]) -> None:
+        ingest.store_clicks(ingest.ClickRecord(self.link.pk, ip, clicked_at) for ip, clicked_at in clicks)
+
+    def test_counts_distinct_ips_per_day_and_over_the_range(self):
+        now, yesterday = timezone.now(), timezone.now() - timedelta(days=1)
+        self.store(('10.0.0.1', now), ('10.0.0.1', now), ('10.0.0.2', now), ('10.0.0.1', yesterday))
+        self.store(('10.0.0.3', yesterday), ('10.0.0.2', now))  # Redelivered clicks count once
+        self.assertEqual(
+            visitors.count_visitors(self.link.pk),
+            {'today': 2, 'range': 3, 'days': 30, 'error_percent': visitors.STANDARD_ERROR * 100},
+        )
+        self.assertEqual(visitors.count_visitors(self.link.pk, days=1)['range'], 2)
+        key = visitors.visitor_key(self.link.pk, timezone.localdate())
+        self.assertAlmostEqual(self.redis.ttl(key), settings.UNIQUE_VISITOR_DAYS * 24 * 60 * 60, delta=5)
+
+        with self.settings(UNIQUE_VISITOR_DAYS=7):
+            self.assertEqual(visitors.count_visitors(self.link.pk)['days'], 7)
+
+    def test_shown_on_the_stats_page(self):
+        self.store(('10.0.0.1', timezone.now()), ('10.0.0.2', timezone.now()))
+        self.client.force_login(self.user)
+        response = self.client.get('/visited/stats/', secure=True)
+        self.assertEqual(response.context['visitors']['today'], 2)
+        self.assertContains(response, '±0.81%')
+
+    def test_missing_without_redis(self):
+        with mock.patch('shortener.visitors.get_redis', return_value=None):
+            self.store(('10.0.0.1', timezone.now()))
+            self.assertIsNone(visitors.count_visitors(self.link.pk))
+        with mock.patch.object(self.redis, 'pipeline', side_effect=redis.ConnectionError), self.assertLogs():
+            self.store(('10.0.0.1', timezone.now()))
+            self.assertIsNone(visitors.count_visitors(self.link.pk))
+        self.assertEqual(Click.objects.count(), 2)  # The clicks are stored all the same
+
+
+@override_settings(RATELIMIT_ENABLE=False, LEADERBOARD_HALF_LIFE=60 * 60 * 6)
+class LeaderboardTests(TestCase):
+    # An hour into a trending epoch (8 half-lives of 6 hours), so 6 hours ago is in the previous one
+    now = datetime.fromtimestamp(10417 * 48 * 60 * 60 + 60 * 60, tz=UTC)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, other = User.objects.create(username='leader'), User.objects.create(username='follower')
+        cls.hot = Link.objects.create(user=cls.user, url='https://example.com/hot', slug='hotlink')
+        cls.warm = Link.objects.create(user=cls.user, url='https://example.com/warm', slug='warmlnk')
+        cls.theirs = Link.objects.create(user=other, url='https://example.com/theirs', slug='theirs1')
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        for patcher in (
+            mock.patch('shortener.leaderboard.get_redis', return_value=self.redis),
+            mock.patch('django.utils.timezone.now', return_value=self.now),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.owners = {link.pk: link.user_id for link in (self.hot, self.warm, self.theirs)}
+
+    def add(self, link: Link, count: int, ago: timedelta = timedelta()) -> None:
+        clicks = [Click(link=link, ip='10.0.0.1', clicked_at=self.now - ago) for _ in range(count)]
+        with self.assertNumQueries(0):
+            leaderboard.add_clicks(clicks, self.owners)
+
+    def test_today_global_and_per_user(self):
+        self.add(self.hot, 3)
+        self.add(self.theirs, 2)
+        self.add(self.warm, 1)
+        self.add(self.warm, 5, ago=timedelta(days=2))  # Not today
+        self.assertEqual(
+            leaderboard.top_links()['today'], [(self.hot.pk, 3.0), (self.theirs.pk, 2.0), (self.warm.pk, 1.0)]
+        )
+        self.assertEqual(leaderboard.top_links(self.user.pk)['today'], [(self.hot.pk, 3.0), (self.warm.pk, 1.0)])
+        self.assertEqual(leaderboard.top_links(size=1)['today'], [(self.hot.pk, 3.0)])
+
+    def test_trending_scores_halve_every_half_life(self):
+        self.add(self.hot, 1)
+        self.add(self.warm, 4, ago=timedelta(hours=6))  # In the previous epoch
+        self.add(self.theirs, 8, ago=timedelta(hours=6 * 8 + 2))  # Two epochs back, scaled to nothing
+        trending = dict(leaderboard.top_links()['trending'])
+        self.assertEqual(set(trending), {self.hot.pk, self.warm.pk})
+        self.assertAlmostEqual(trending[self.hot.pk], 1)
+        self.assertAlmostEqual(trending[self.warm.pk], 2)
+
+    def test_shown_on_the_index_without_deleted_links(self):
+        self.add(self.hot, 2)
+        self.add(self.warm, 1)
+        purge.soft_delete_links(Link.objects.filter(pk=self.hot.pk))
+        self.client.force_login(self.user)
+        response = self.client.get('/', secure=True)
+        boards = response.context['leaderboards']
+        self.assertEqual(boards, {'today': [(self.warm, 1.0)], 'trending': [(self.warm, 1.0)]})
+        self.assertContains(response, 'warmlnk')
+
+    def test_missing_without_redis(self):
+        with mock.patch('shortener.leaderboard.get_redis', return_value=None):
+            self.assertIsNone(leaderboard.leaderboards())
+        with mock.patch.object(self.redis, 'pipeline', side_effect=redis.ConnectionError), self.assertLogs():
+            self.add(self.hot, 1)
+            self.assertIsNone(leaderboard.leaderboards())
@@ -0,0 +1,32 @@
+"""Normalized URL hashes, used to find the link a user already has for a URL."""
+
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url: str) -> str:
+    """Lower-case the scheme and host, and drop a default port and an empty path.
+
+    Paths, queries and fragments are kept as they are, as servers may treat their case
+    and encoding as significant.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    try:
+        port = parts.port
+    except ValueError:  # Not a valid port, keep the URL as it is
+        return url.strip()
+    host = parts.hostname or ''
+    if ':' in host:  # IPv6
+        host = f'[{host}]'
+    netloc = host if port in (None, DEFAULT_PORTS.get(scheme)) else f'{host}:{port}'
+    if '@' in parts.netloc:
+        netloc = f'{parts.netloc.rpartition("@")[0]}@{netloc}'
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, parts.fragment))
+
+
+def url_hash(url: str) -> str:
+    """Return the SHA-256 of the normalized URL in hex, 64 characters."""
+    return hashlib.sha256(normalize_url(url).encode()).hexdigest()
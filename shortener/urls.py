@@ -1,10 +1,12 @@
 from django.urls import path
 
-from . import views
+from . import redirects, views
 
 urlpatterns = [
     path('', views.shorten_url, name='shorten_url'),
+    path('bulk/', views.bulk_shorten_url, name='bulk_shorten_url'),
     path('<str:query_slug>/delete/', views.delete_url, name='delete_url'),
     path('<str:query_slug>/stats/', views.summarize_clicks, name='summarize_clicks'),
-    path('<str:query_slug>/', views.redirect_url, name='redirect_url'),
+    path('<str:query_slug>/stats/export/', views.export_clicks, name='export_clicks'),
+    path('<str:query_slug>/', redirects.redirect_url, name='redirect_url'),
 ]
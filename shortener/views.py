@@ -1,61 +1,156 @@
-import secrets
+import csv
+import hmac
+import io
+import itertools
+import json
+from datetime import date, datetime, time, timedelta
 
+import redis
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.core.paginator import Paginator
-from django.db import IntegrityError
-from django.http import HttpRequest, HttpResponse
+from django.db import IntegrityError, router, transaction
+from django.http import Http404, HttpRequest, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
 from django.utils import timezone
-from django_ratelimit.decorators import ratelimit
+from django.views.decorators.http import require_POST
 
+from .cache import register_new_slugs
 from .forms import UrlForm
-from .models import Link
-from .tasks import record_click
-
-
-def get_client_ip(request: HttpRequest) -> str:
-    """Get the client's IP address, accounting for proxies."""
-    # Source - https://stackoverflow.com/a
-    # Posted by yanchenko, modified by community. See post 'Timeline' for change history
-    # Retrieved 2026-01-24, License - CC BY-SA 4.0
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
+from .leaderboard import leaderboards
+from .metrics import render_metrics
+from .models import Click, Link
+from .pagination import paginate_keyset
+from .partitions import retention_start
+from .purge import soft_delete_links
+from .ratelimit import ratelimit
+from .rollups import get_click_summary
+from .routers import replica_reads
+from .slugs import get_slug_allocator
+from .urlhash import url_hash
+from .visitors import count_visitors
+
+EXPORT_FIELDS = ['clicked_at', 'ip', 'country', 'asn']
+EXPORT_CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+
+
+# Link settings a deduplicated link must share with the requested one
+DEDUP_OPTIONS = ('redirect_mode', 'cache_max_age', 'expires_at')
+
+
+def find_existing_links(current_user: User, hashes: list[str], **options) -> dict[str, Link]:
+    """Return the user's oldest link per URL hash, through the (user, url_hash) index.
 
+    Only links whose fields match `options` (e.g. the redirect mode) are considered.
+    """
+    existing = {}
+    for link in Link.objects.filter(user=current_user, url_hash__in=hashes, **options).order_by():
+        if link.url_hash not in existing or link.pk < existing[link.url_hash].pk:
+            existing[link.url_hash] = link
+    return existing
 
-def create_new_link(current_user: User, original_url: str) -> Link | None:
-    """Create a link and assign an unique random slug."""
-    available_chars = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
-    slug_length = 7  # Longer length reduces collisions with random generation (62^7 = ~3.5 trillion)
-    max_attempts = 5  # Sufficient for ~4 attempts when 75% of slug space is occupied
+
+def create_new_link(current_user: User, original_url: str, **options) -> Link | None:
+    """Create a link and assign an unique slug from the configured allocator.
+
+    `options` set other Link fields, such as the redirect mode. With LINK_DEDUP, the
+    user's existing link for the same URL and settings is returned instead.
+    """
+    if settings.LINK_DEDUP:
+        hashed = url_hash(original_url)
+        match = {name: options.get(name, Link._meta.get_field(name).get_default()) for name in DEDUP_OPTIONS}
+        if existing := find_existing_links(current_user, [hashed], **match).get(hashed):
+            return existing
+
+    allocator = get_slug_allocator()
+    max_attempts = 5  # Random slugs: sufficient for ~4 attempts when 75% of slug space is occupied
 
     attempts = 0
     while attempts < max_attempts:
-        new_slug = ''.join(secrets.choice(available_chars) for _ in range(slug_length))
+        new_slug = allocator.allocate()[0]
         try:
             new_link = Link.objects.create(
-                user=current_user, url=original_url, slug=new_slug
+                user=current_user, url=original_url, slug=new_slug, **options
             )
+            register_new_slugs([new_link.slug])
             return new_link
         except IntegrityError:  # Slug collision occurred, retry
             attempts += 1
     return None
 
 
-@ratelimit(key='ip', rate='7/s', method='GET')  # avg CPS ~ 7, above these likely bots
-@ratelimit(key='ip', rate='60/m', method='GET')
-def redirect_url(request: HttpRequest, query_slug: str) -> HttpResponse:
-    """Redirect slugs to their original URLs and record click events."""
-    target_link = get_object_or_404(Link, slug=query_slug)
-    user_ip = get_client_ip(request)
-    record_click.delay(
-        target_link_id=target_link.id, user_ip=user_ip, clicked_at=timezone.now()
-    )
-    return redirect(target_link.url)
+def create_links_in_bulk(current_user: User, original_urls: list[str]) -> list[Link]:
+    """Create links for many URLs with one slug check and one INSERT per chunk.
+
+    With LINK_DEDUP, URLs the user already shortened with default settings (or repeated
+    in `original_urls`) reuse that link, and the result has one link per given URL, in order.
+    """
+    allocator = get_slug_allocator()
+    batch_size = settings.BULK_SHORTEN_BATCH_SIZE
+    max_attempts = 5
+    defaults = {name: Link._meta.get_field(name).get_default() for name in DEDUP_OPTIONS}
+
+    links_by_hash = {}
+    created = []
+    with transaction.atomic():
+        for start in range(0, len(original_urls), batch_size):
+            chunk = original_urls[start : start + batch_size]
+            hashes = [url_hash(url) for url in chunk]
+            if settings.LINK_DEDUP:
+                links_by_hash.update(find_existing_links(current_user, hashes, **defaults))
+                new = {}  # Keeps the first of repeated URLs
+                for url, hashed in zip(chunk, hashes):
+                    if hashed not in links_by_hash:
+                        new.setdefault(hashed, url)
+                hashes, chunk = list(new), list(new.values())
+            for attempt in range(max_attempts):
+                slugs = allocator.allocate(len(chunk))
+                if not allocator.collision_free:
+                    taken = set(Link.all_objects.filter(slug__in=slugs).values_list('slug', flat=True))
+                    if taken or len(set(slugs)) < len(slugs):
+                        continue  # Rare; drawing the whole chunk again keeps this simple
+                links = [
+                    Link(user=current_user, url=url, slug=slug, url_hash=hashed)
+                    for url, slug, hashed in zip(chunk, slugs, hashes)
+                ]
+                try:
+                    with transaction.atomic():
+                        Link.objects.bulk_create(links)
+                except IntegrityError:  # Slug taken concurrently, retry the chunk
+                    continue
+                created += links
+                register_new_slugs([link.slug for link in links])
+                break
+            else:
+                raise IntegrityError('Could not allocate unique slugs.')
+
+    if not settings.LINK_DEDUP:
+        return created
+    links_by_hash.update((link.url_hash, link) for link in created)
+    return [links_by_hash[url_hash(url)] for url in original_urls]
+
+
+def validate_urls(request: HttpRequest, urls: list) -> tuple[list[str], list[dict]]:
+    """Validate URLs like `UrlForm`; return the valid ones and per-index errors."""
+    valid, errors = [], []
+    for index, url in enumerate(urls):
+        form = UrlForm({'url': url if isinstance(url, str) else ''}, request=request)
+        if form.is_valid():
+            valid.append(form.cleaned_data['url'])
+        else:
+            errors.append({'index': index, 'url': url, 'errors': list(form.errors['url'])})
+    return valid, errors
+
+
+def read_csv_urls(uploaded_file, limit: int) -> list[str]:
+    """Read up to `limit` URLs from the first column of an uploaded CSV, skipping a `url` header."""
+    rows = csv.reader(io.TextIOWrapper(uploaded_file, encoding='utf-8-sig'))
+    urls = (row[0].strip() for row in rows if row and row[0].strip())
+    first = next(urls, None)
+    if first is not None and first.lower() != 'url':
+        urls = itertools.chain([first], urls)
+    return list(itertools.islice(urls, limit))
 
 
 @login_required
@@ -68,7 +163,11 @@ def shorten_url(request: HttpRequest) -> HttpResponse:
         if form.is_valid():
             original_url = form.cleaned_data['url']
             new_link = create_new_link(
-                current_user=request.user, original_url=original_url
+                current_user=request.user,
+                original_url=original_url,
+                redirect_mode=form.cleaned_data['redirect_mode'],
+                cache_max_age=form.cleaned_data['cache_max_age'],
+                expires_at=form.cleaned_data['expires_at'],
             )
             if new_link:
                 return redirect('shorten_url')
@@ -77,32 +176,190 @@ def shorten_url(request: HttpRequest) -> HttpResponse:
     else:
         form = UrlForm(request=request)
 
-    links = request.user.links.all()
-    p = Paginator(links, 10)
-    page_obj = p.get_page(request.GET.get('page'))
-    return render(request, 'index.html', {'form': form, 'page_obj': page_obj})
+    with replica_reads():
+        page_obj = paginate_keyset(request.user.links.all(), 'created_at', request.GET.get('cursor'), 10)
+        link_count = request.user.links.count()  # Served by the user index, bounded by one user's links
+        boards = leaderboards(request.user.id)
+    return render(
+        request,
+        'index.html',
+        {
+            'form': form,
+            'page_obj': page_obj,
+            'link_count': link_count,
+            'leaderboards': boards,
+        },
+    )
+
+
+@login_required
+@require_POST
+@ratelimit(key='user', rate='2/s', method='POST')
+@ratelimit(key='user', rate='10/m', method='POST')
+def bulk_shorten_url(request: HttpRequest) -> HttpResponse:
+    """Shorten many URLs from a JSON body (`{"urls": [...]}`) or an uploaded CSV file.
+
+    JSON requests get the created mappings and per-URL errors as JSON; CSV uploads
+    get them back as a CSV download.
+    """
+    uploaded_file = request.FILES.get('csv_file')
+    if uploaded_file:
+        try:
+            # One more than allowed, so that oversized files are rejected without reading them whole
+            urls = read_csv_urls(uploaded_file, settings.BULK_SHORTEN_MAX_URLS + 1)
+        except (UnicodeDecodeError, csv.Error):
+            return HttpResponse('CSV 檔案格式錯誤', status=400)
+    else:
+        try:
+            urls = json.loads(request.body)['urls']
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({'error': 'Expected a JSON body like {"urls": [...]}.'}, status=400)
+        if not isinstance(urls, list):
+            return JsonResponse({'error': '"urls" must be a list.'}, status=400)
+
+    if len(urls) > settings.BULK_SHORTEN_MAX_URLS:
+        message = f'At most {settings.BULK_SHORTEN_MAX_URLS} URLs per request.'
+        return HttpResponse(message, status=400) if uploaded_file else JsonResponse({'error': message}, status=400)
+
+    valid_urls, errors = validate_urls(request, urls)
+    try:
+        links = create_links_in_bulk(request.user, valid_urls)
+    except IntegrityError:  # No free slugs after retries; nothing was created
+        message = '縮網址失敗，請稍候再試。'
+        return HttpResponse(message, status=503) if uploaded_file else JsonResponse({'error': message}, status=503)
+    mappings = [
+        {
+            'url': link.url,
+            'slug': link.slug,
+            'short_url': request.build_absolute_uri(reverse('redirect_url', args=[link.slug])),
+        }
+        for link in links
+    ]
+
+    if uploaded_file:
+        response = HttpResponse(content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="short_urls.csv"'
+        writer = csv.writer(response)
+        writer.writerow(['url', 'short_url', 'error'])
+        writer.writerows([mapping['url'], mapping['short_url'], ''] for mapping in mappings)
+        writer.writerows([error['url'], '', ' '.join(error['errors'])] for error in errors)
+        return response
+    return JsonResponse({'links': mappings, 'errors': errors}, status=201 if links else 400)
 
 
 @login_required
 @ratelimit(key='user', rate='7/s', method='POST')
 @ratelimit(key='user', rate='60/m', method='POST')
 def delete_url(request: HttpRequest, query_slug: str) -> HttpResponse:
-    """Delete URLs and update user's links."""
+    """Delete URLs and update user's links; clicks are purged in the background."""
     target_link = get_object_or_404(Link, user=request.user, slug=query_slug)
     if request.method == 'POST':
-        target_link.delete()
+        soft_delete_links(Link.objects.filter(pk=target_link.pk))
     return redirect('shorten_url')
 
 
 @login_required
 @ratelimit(key='user', rate='2/s', method='GET')  # Consider page refreshes
 @ratelimit(key='user', rate='20/m', method='GET')
+@replica_reads()
 def summarize_clicks(request: HttpRequest, query_slug: str) -> HttpResponse:
     """Show click counts for a link."""
     # Return 404 when the slug does not exist or does not belong to the current user,
     # similar to GitHub returning 404 when accessing a private repository.
     target_link = get_object_or_404(Link, user=request.user, slug=query_slug)
+    summary = get_click_summary(target_link)
     clicks = target_link.clicks.all()
-    p = Paginator(clicks, 30)
-    page_obj = p.get_page(request.GET.get('page'))
-    return render(request, 'clicks.html', {'link': target_link, 'page_obj': page_obj})
+    if kept_since := retention_start():
+        # Older clicks are only kept as rollups; the bound also prunes dropped partitions
+        clicks = clicks.filter(clicked_at__gte=kept_since)
+    page_obj = paginate_keyset(clicks, 'clicked_at', request.GET.get('cursor'), 30)
+    visitors = count_visitors(target_link.id)
+    return render(
+        request,
+        'clicks.html',
+        {'link': target_link, 'summary': summary, 'visitors': visitors, 'page_obj': page_obj},
+    )
+
+
+class Echo:
+    """A file-like object whose `write` returns the value, to stream the rows of a csv.writer."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def parse_date_range(request: HttpRequest) -> tuple[datetime | None, datetime | None]:
+    """Return the bounds of the `start` and `end` local dates (inclusive) as [start, end); raise ValueError."""
+    start, end = request.GET.get('start'), request.GET.get('end')
+    start = timezone.make_aware(datetime.combine(date.fromisoformat(start), time.min)) if start else None
+    end = timezone.make_aware(datetime.combine(date.fromisoformat(end) + timedelta(days=1), time.min)) if end else None
+    return start, end
+
+
+async def stream_clicks(clicks, fmt: str):
+    """Yield the rows of `clicks` as CSV or NDJSON, a chunk of rows at a time."""
+    writer = csv.writer(Echo())
+    if fmt == 'csv':
+        yield writer.writerow(EXPORT_FIELDS)  # Sent before the first rows are fetched
+    lines = []
+    # Server-side cursor on PostgreSQL, fetched in chunks from a worker thread
+    async for record in clicks.aiterator(chunk_size=settings.CLICK_EXPORT_CHUNK_SIZE):
+        record['clicked_at'] = record['clicked_at'].isoformat()
+        if fmt == 'csv':
+            lines.append(writer.writerow(record.values()))
+        else:
+            lines.append(json.dumps(record) + '\n')
+        if len(lines) == settings.CLICK_EXPORT_CHUNK_SIZE:
+            yield ''.join(lines)
+            lines.clear()
+    if lines:
+        yield ''.join(lines)
+
+
+@login_required
+@ratelimit(key='ip', rate='10/m', method='GET')  # Each export may read millions of rows
+async def export_clicks(request: HttpRequest, query_slug: str) -> HttpResponse:
+    """Stream a link's clicks between the optional `start` and `end` dates as CSV or NDJSON."""
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in EXPORT_CONTENT_TYPES:
+        return HttpResponseBadRequest('format must be csv or ndjson.')
+    try:
+        start, end = parse_date_range(request)
+    except ValueError:
+        return HttpResponseBadRequest('start and end must be dates as YYYY-MM-DD.')
+
+    with replica_reads():
+        # Chosen now, as the stream is read after the view returns
+        alias = router.db_for_read(Click)
+        try:
+            target_link = await Link.objects.using(alias).aget(user=await request.auser(), slug=query_slug)
+        except Link.DoesNotExist:
+            raise Http404('No link matches the given slug.') from None
+
+    clicks = Click.objects.using(alias).filter(link_id=target_link.id)
+    if kept_since := retention_start():
+        start = max(start, kept_since) if start else kept_since
+    if start:
+        clicks = clicks.filter(clicked_at__gte=start)
+    if end:
+        clicks = clicks.filter(clicked_at__lt=end)
+    # values() rather than values_list(), whose aiterator() queries on the event loop
+    clicks = clicks.order_by('clicked_at', 'id').values(*EXPORT_FIELDS)
+
+    response = StreamingHttpResponse(stream_clicks(clicks, fmt), content_type=EXPORT_CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{target_link.slug}-clicks.{fmt}"'
+    return response
+
+
+def metrics(request: HttpRequest) -> HttpResponse:
+    """Expose metrics in the Prometheus text format to holders of METRICS_TOKEN or staff."""
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    authorized = bool(token) and hmac.compare_digest(authorization, f'Bearer {token}')
+    if not (authorized or request.user.is_staff):
+        raise Http404
+    try:
+        body = render_metrics()
+    except redis.RedisError:
+        return HttpResponse('Metrics are unavailable.', status=503)
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
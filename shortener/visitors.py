@@ -0,0 +1,69 @@
+"""Approximate unique visitors per link and local day, as Redis HyperLogLogs of client IPs.
+
+Each sketch takes at most 12 KB however many clicks it counts, and PFCOUNT over several
+days merges them, so a range costs one command. Adding is idempotent, which suits the
+at-least-once click stream.
+"""
+
+import logging
+from collections import defaultdict
+from collections.abc import Iterable
+from datetime import date, timedelta
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Click
+from .redis_client import get_redis
+from .rollups import day_bucket
+
+logger = logging.getLogger(__name__)
+
+REDIS_PREFIX = 'uv:'
+# Standard error of Redis HyperLogLog counts (16384 registers)
+STANDARD_ERROR = 0.0081
+
+
+def visitor_key(link_id: int, day: date) -> str:
+    return f'{REDIS_PREFIX}{link_id}:{day:%Y%m%d}'
+
+
+def add_visitors(clicks: Iterable[Click]) -> None:
+    """Add the IPs of stored clicks to the sketches of their link and day."""
+    client = get_redis()
+    if client is None:
+        return
+    ips = defaultdict(set)
+    for click in clicks:
+        ips[visitor_key(click.link_id, day_bucket(click.clicked_at).date())].add(click.ip)
+    if not ips:
+        return
+    timeout = settings.UNIQUE_VISITOR_DAYS * 24 * 60 * 60
+    try:
+        with client.pipeline(transaction=False) as pipe:
+            for key, values in ips.items():
+                pipe.pfadd(key, *values)
+                pipe.expire(key, timeout)
+            pipe.execute()
+    except redis.RedisError:
+        # Clicks are already stored; only the estimate misses them
+        logger.warning('Failed to add unique visitors.', exc_info=True)
+
+
+def count_visitors(link_id: int, days: int = 30) -> dict | None:
+    """Return estimated unique visitors of today and the last `days` local days, or None without Redis."""
+    client = get_redis()
+    if client is None:
+        return None
+    today = timezone.localdate()
+    keys = [visitor_key(link_id, today - timedelta(days=i)) for i in range(min(days, settings.UNIQUE_VISITOR_DAYS))]
+    try:
+        with client.pipeline(transaction=False) as pipe:
+            pipe.pfcount(keys[0])
+            pipe.pfcount(*keys)  # Merges the days, so visitors of several days count once
+            today_count, range_count = pipe.execute()
+    except redis.RedisError:
+        logger.warning('Failed to count unique visitors.', exc_info=True)
+        return None
+    return {'today': today_count, 'range': range_count, 'days': len(keys), 'error_percent': STANDARD_ERROR * 100}
@@ -1,6 +1,7 @@
 import os
 
 from celery import Celery
+from celery.signals import task_postrun, task_prerun
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'url_shortener.settings')
@@ -17,3 +18,19 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
+
+
+# Hooked here rather than in shortener.metrics, which the redirect-only app loads. The module is
+# imported on the first task, as this one is loaded with the settings, before the apps are ready.
+@task_prerun.connect
+def _task_started(task_id=None, **kwargs):
+    from shortener import metrics
+
+    metrics.task_started(task_id)
+
+
+@task_postrun.connect
+def _task_finished(task_id=None, task=None, state=None, **kwargs):
+    from shortener import metrics
+
+    metrics.task_finished(task_id, task, state)
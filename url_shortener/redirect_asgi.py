@@ -0,0 +1,16 @@
+"""
+ASGI config of the redirect-only app, deployed as its own worker pool next to the full app.
+
+It serves `/<slug>/` redirects with `url_shortener.redirect_settings`, so workers start
+faster and hold less memory than with `url_shortener.asgi`. The proxy in front sends every
+other path (the site, accounts, admin, stats, metrics) to the full app.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+# Assigned rather than defaulted: deployments set DJANGO_SETTINGS_MODULE for the full app
+os.environ['DJANGO_SETTINGS_MODULE'] = 'url_shortener.redirect_settings'
+
+application = get_asgi_application()
@@ -0,0 +1,27 @@
+"""
+Settings of the redirect-only app served by `url_shortener.redirect_asgi`.
+
+Everything is inherited from `url_shortener.settings` (including local_settings), except
+the parts a slug redirect never uses: no admin, sessions, messages, static files or
+allauth apps, and only the middleware that applies to redirects.
+"""
+
+from .settings import *  # noqa: F403
+
+INSTALLED_APPS = [
+    # Needed by the models of `shortener`, which link to users
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'shortener',
+]
+
+MIDDLEWARE = [
+    'shortener.metrics.metrics_middleware',
+    'django.middleware.security.SecurityMiddleware',  # HTTPS redirect and HSTS
+    'django.middleware.common.CommonMiddleware',  # Appends the slash to '/<slug>'
+]
+
+ROOT_URLCONF = 'url_shortener.redirect_urls'
+
+# Redirects render no templates; 404s use Django's built-in page
+TEMPLATES = []
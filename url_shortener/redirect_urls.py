@@ -0,0 +1,13 @@
+"""
+URL configuration of the redirect-only app: just the slug redirect.
+
+Everything else is served by the full app (`url_shortener.urls`).
+"""
+
+from django.urls import path
+
+from shortener.redirects import redirect_url
+
+urlpatterns = [
+    path('<str:query_slug>/', redirect_url, name='redirect_url'),
+]
@@ -50,10 +50,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'shortener.metrics.metrics_middleware',  # First, so that it times the whole stack
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'shortener.routers.replica_pin_middleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -88,7 +90,20 @@ WSGI_APPLICATION = 'url_shortener.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 # setting for deployments, see details at https://render.com/docs/deploy-django
-DATABASES = {'default': dj_database_url.config(conn_max_age=600, ssl_require=True)}
+DATABASES = {'default': dj_database_url.config(ssl_require=True)}
+# Optional streaming replica for read-heavy paths, see shortener.routers
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = dj_database_url.parse(DATABASE_REPLICA_URL, ssl_require=True)
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+# PostgreSQL connections come from a pool per process and alias (psycopg 3). Persistent
+# connections (CONN_MAX_AGE) are per thread, which does not suit the threads of ASGI workers.
+DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 10))
+for database in DATABASES.values():
+    if database.get('ENGINE') == 'django.db.backends.postgresql':
+        database.setdefault('OPTIONS', {})['pool'] = {'min_size': 1, 'max_size': DATABASE_POOL_SIZE, 'timeout': 10}
+DATABASE_ROUTERS = ['shortener.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = 10  # Replica reads stay on the primary this long after a client writes
 
 
 # Password validation
@@ -177,9 +192,108 @@ CELERY_TASK_SOFT_TIME_LIMIT = 10
 CELERY_TASK_TIME_LIMIT = 20  # Redirects should be fast
 
 # Redis & Celery Configuration
-CELERY_BROKER_URL = os.environ.get('REDIS_URL')
+REDIS_URL = os.environ.get('REDIS_URL')
+CELERY_BROKER_URL = REDIS_URL
+REDIS_SOCKET_TIMEOUT = 1  # seconds, keep redirects from hanging on a slow Redis
+
+# Periodic tasks, run by `celery worker -B`
+CELERY_BEAT_SCHEDULE = {
+    'flush-clicks': {
+        'task': 'shortener.tasks.flush_clicks',
+        'schedule': int(os.environ.get('CLICK_FLUSH_INTERVAL', 5)),  # seconds
+    },
+    'refill-slug-pool': {
+        'task': 'shortener.tasks.refill_slug_pool',
+        'schedule': 60,
+    },
+    'maintain-clicks': {
+        'task': 'shortener.tasks.maintain_clicks',
+        'schedule': 60 * 60 * 24,
+    },
+    'purge-links': {
+        'task': 'shortener.tasks.purge_links',
+        'schedule': 60,
+    },
+    'rebuild-slug-filter': {
+        'task': 'shortener.tasks.rebuild_slug_filter',
+        'schedule': 60 * 10,  # Only rebuilds a missing or half-expired filter
+    },
+}
+
+
+# Slug lookup cache used by redirects, with a shared tier in Redis when REDIS_URL is set
+LINK_CACHE_ENABLED = True
+LINK_CACHE_TIMEOUT = 60 * 60 * 24  # Shared tier, entries are removed on delete
+LINK_CACHE_LOCAL_SIZE = 10_000  # ~1-2 MB per worker
+LINK_CACHE_LOCAL_TIMEOUT = 60  # Bounds staleness after a delete in another worker
+LINK_CACHE_REPLICA_TIMEOUT = 60  # Shared tier, for links read from a replica that may lag behind a delete
+SLUG_MISS_CACHE_SIZE = 10_000
+SLUG_MISS_CACHE_TIMEOUT = 30  # A slug created in another worker may 404 here for this long
+
+# Bloom filter of existing slugs in Redis, so scans for random slugs skip the database
+SLUG_FILTER_ENABLED = True
+SLUG_FILTER_CAPACITY = int(os.environ.get('SLUG_FILTER_CAPACITY', 1_000_000))  # ~1.2 MB at 1% errors
+SLUG_FILTER_ERROR_RATE = 0.01
+SLUG_FILTER_MAX_AGE = 60 * 60 * 24  # seconds; rebuilds drop slugs of deleted links
+SLUG_FILTER_BUILD_RETRY = 60  # seconds between build requests from a process while the filter is missing
+
+# Slug allocation: 'random', 'sequence' (PostgreSQL, collision-free) or 'pool'
+SLUG_ALLOCATOR = os.environ.get('SLUG_ALLOCATOR', 'random')
+# Keys the sequence permutation; must never change once sequence slugs are in use
+SLUG_PERMUTATION_KEY = os.environ.get('SLUG_PERMUTATION_KEY')
+SLUG_SEQUENCE_BLOCK = 100  # Must match INCREMENT BY of shortener_slug_seq
+SLUG_POOL_SIZE = 10_000
+
+# Deleted (and expired) links are hidden at once; their clicks are purged in the background
+LINK_PURGE_BATCH_SIZE = 5000  # Clicks per DELETE
+LINK_PURGE_TIME_BUDGET = 50  # seconds per run, below the one-minute schedule
+
+# Return a user's existing link when they shorten the same (normalized) URL again
+LINK_DEDUP = os.environ.get('LINK_DEDUP', '').lower() in ('1', 'true')
+
+# Bulk shortening (JSON or CSV upload)
+BULK_SHORTEN_MAX_URLS = 10_000
+BULK_SHORTEN_BATCH_SIZE = 1000  # Links per INSERT
+
+# Click ingestion: redirects append to a Redis stream drained in bulk by `flush_clicks`
+CLICK_STREAM = 'clicks'
+CLICK_CONSUMER_GROUP = 'click-writers'
+CLICK_BATCH_SIZE = int(os.environ.get('CLICK_BATCH_SIZE', 1000))
+CLICK_FLUSH_TIME_BUDGET = 5  # seconds, below CELERY_TASK_SOFT_TIME_LIMIT
+CLICK_CLAIM_IDLE = 60  # seconds before unacknowledged clicks are redelivered
+# Redirects queue clicks in memory; a thread appends them to the stream, or to a local spool
+# file while Redis is unavailable, replayed once it is back
+CLICK_QUEUE_SIZE = 10_000
+CLICK_QUEUE_FULL_POLICY = os.environ.get('CLICK_QUEUE_FULL_POLICY', 'spool')  # or 'drop'
+CLICK_PUBLISH_BATCH_SIZE = 500
+CLICK_RETRY_INTERVAL = 5  # seconds between attempts while Redis is unavailable
+CLICK_SPOOL_DIR = os.environ.get('CLICK_SPOOL_DIR', os.path.join(BASE_DIR, 'click-spool'))
+
+# Click storage: monthly partitions on PostgreSQL, raw clicks older than the retention
+# window are folded into daily rollups and dropped (0 keeps them forever)
+CLICK_PARTITIONS_AHEAD = 3  # months
+CLICK_RETENTION_MONTHS = int(os.environ.get('CLICK_RETENTION_MONTHS', 0))
+CLICK_PARTITION_LOCK_TIMEOUT = 5  # seconds to wait for the click table's lock when dropping a partition
+CLICK_EXPORT_CHUNK_SIZE = 2000  # Rows per cursor fetch and per streamed chunk of an export
+# Memory-mapped IP range table built by `build_ip_ranges`, adding countries and ASNs to clicks
+IP_RANGES_PATH = os.environ.get('IP_RANGES_PATH')
+
+# Leaderboards of today's and trending links in Redis
+LEADERBOARD_SIZE = 10
+LEADERBOARD_HALF_LIFE = 60 * 60 * 6  # seconds for a click's weight in trending scores to halve
+
+# Daily unique-visitor sketches in Redis (up to 12 KB per link and day)
+UNIQUE_VISITOR_DAYS = 90
+
+# Rate limits are shared through Redis when REDIS_URL is set (see shortener.ratelimit)
+RATELIMIT_FAIL_OPEN = True  # Keep redirects working while Redis is unavailable
+
+# Metrics served at /metrics, aggregated across processes in Redis when REDIS_URL is set
+METRICS_ENABLED = True
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Bearer token for the scraper; staff can always read
+METRICS_FLUSH_INTERVAL = 10  # seconds
 
 try:
-    from .local_settings import *
+    from .local_settings import *  # noqa: F403
 except ImportError:
     pass
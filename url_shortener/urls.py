@@ -18,8 +18,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 
+from shortener.views import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('allauth.urls')),
+    # No trailing slash: '/metrics/' would be the redirect of a 7-character slug
+    path('metrics', metrics, name='metrics'),
     path('', include('shortener.urls')),
 ]